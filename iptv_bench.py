@@ -0,0 +1,368 @@
+# iptv_bench.py
+# 离线基准测试：在本机启动模拟的 udpxy/Rozhuk 服务器群，驱动各检测阶段并统计耗时
+#
+# 用法：python iptv_bench.py --servers 40 --groups 12 --mode ts
+# 模拟服务器绑定在 127.0.N.1 上（Linux 整个 127/8 都指向本机），保证每台服务器的 /24 网段不同，
+# 限流器的行为与线上一致。服务器群运行在子进程中，统计到的CPU时间只包含检测端。
+import os
+import re
+import sys
+import json
+import time
+import random
+import struct
+import logging
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ================= 配置区域 =================
+DEFAULT_SERVERS = 40
+DEFAULT_GROUPS = 12
+STREAM_SECONDS = 15     # 每个连接最长推流时长
+TICK = 0.02             # 推流节拍（秒）
+# 服务器画像：名称 -> 参数；按权重分配到服务器群
+PROFILES = {
+    'healthy':    {'weight': 5, 'bitrate': 6_000_000},
+    'hd':         {'weight': 2, 'bitrate': 10_000_000},
+    'slow_start': {'weight': 1, 'bitrate': 6_000_000, 'startup_delay': 2.0},
+    'stalling':   {'weight': 1, 'bitrate': 6_000_000, 'stall_every': 1.5, 'stall_for': 1.5},
+    'dropping':   {'weight': 1, 'bitrate': 6_000_000, 'drop_after': 200 * 1024},
+    'low_rate':   {'weight': 1, 'bitrate': 600_000},
+    'dead':       {'weight': 1, 'bitrate': 0, 'dead': True},
+}
+DEAD_GROUP_RATIO = 0.1  # 正常服务器上随机失效的组播组比例
+# ============================================
+
+# ------------------ 模拟TS流 ------------------
+VIDEO_PID = 0x100
+PMT_PID = 0x1000
+
+def _crc32_mpeg(data):
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+            crc &= 0xFFFFFFFF
+    return crc
+
+def _section(table_id, body):
+    section = bytes([table_id, 0xB0 | ((len(body) + 4) >> 8), (len(body) + 4) & 0xFF]) + body
+    return b'\x00' + section + struct.pack('>I', _crc32_mpeg(section))
+
+def _packet(pid, cc, payload=b'', pusi=False, keyframe=False):
+    flags = (0x40 if pusi else 0x00) | (pid >> 8)
+    if keyframe:
+        # adaptation field 置 random_access_indicator，后面跟负载
+        header = bytes([0x47, flags, pid & 0xFF, 0x30 | cc, 1, 0x40])
+    else:
+        header = bytes([0x47, flags, pid & 0xFF, 0x10 | cc])
+    return (header + payload).ljust(188, b'\xff')[:188]
+
+PAT = _section(0x00, b'\x00\x01\xc1\x00\x00' + b'\x00\x01' + bytes([0xE0 | (PMT_PID >> 8), PMT_PID & 0xFF]))
+PMT = _section(0x02, b'\x00\x01\xc1\x00\x00'
+               + bytes([0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00])  # PCR PID
+               + bytes([0x1B, 0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00]))  # H.264
+VIDEO_PACKETS = [_packet(VIDEO_PID, cc, b'\x00' * 184) for cc in range(16)]
+KEY_PACKETS = [_packet(VIDEO_PID, cc, b'\x00' * 182, keyframe=True) for cc in range(16)]
+PAT_PACKET = _packet(0, 0, PAT, pusi=True)
+PMT_PACKET = _packet(PMT_PID, 0, PMT, pusi=True)
+
+def ts_packets():
+    """无限生成的TS包：每200个包插入PAT/PMT和一个关键帧"""
+    count = 0
+    while True:
+        if count % 200 == 0:
+            yield PAT_PACKET
+            yield PMT_PACKET
+            yield KEY_PACKETS[count % 16]
+        else:
+            yield VIDEO_PACKETS[count % 16]
+        count += 1
+
+# ------------------ 模拟服务器 ------------------
+class FleetHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        if self.path == '/stat':
+            return self._send_stat()
+        match = re.fullmatch(r'/rtp/(\d+\.\d+\.\d+\.\d+:\d+)', self.path)
+        profile = server.profile
+        with server.counter.get_lock():
+            server.counter.value += 1
+        if not match or profile.get('dead') or match.group(1) in server.dead_groups:
+            self.send_error(404)
+            return
+        group = match.group(1)
+        with server.lock:
+            server.active[group] = server.active.get(group, 0) + 1
+        try:
+            self._stream(profile)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.lock:
+                server.active[group] -= 1
+
+    def _send_stat(self):
+        server = self.server
+        with server.lock:
+            lines = [f"/udp/{group}\tclients: {count}\trate in: {server.profile['bitrate'] // 1000 if count else 0} kbps"
+                     for group, count in server.active.items()]
+        body = ("Server: msd_lite (bench)\n" + "\n".join(lines) + "\n").encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, profile):
+        time.sleep(profile.get('startup_delay', 0))
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp2t')
+        self.end_headers()
+        packets = ts_packets()
+        per_tick = max(1, int(profile['bitrate'] / 8 * TICK / 188))
+        stall_every = profile.get('stall_every')
+        drop_after = profile.get('drop_after')
+        start = last_stall = time.time()
+        sent = 0
+        while time.time() - start < STREAM_SECONDS:
+            chunk = b''.join(next(packets) for _ in range(per_tick))
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if drop_after and sent >= drop_after:
+                return  # 模拟服务器主动断开
+            now = time.time()
+            if stall_every and now - last_stall >= stall_every:
+                time.sleep(profile['stall_for'])
+                last_stall = time.time()
+            time.sleep(TICK)
+
+def _build_fleet(n_servers, groups, seed):
+    """按权重为每台服务器分配画像和失效组"""
+    rng = random.Random(seed)
+    names = [name for name, p in PROFILES.items() for _ in range(p['weight'])]
+    fleet = []
+    for i in range(n_servers):
+        profile = PROFILES[names[i % len(names)]]
+        dead_groups = {g for g in groups if rng.random() < DEAD_GROUP_RATIO}
+        fleet.append((f"127.0.{i + 1}.1", names[i % len(names)], profile, dead_groups))
+    return fleet
+
+def _run_fleet(fleet, counter, ready, stop):
+    """子进程：启动全部模拟服务器，直到收到停止信号"""
+    servers = []
+    ports = []
+    for host, _, profile, dead_groups in fleet:
+        httpd = ThreadingHTTPServer((host, 0), FleetHandler)
+        httpd.daemon_threads = True
+        httpd.profile = profile
+        httpd.dead_groups = dead_groups
+        httpd.counter = counter
+        httpd.lock = threading.Lock()
+        httpd.active = {}
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        ports.append(httpd.server_address[1])
+    ready.put(ports)
+    stop.wait()
+    for httpd in servers:
+        httpd.shutdown()
+
+class Fleet:
+    """在子进程中运行的模拟服务器群"""
+
+    def __init__(self, n_servers=DEFAULT_SERVERS, n_groups=DEFAULT_GROUPS, seed=0):
+        self.groups = [f"239.3.1.{i + 1}:8000" for i in range(n_groups)]
+        self.fleet = _build_fleet(n_servers, self.groups, seed)
+        self.counter = multiprocessing.Value('i', 0)
+        self.urls = []
+
+    def __enter__(self):
+        ready = multiprocessing.Queue()
+        self.stop = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+            target=_run_fleet, args=(self.fleet, self.counter, ready, self.stop), daemon=True)
+        self.process.start()
+        ports = ready.get(timeout=30)
+        self.urls = [f"http://{host}:{port}" for (host, _, _, _), port in zip(self.fleet, ports)]
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    @property
+    def probes(self):
+        return self.counter.value
+
+    def template(self):
+        """rtp/省份_运营商.txt 格式的频道模板"""
+        return "".join(f"CCTV-{i + 1}高清,rtp://{group}\n" for i, group in enumerate(self.groups))
+
+    def playlist_lines(self):
+        """每台服务器 × 每个频道展开后的播放列表行"""
+        return [f"CCTV-{i + 1}高清,{url}/rtp/{group}\n"
+                for url in self.urls for i, group in enumerate(self.groups)]
+
+# ------------------ 被测阶段 ------------------
+def bench_finder(fleet, mode, workdir):
+    """iptv_finder.process_province 的处理部分（出错时抛出），Quake搜索替换为模拟服务器列表"""
+    import iptv_finder
+    from iptv_cache import ProbeCache
+    os.makedirs(os.path.join(workdir, 'rtp'), exist_ok=True)
+    os.makedirs(os.path.join(workdir, 'playlist'), exist_ok=True)
+    with open(os.path.join(workdir, 'rtp', '基准_测试.txt'), 'w', encoding='utf-8') as f:
+        f.write(fleet.template())
+    iptv_finder.quake_search = lambda province, isp: set(fleet.urls)
+    iptv_finder.probe_cache = ProbeCache(os.path.join(workdir, 'finder_cache.json'))
+    iptv_finder.PROBE_MODE = mode
+    iptv_finder._process_province('基准_测试')
+    return _count_valid(os.path.join(workdir, 'playlist', '基准测试.txt'))
+
+class _ErrorRecorder(logging.Handler):
+    """记录ERROR及以上的日志，工具内部捕获的异常通过日志报告"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if record.exc_info and record.exc_info[1] is not None:
+            message += f"：{type(record.exc_info[1]).__name__}: {record.exc_info[1]}"
+        self.messages.append(message)
+
+def bench_tool(fleet, mode, workdir):
+    """IPTVApp._run_collection，跳过界面和Quake搜索；内部记录的错误作为阶段错误抛出"""
+    import iptv_tool
+    from iptv_cache import ProbeCache
+    app = iptv_tool.IPTVApp.__new__(iptv_tool.IPTVApp)
+    app.probe_mode = mode
+    app.config_dir = app.playlist_dir = workdir
+    app.probe_cache = ProbeCache(os.path.join(workdir, 'tool_cache.json'))
+    channels = [(f"CCTV-{i + 1}高清", f"rtp://{group}") for i, group in enumerate(fleet.groups)]
+    app._load_multicast_channels = lambda province, operator: channels
+    app._quake_search = lambda api_key, province, operator: list(fleet.urls)
+    app._show_error = app._show_success = lambda *args, **kwargs: None
+    app._enable_ui = lambda: None
+    recorder = _ErrorRecorder()
+    logging.getLogger().addHandler(recorder)
+    try:
+        app._run_collection('', '基准', '测试')
+    finally:
+        logging.getLogger().removeHandler(recorder)
+    if recorder.messages:
+        raise RuntimeError('; '.join(recorder.messages))
+    return _count_valid(os.path.join(workdir, '基准测试.txt'))
+
+def _multicast_module(mode, workdir):
+    """每次重新导入 组播py/组播综合.py，检测缓存和清单换成工作目录下的空文件"""
+    import importlib.util
+    from iptv_cache import ProbeCache
+    from iptv_manifest import Manifest
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '组播py', '组播综合.py')
+    spec = importlib.util.spec_from_file_location('组播综合', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.PROBE_MODE = mode
+    module.probe_cache = ProbeCache(os.path.join(workdir, 'multicast_cache.json'))
+    module.manifest = Manifest(os.path.join(workdir, 'multicast_manifest.json'))
+    return module
+
+def bench_playlist_stage(fleet, mode, workdir):
+    """组播综合.py 的 validate 阶段（validate_playlists）"""
+    module = _multicast_module(mode, workdir)
+    os.makedirs(os.path.join(workdir, 'playlist'), exist_ok=True)
+    validated = module.validate_playlists({'基准测试.txt': fleet.playlist_lines()})
+    return len(validated['基准测试.txt'])
+
+def bench_hotel_stage(fleet, mode, workdir):
+    """组播综合.py 的 hotel-check 阶段（hotel_check）"""
+    module = _multicast_module(mode, workdir)
+    return len(module.hotel_check(fleet.playlist_lines()))
+
+def _count_valid(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if ',' in line and 'genre' not in line)
+
+STAGES = {
+    'finder': bench_finder,
+    'tool': bench_tool,
+    'playlist': bench_playlist_stage,
+    'hotel': bench_hotel_stage,
+}
+
+def run_stage(name, fleet, mode):
+    """运行一个阶段并统计 探测次数、墙钟时间、每次探测的CPU时间"""
+    workdir = tempfile.mkdtemp(prefix=f"iptv_bench_{name}_")
+    cwd = os.getcwd()
+    probes_before = fleet.probes
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        os.chdir(workdir)
+        kept = STAGES[name](fleet, mode, workdir)
+        error = None
+    except Exception as e:
+        kept = 0
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    probes = fleet.probes - probes_before
+    return {
+        'stage': name,
+        'mode': mode,
+        'probes': probes,
+        'kept': kept,
+        'wall_s': round(wall, 3),
+        'probes_per_s': round(probes / wall, 2) if wall > 0 else 0.0,
+        'cpu_ms_per_probe': round(cpu * 1000 / probes, 2) if probes else 0.0,
+        'error': error,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="IPTV检测离线基准测试")
+    parser.add_argument('--servers', type=int, default=DEFAULT_SERVERS, help="模拟服务器数量（最多254）")
+    parser.add_argument('--groups', type=int, default=DEFAULT_GROUPS, help="每台服务器的组播组数量")
+    parser.add_argument('--mode', default='ts', help="检测方式：decode / ts / throughput")
+    parser.add_argument('--stages', default=','.join(STAGES), help="要运行的阶段，逗号分隔")
+    parser.add_argument('--seed', type=int, default=0, help="服务器画像分配的随机种子")
+    parser.add_argument('--json', help="把结果另存为JSON文件")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    with Fleet(min(args.servers, 254), args.groups, args.seed) as fleet:
+        print(f"模拟服务器 {len(fleet.urls)} 台，组播组 {len(fleet.groups)} 个，检测方式 {args.mode}")
+        for name in args.stages.split(','):
+            result = run_stage(name.strip(), fleet, args.mode)
+            results.append(result)
+            print(f"{result['stage']:<10} 探测 {result['probes']:>5} 次  保留 {result['kept']:>5}  "
+                  f"耗时 {result['wall_s']:>8.2f}s  {result['probes_per_s']:>8.2f} 次/s  "
+                  f"CPU {result['cpu_ms_per_probe']:>7.2f} ms/次"
+                  + (f"  错误: {result['error']}" if result['error'] else ""))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# iptv_cache.py
+# 跨进程持久化的缓存：检测结果（按 ip:port 及组播地址记录通过/失败和时间）与搜索接口响应
+import os
+import json
+import hashlib
+import time
+import threading
+from iptv_url import host_port
+
+# ================= 配置区域 =================
+# 运行时状态（检测缓存、搜索响应缓存、哈希清单、拼音缓存、播放列表索引）统一存放的目录，
+# 已加入 .gitignore，CI 中由 actions/cache 在两次运行之间保留
+STATE_DIR = os.environ.get('IPTV_STATE_DIR', '.iptv_state')
+PROBE_CACHE_FILE = os.environ.get('IPTV_PROBE_CACHE', os.path.join(STATE_DIR, 'probe_cache.json'))
+PROBE_OK_TTL = 6 * 3600      # 检测通过的结果保留6小时
+PROBE_FAIL_TTL = 1 * 3600    # 检测失败的结果保留1小时
+PROBE_CACHE_MAX = 50000      # 最多保留的条目数，超出按时间淘汰最旧的
+# ============================================
+
+def state_path(name):
+    """状态目录下的文件或目录路径"""
+    return os.path.join(STATE_DIR, name)
+
+def ensure_parent(path):
+    """创建文件所在的目录"""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+def load_json(path, default=None):
+    """读取JSON文件，文件不存在或损坏时返回 default"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def save_json_atomic(path, data, **options):
+    """先写临时文件再原子替换，中途出错不会留下写了一半的文件；options 传给 json.dump
+
+    临时文件名带线程号，多个线程同时写同一文件也不会互相覆盖临时文件。
+    """
+    ensure_parent(path)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, **options)
+    os.replace(tmp_path, path)
+
+def server_identity(url):
+    """从 http://ip:port/... 中取出 ip:port，省略的默认端口补全"""
+    return host_port(url)
+
+class ProbeCache:
+    """磁盘上的检测结果缓存，通过和失败分别使用不同的有效期
+
+    每条结果记录检测标准（iptv_probe.probe_criteria，如检测方式、帧数、超时），
+    查询时标准不同视为没有记录。
+    """
+
+    def __init__(self, path=PROBE_CACHE_FILE, ok_ttl=PROBE_OK_TTL,
+                 fail_ttl=PROBE_FAIL_TTL, max_entries=PROBE_CACHE_MAX, clock=time.time):
+        self.path = path
+        self.clock = clock  # 返回当前时间（秒），测试时可替换
+        self.ok_ttl = ok_ttl
+        self.fail_ttl = fail_ttl
+        self.max_entries = max_entries
+        self.entries = {}  # key -> [status, timestamp, criteria]
+        self.hits = 0
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key(url, mcast=None):
+        """服务器级别的键为 ip:port，组播级别为 ip:port/rtp/mcast"""
+        identity = server_identity(url)
+        return f"{identity}/rtp/{mcast}" if mcast else identity
+
+    def _expired(self, status, stamp, now):
+        ttl = self.ok_ttl if status == 'ok' else self.fail_ttl
+        return now - stamp > ttl
+
+    def load(self):
+        """读取缓存文件，文件不存在或损坏时从空缓存开始"""
+        data = load_json(self.path, {})
+        now = self.clock()
+        # 旧版本的条目没有检测标准，补为None，不会被带标准的查询命中
+        self.entries = {
+            key: [status, stamp, criteria] for key, (status, stamp, criteria, *_) in
+            ((key, entry + [None]) for key, entry in data.items())
+            if not self._expired(status, stamp, now)
+        }
+
+    def get(self, key, criteria=None):
+        """返回未过期且检测标准相同的 'ok'/'fail'，没有记录返回None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] != criteria:
+                return None
+            if self._expired(entry[0], entry[1], self.clock()):
+                del self.entries[key]
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, ok, criteria=None):
+        """记录一次检测结果，ok可以是布尔值或 'ok'/'fail'，criteria 为检测标准"""
+        status = ok if isinstance(ok, str) else ('ok' if ok else 'fail')
+        with self.lock:
+            self.entries[key] = [status, self.clock(), criteria]
+
+    def save(self):
+        """淘汰过期及超量条目后原子写回磁盘"""
+        now = self.clock()
+        with self.lock:
+            entries = {
+                key: entry for key, entry in self.entries.items()
+                if not self._expired(entry[0], entry[1], now)
+            }
+            if len(entries) > self.max_entries:
+                newest = sorted(entries.items(), key=lambda kv: kv[1][1], reverse=True)
+                entries = dict(newest[:self.max_entries])
+            self.entries = entries
+            save_json_atomic(self.path, entries, separators=(',', ':'))
+
+class ResponseCache:
+    """按请求参数缓存接口响应，每条响应一个JSON文件，超过ttl秒视为过期"""
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(json.dumps(key, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key):
+        """返回未过期的响应，没有返回None"""
+        entry = load_json(self._path(key))
+        if entry is None:
+            return None
+        if time.time() - entry.get('time', 0) > self.ttl:
+            return None
+        return entry.get('data')
+
+    def set(self, key, data):
+        """原子写入一条响应"""
+        save_json_atomic(self._path(key), {'time': time.time(), 'key': key, 'data': data})
+
+    def evict(self):
+        """删除过期的缓存文件"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,223 @@
+# iptv_catalog.py
+# 列式频道目录：频道名、规范频道名、服务器、组播地址、分类、检测状态分列存放在整数数组中，
+# 字符串统一驻留在字符串表里，同一服务器地址和同一组播路径在所有行之间只存一份
+# 按服务器和按频道建立索引，各阶段直接读写目录，不再反复拆分 "频道名,地址" 文本
+import re
+from array import array
+from iptv_url import host_port, canonical_url
+from iptv_playlist import CHANNEL, parse_line
+
+# 组播路径，如 /rtp/239.1.1.1:5000、/udp/239.1.1.1:5000
+MCAST_PATH_RE = re.compile(r'/(?:rtp|udp)/([\d.]+:\d+)')
+
+STATUS_UNKNOWN = -1
+STATUS_FAIL = 0
+STATUS_OK = 1
+
+class StringTable:
+    """字符串驻留表，0 号为空串"""
+
+    def __init__(self):
+        self.strings = ['']
+        self.ids = {'': 0}
+
+    def intern(self, text):
+        sid = self.ids.get(text)
+        if sid is None:
+            sid = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return sid
+
+    def __getitem__(self, sid):
+        return self.strings[sid]
+
+class ChannelCatalog:
+    """频道条目的列式存储
+
+    地址行拆成 频道名 / 服务器前缀（scheme://host:port）/ 路径 三列，还原时原样拼接；
+    分类头、空行等没有地址的行整行存放在路径列，服务器前缀为0。
+    """
+
+    COLUMNS = ('names', 'channels', 'prefixes', 'suffixes', 'hosts', 'mcasts', 'categories', 'status')
+
+    def __init__(self, strings=None, channel_index=None):
+        self.strings = strings if strings is not None else StringTable()
+        self.channel_index = channel_index
+        self.names = array('I')       # 频道名
+        self.channels = array('I')    # 规范频道名（频道ID）
+        self.prefixes = array('I')    # scheme://host:port，0 表示没有地址的行
+        self.suffixes = array('I')    # 地址中服务器之后的部分；无地址的行为整行文本
+        self.hosts = array('I')       # 规范的 host:port
+        self.mcasts = array('I')      # 组播地址
+        self.categories = array('I')  # 分类名
+        self.status = array('b')      # 检测状态
+        self._by_host = None
+        self._by_channel = None
+
+    def __len__(self):
+        return len(self.names)
+
+    # ---------------- 构建 ----------------
+    @classmethod
+    def from_lines(cls, lines, channel_index=None):
+        catalog = cls(channel_index=channel_index)
+        for line in lines:
+            catalog.add_line(line)
+        return catalog
+
+    def empty_like(self):
+        """共用字符串表的空目录"""
+        return ChannelCatalog(self.strings, self.channel_index)
+
+    def _append(self, name, channel, prefix, suffix, host, mcast, category=0, status=STATUS_UNKNOWN):
+        self.names.append(name)
+        self.channels.append(channel)
+        self.prefixes.append(prefix)
+        self.suffixes.append(suffix)
+        self.hosts.append(host)
+        self.mcasts.append(mcast)
+        self.categories.append(category)
+        self.status.append(status)
+        self._by_host = self._by_channel = None
+        return len(self.names) - 1
+
+    def add(self, name, url, category=''):
+        """添加一条 频道名,地址，返回行号"""
+        intern = self.strings.intern
+        start = url.find('://')
+        end = url.find('/', start + 3) if start != -1 else -1
+        prefix, suffix = (url[:end], url[end:]) if end != -1 else (url, '')
+        mcast = MCAST_PATH_RE.search(suffix)
+        channel = self.channel_index.canonical(name.strip()) if self.channel_index else name.strip()
+        return self._append(
+            intern(name), intern(channel), intern(prefix), intern(suffix),
+            intern(host_port(prefix)), intern(mcast.group(1)) if mcast else 0, intern(category),
+        )
+
+    def add_line(self, line):
+        """解析一行，没有地址的行（分类头、空行）整行存放"""
+        return self.add_entry(parse_line(line))
+
+    def add_entry(self, entry):
+        """添加 iptv_playlist 解析出的条目，返回行号"""
+        if entry.kind == CHANNEL:
+            return self.add(entry.name, entry.full_url)
+        text = entry.txt_line() or ''
+        name = text.partition(',')[0]
+        intern = self.strings.intern
+        return self._append(intern(name), intern(name.strip()), 0, intern(text), 0, 0)
+
+    def copy_row(self, other, row):
+        """从共用字符串表的另一个目录复制一行"""
+        return self._append(
+            other.names[row], other.channels[row], other.prefixes[row], other.suffixes[row],
+            other.hosts[row], other.mcasts[row], other.categories[row], other.status[row],
+        )
+
+    def select(self, rows):
+        """按给定顺序取出若干行组成新目录"""
+        catalog = self.empty_like()
+        for row in rows:
+            catalog.copy_row(self, row)
+        return catalog
+
+    # ---------------- 读取 ----------------
+    def has_url(self, row):
+        return self.prefixes[row] != 0
+
+    def name(self, row):
+        return self.strings[self.names[row]]
+
+    def channel(self, row):
+        return self.strings[self.channels[row]]
+
+    def url(self, row):
+        """地址，没有地址的行返回空串"""
+        if not self.prefixes[row]:
+            return ''
+        return self.strings[self.prefixes[row]] + self.strings[self.suffixes[row]]
+
+    def host(self, row):
+        return self.strings[self.hosts[row]]
+
+    def mcast(self, row):
+        return self.strings[self.mcasts[row]]
+
+    def category(self, row):
+        return self.strings[self.categories[row]]
+
+    def fields(self, row):
+        """(频道名, 频道名之后的内容)，与按第一个逗号拆分原行的结果一致"""
+        if self.prefixes[row]:
+            return self.name(row), self.url(row)
+        name, _, rest = self.strings[self.suffixes[row]].partition(',')
+        return name, rest
+
+    def probe_fields(self, row):
+        """供 validate_lines 使用的 (频道名, 地址)，没有地址的行返回None"""
+        if not self.prefixes[row]:
+            return None
+        return self.name(row).strip(), self.url(row).strip()
+
+    def dedup_key(self, row):
+        """去重键：地址行为 频道ID,规范化地址，同一频道的不同写法视为重复；其他行为去掉首尾空白的原行"""
+        if self.prefixes[row]:
+            return f"{self.channel(row)},{canonical_url(self.url(row))}"
+        return self.strings[self.suffixes[row]].strip()
+
+    def line(self, row):
+        """还原为文本行"""
+        if self.prefixes[row]:
+            return f"{self.name(row)},{self.url(row)}\n"
+        return self.strings[self.suffixes[row]] + '\n'
+
+    def lines(self, rows=None):
+        return [self.line(row) for row in (range(len(self)) if rows is None else rows)]
+
+    def save_index(self, path):
+        """编译为内存映射的二进制索引（iptv_index）"""
+        from iptv_index import compile_catalog  # iptv_index 依赖本模块，用到时才导入
+        return compile_catalog(self, path)
+
+    # ---------------- 写入 ----------------
+    def set_category(self, row, category):
+        self.categories[row] = self.strings.intern(category)
+
+    def set_status(self, row, ok):
+        self.status[row] = STATUS_OK if ok else STATUS_FAIL
+
+    # ---------------- 索引 ----------------
+    def _index(self, column):
+        index = {}
+        for row, value in enumerate(column):
+            if value:
+                index.setdefault(value, array('I')).append(row)
+        return index
+
+    def rows_by_host(self, host):
+        """该服务器（host:port）的所有行"""
+        if self._by_host is None:
+            self._by_host = self._index(self.hosts)
+        sid = self.strings.ids.get(host)
+        return list(self._by_host.get(sid, ())) if sid else []
+
+    def rows_by_channel(self, channel):
+        """该规范频道名的所有行"""
+        if self._by_channel is None:
+            self._by_channel = self._index(self.channels)
+        sid = self.strings.ids.get(channel)
+        return list(self._by_channel.get(sid, ())) if sid else []
+
+    def host_names(self):
+        """出现过的所有服务器"""
+        if self._by_host is None:
+            self._by_host = self._index(self.hosts)
+        return [self.strings[sid] for sid in self._by_host]
+
+def as_catalog(records, channel_index=None):
+    """阶段输入可能是目录，也可能是从保留目录读回的索引（iptv_index.PlaylistIndex）或行列表"""
+    if isinstance(records, ChannelCatalog):
+        return records
+    if hasattr(records, 'to_catalog'):
+        return records.to_catalog(channel_index)
+    return ChannelCatalog.from_lines(records, channel_index)
@@ -0,0 +1,124 @@
+# iptv_channels.py
+# 频道名规范化：CCTV1、CCTV-1高清、CCTV1 综合 归为 CCTV1，CCTV164K、CCTV16-4K 归为 CCTV16-4K
+# 从现有的 rtp/*.txt、itv.txt、iptv_list.txt 预先生成别名表，查询时直接查表
+# 用法：python iptv_channels.py  重新生成别名表
+import os
+import re
+import unicodedata
+from iptv_playlist import CHANNEL, parse_line, read_playlist
+from iptv_cache import load_json, save_json_atomic
+
+# ================= 配置区域 =================
+CHANNEL_ALIAS_FILE = os.environ.get('IPTV_CHANNEL_ALIASES', 'channel_aliases.json')
+ALIAS_SOURCES = ['rtp', 'itv.txt', 'iptv_list.txt']  # 生成别名表时读取的文件或目录
+# ============================================
+
+# 括号内的备注，如 (576i)、[1920*1080]、（备）、【CAVS】
+BRACKETS_RE = re.compile(r'[(\[（【][^)\]）】]*[)\]）】]')
+# 编码标记，如 -HEVC-AAC、H265
+CODEC_RE = re.compile(r'[-_ ]?(?:HEVC|H\.?26[45]|CAVS|AVS\+?|AAC)\b', re.IGNORECASE)
+# 清晰度后缀，长的在前
+QUALITY_SUFFIXES = ('超高清', '高清', '超清', '标清', '蓝光', 'FHD', 'UHD', 'HD', 'SD')
+# CCTV-4K、CCTV8K 这类超高清频道
+CCTV_UHD_RE = re.compile(r'^CCTV[-_ ]?([48]K)')
+# CCTV1、CCTV-5+、CCTV16-4K、CCTV164K
+CCTV_RE = re.compile(r'^CCTV[-_ ]?(\d{1,2})(\+)?(?:[-_ ]?([48]K))?')
+# CCTV编号之后可以省略的频道说明
+CCTV_DESCRIPTIONS = {
+    '综合', '财经', '综艺', '中文国际', '体育', '体育赛事', '电影', '国防军事', '军事', '电视剧',
+    '纪录', '科教', '戏曲', '社会与法', '新闻', '少儿', '音乐', '农业农村', '农业',
+}
+SEPARATORS = ' -_·'
+
+def _strip_quality(text, keep=1):
+    """去掉末尾的清晰度后缀和分隔符，至少保留keep个字符"""
+    text = text.strip(SEPARATORS)
+    changed = True
+    while changed:
+        changed = False
+        for suffix in QUALITY_SUFFIXES:
+            if text.upper().endswith(suffix) and len(text) - len(suffix) >= keep:
+                text = text[:-len(suffix)].strip(SEPARATORS)
+                changed = True
+    return text
+
+def canonical_name(name):
+    """频道名的规范形式，同时作为频道ID"""
+    text = unicodedata.normalize('NFKC', name).strip()
+    text = BRACKETS_RE.sub('', text)
+    text = CODEC_RE.sub('', text).strip()
+    if text[:4].upper() == 'CCTV':
+        text = 'CCTV' + text[4:]
+        match = CCTV_UHD_RE.match(text)
+        if match:
+            return f"CCTV-{match.group(1).upper()}"
+        match = CCTV_RE.match(text)
+        if match:
+            number, plus, uhd = match.groups()
+            base = f"CCTV{int(number)}{plus or ''}" + (f"-{uhd.upper()}" if uhd else '')
+            rest = _strip_quality(text[match.end():], keep=0)
+            if uhd is None and rest.upper() in ('4K', '8K'):
+                return f"{base}-{rest.upper()}"
+            if not rest or rest in CCTV_DESCRIPTIONS:
+                return base
+            return base + rest
+    stripped = _strip_quality(text)
+    # 4K高清、8K超清 这类名字去掉后缀后只剩清晰度，保留原名
+    if stripped.upper() in ('4K', '8K'):
+        return text
+    return stripped or name.strip()
+
+class ChannelIndex:
+    """原始频道名 -> 规范频道名 的别名表，未收录的名字计算后加入"""
+
+    def __init__(self, path=CHANNEL_ALIAS_FILE):
+        self.path = path
+        self.aliases = {}
+        self.load()
+
+    def load(self):
+        """读取别名表，文件不存在或损坏时从空表开始"""
+        if self.path:
+            self.aliases = load_json(self.path, {})
+
+    def save(self):
+        save_json_atomic(self.path, self.aliases, indent=0, sort_keys=True)
+
+    def canonical(self, name):
+        """规范频道名"""
+        channel = self.aliases.get(name)
+        if channel is None:
+            channel = self.aliases[name] = canonical_name(name)
+        return channel
+
+    def rename_line(self, line):
+        """把 频道名,地址 行中的频道名换成规范形式，分类头等没有地址的行原样返回"""
+        entry = parse_line(line)
+        if entry.kind != CHANNEL:
+            return line
+        entry.name = self.canonical(entry.name)
+        return entry.txt_line() + line[len(entry.text):]
+
+    def build(self, sources=ALIAS_SOURCES):
+        """从文件或目录下的 .txt 文件中收集频道名，生成别名表"""
+        for source in sources:
+            if os.path.isdir(source):
+                paths = [os.path.join(source, f) for f in sorted(os.listdir(source)) if f.endswith('.txt')]
+            elif os.path.isfile(source):
+                paths = [source]
+            else:
+                continue
+            for path in paths:
+                for entry in read_playlist(path, errors='ignore'):
+                    if entry.kind == CHANNEL:
+                        self.canonical(entry.name)
+        return self
+
+def main():
+    index = ChannelIndex(path=None).build()
+    index.path = CHANNEL_ALIAS_FILE
+    index.save()
+    print(f"收录 {len(index.aliases)} 个频道名，归并为 {len(set(index.aliases.values()))} 个频道 → {CHANNEL_ALIAS_FILE}")
+
+if __name__ == "__main__":
+    main()
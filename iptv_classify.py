@@ -0,0 +1,122 @@
+# iptv_classify.py
+# 频道分类：所有分类的关键词构建成一个 Aho-Corasick 自动机，每行只扫描一遍，
+# 分类数量增加时耗时仍只与输入长度成正比
+from collections import deque
+
+def genre_header(name):
+    """分类头，如 央视频道,#genre#"""
+    return f"{name},#genre#\n"
+
+class KeywordMatcher:
+    """多关键词匹配自动机，matches(text) 返回 text 中出现的所有关键词对应的值"""
+
+    def __init__(self):
+        self.goto = [{}]     # 状态 -> {字符: 下一状态}
+        self.fail = [0]
+        self.output = [set()]
+        self.built = False
+
+    def add(self, keyword, value):
+        if not keyword:
+            return
+        state = 0
+        for char in keyword:
+            nxt = self.goto[state].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(set())
+            state = nxt
+        self.output[state].add(value)
+        self.built = False
+
+    def build(self):
+        """按广度优先计算失败指针，并把失败状态的输出合并进来"""
+        queue = deque(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.output[nxt] |= self.output[self.fail[nxt]]
+        self.built = True
+
+    def matches(self, text):
+        if not self.built:
+            self.build()
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+class Classifier:
+    """按规则顺序（靠前的优先）把每行分到第一个命中的分类
+
+    rules 为 [(分类名, [关键词, ...]), ...]；包含 genre 的行不参与分类。
+    min_bytes 大于0时，分类头加上所有命中行不足该字节数的分类被丢弃，
+    其中的行改归下一个命中的分类；都没有命中的行归入 default（为None时丢弃）。
+    """
+
+    def __init__(self, rules, min_bytes=0, default=None):
+        self.names = [name for name, _ in rules]
+        self.min_bytes = min_bytes
+        self.default = default
+        self.matcher = KeywordMatcher()
+        for index, (_, keywords) in enumerate(rules):
+            for keyword in keywords:
+                self.matcher.add(keyword, index)
+        self.matcher.build()
+
+    def categories_of(self, text):
+        """命中的分类序号，按优先级排序"""
+        return sorted(self.matcher.matches(text))
+
+    def classify(self, lines, field=None, text=None):
+        """一次遍历完成分类，返回 {分类名: [行, ...]}，按规则顺序，空分类不出现
+
+        field(line) 为参与匹配的文本，默认整行；
+        lines 也可以是频道目录的行号，此时 text(row) 返回该行的文本
+        """
+        hits = []
+        candidate_bytes = [len(genre_header(name).encode('utf-8')) for name in self.names]
+        candidate_count = [0] * len(self.names)
+        for line in lines:
+            line_text = line if text is None else text(line)
+            if 'genre' in line_text:
+                continue
+            indices = self.categories_of(line_text if field is None else field(line))
+            hits.append((line, indices))
+            if self.min_bytes:
+                size = len(line_text.encode('utf-8'))
+                for index in indices:
+                    candidate_bytes[index] += size
+            for index in indices:
+                candidate_count[index] += 1
+
+        kept = [
+            candidate_count[index] > 0 and candidate_bytes[index] >= self.min_bytes
+            for index in range(len(self.names))
+        ]
+        result = {name: [] for name in self.names}
+        if self.default is not None:
+            result.setdefault(self.default, [])
+        for line, indices in hits:
+            index = next((i for i in indices if kept[i]), None)
+            if index is not None:
+                result[self.names[index]].append(line)
+            elif self.default is not None:
+                result[self.default].append(line)
+        return {name: lines for name, lines in result.items() if lines}
@@ -0,0 +1,67 @@
+# iptv_collate.py
+# 播放列表排序：CCTV频道按编号在前，其余按频道名的拼音排序
+# 拼音按频道名计算一次并缓存（有上限，可保存到磁盘），排序代价取决于不同频道名的数量而不是行数
+import os
+import re
+from collections import OrderedDict
+from iptv_cache import state_path, load_json, save_json_atomic
+
+# ================= 配置区域 =================
+PINYIN_CACHE_FILE = os.environ.get('IPTV_PINYIN_CACHE', state_path('pinyin_cache.json'))
+PINYIN_CACHE_MAX = 20000  # 最多缓存的频道名数量，超出淘汰最久未用的
+# ============================================
+
+FIRST_NUMBER_RE = re.compile(r'\d+')
+
+class PinyinCollator:
+    """频道名 -> 拼音元组 的缓存，以及基于它的排序键"""
+
+    def __init__(self, path=PINYIN_CACHE_FILE, max_entries=PINYIN_CACHE_MAX):
+        self.path = path
+        self.max_entries = max_entries
+        self.keys = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        """读取缓存文件，文件不存在或损坏时从空缓存开始"""
+        if not self.path:
+            return
+        data = load_json(self.path, {})
+        self.keys = OrderedDict((name, tuple(key)) for name, key in data.items())
+
+    def save(self):
+        if self.path:
+            save_json_atomic(self.path, self.keys, separators=(',', ':'))
+
+    def name_key(self, name):
+        """频道名的拼音元组"""
+        key = self.keys.get(name)
+        if key is not None:
+            self.hits += 1
+            self.keys.move_to_end(name)
+            return key
+        from pypinyin import lazy_pinyin
+        self.misses += 1
+        key = tuple(lazy_pinyin(name))
+        self.keys[name] = key
+        if len(self.keys) > self.max_entries:
+            self.keys.popitem(last=False)
+        return key
+
+    def sort_key(self, line):
+        """CCTV频道按第一个数字排在前，其余按频道名拼音、再按其后内容排序"""
+        name, _, rest = line.strip().partition(',')
+        return self.fields_key(name, rest)
+
+    def fields_key(self, name, rest):
+        """已拆分好的 频道名 和其后内容的排序键，与 sort_key 相同"""
+        name, rest = name.strip(), rest.strip()
+        if 'CCTV' in name or 'CCTV' in rest:
+            match = FIRST_NUMBER_RE.search(name) or FIRST_NUMBER_RE.search(rest)
+            return (False, int(match.group()) if match else float('inf'))
+        return (True, self.name_key(name), rest)
+
+    def sort(self, lines):
+        return sorted(lines, key=self.sort_key)
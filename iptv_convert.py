@@ -0,0 +1,41 @@
+# iptv_convert.py
+# 繁体转简体：全进程共用一个 OpenCC 实例，只转换频道名字段，
+# 纯ASCII文本直接跳过，转换过的频道名缓存起来重复使用
+import threading
+from functools import lru_cache
+
+# ================= 配置区域 =================
+T2S_CONFIG = 't2s'       # OpenCC 繁转简配置
+T2S_CACHE_MAX = 50000    # 缓存的频道名数量上限
+# ============================================
+
+_converter = None
+_converter_lock = threading.Lock()
+
+def get_converter():
+    """共用的 OpenCC 实例，第一次使用时才创建"""
+    global _converter
+    if _converter is None:
+        with _converter_lock:
+            if _converter is None:
+                from opencc import OpenCC
+                _converter = OpenCC(T2S_CONFIG)
+    return _converter
+
+@lru_cache(maxsize=T2S_CACHE_MAX)
+def _convert(text):
+    return get_converter().convert(text)
+
+def t2s(text):
+    """繁体转简体，纯ASCII文本不需要转换"""
+    if text.isascii():
+        return text
+    return _convert(text)
+
+def t2s_line(line):
+    """只转换 频道名,地址 中的频道名，没有逗号的行整行转换"""
+    name, sep, rest = line.partition(',')
+    return t2s(name) + sep + rest
+
+def t2s_lines(lines):
+    return [t2s_line(line) for line in lines]
@@ -1,197 +1,184 @@
 # iptv_finder_full.py
-import os
 import time
-import requests
-import json
-import cv2
-import re
+START_TIME = time.perf_counter()
+import os
 from tqdm import tqdm
 from datetime import datetime
-from opencc import OpenCC
+from iptv_probe import probe_ts, probe_throughput, probe_criteria, host_limiter, PROBE_MODE
+from iptv_cache import ProbeCache, state_path
+from iptv_search import build_search, QueryPlanner, SearchResult
+from iptv_manifest import Manifest
+from iptv_pipeline import Deduper
+from iptv_imports import import_report
+from iptv_classify import Classifier, genre_header
+from iptv_convert import t2s, t2s_line
+from iptv_channels import ChannelIndex
+from iptv_catalog import ChannelCatalog
+from iptv_playlist import CHANNEL, BLANK, read_playlist, expand_template, write_playlist
 
 # ================= 配置区域 =================
 QUAKE_API_KEY = "1111"  # 必须替换！
 QUAKE_PAGE_SIZE = 50
-MAX_RETRIES = 3
 TIMEOUT = 20
+SEARCH_BACKENDS = ["quake"]  # 可选 "quake"、"fofa"，多个后端的结果合并去重
+# 分类规则，按顺序匹配频道名，都未命中的归入其他频道
+CATEGORY_RULES = [
+    ("央视频道", ["CCTV", "央视", "中央"]),
+    ("卫视频道", ["卫视", "凤凰", "星空"]),
+    ("地方频道", ["台", "都市", "综合"]),
+]
+MANIFEST_FILE = state_path("finder_manifest.json")  # 记录模板哈希，未变化且未过期的省份跳过
+MAX_SERVERS_PER_CHANNEL = 0  # 每个频道最多写入的节点数，0为不限制
+FIRST_FRAME_TIMEOUT = 3.0  # decode模式下超过该时间仍读不到第一帧即判为无效（秒）
 # ============================================
 
-def quake_search(province, isp):
-    """执行360 Quake搜索"""
-    headers = {"X-QuakeToken": QUAKE_API_KEY, "Content-Type": "application/json"}
-    result_urls = set()
-    current_page = 0
-    
-    try:
-        while True:
-            query = {
-                "query": f'Rozhuk AND province:"{province}" AND isp:"{isp}"',
-                "start": current_page * QUAKE_PAGE_SIZE,
-                "size": QUAKE_PAGE_SIZE,
-                "include": ["ip", "port", "hostname"]
-            }
-
-            for attempt in range(MAX_RETRIES):
-                try:
-                    response = requests.post(
-                        "https://quake.360.net/api/v3/search/quake_service",
-                        headers=headers,
-                        json=query,
-                        timeout=TIMEOUT
-                    )
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    if data.get("code") != 0:
-                        print(f"API错误: {data.get('message')}")
-                        return result_urls
-                        
-                    for item in data.get("data", []):
-                        ip = item.get("ip")
-                        port = str(item.get("port", ""))
-                        if ip and port.isdigit():
-                            result_urls.add(f"http://{ip}:{port}")
-                    
-                    total = data.get("meta", {}).get("total", 0)
-                    if (current_page + 1) * QUAKE_PAGE_SIZE >= total:
-                        return result_urls
-                        
-                    current_page += 1
-                    time.sleep(1)
-                    break
-                    
-                except (requests.RequestException, json.JSONDecodeError) as e:
-                    print(f"请求失败（{attempt+1}/{MAX_RETRIES}）: {str(e)}")
-                    time.sleep(5)
-
-    except Exception as e:
-        print(f"搜索异常: {str(e)}")
-    
-    return result_urls
+# 跨运行共享的检测结果缓存
+probe_cache = ProbeCache()
+# check_stream 默认的检测标准（ts模式5秒，decode模式5秒内10帧），随结果写入缓存
+CHECK_CRITERIA = probe_criteria(PROBE_MODE, None if PROBE_MODE == 'ts' else 10, 5)
 
-def check_stream(url, mcast):
-    """视频流检测"""
+def quake_search(province, isp):
+    """通过搜索层（默认360 Quake）查找服务器，分页并发获取并缓存响应"""
+    search = build_search(SEARCH_BACKENDS, QUAKE_API_KEY, page_size=QUAKE_PAGE_SIZE, timeout=TIMEOUT)
+    urls = search.search_urls(province, isp)
+    search.evict()
+    return urls
+
+def check_stream(url, mcast, mode=None):
+    """视频流检测，mode为ts时只检查TS包结构不解码，throughput时按码率判断，默认取PROBE_MODE"""
+    mode = mode or PROBE_MODE
     stream_url = f"{url}/rtp/{mcast}"
-    cap = None
-    try:
-        cap = cv2.VideoCapture(stream_url)
-        start_time = time.time()
-        frame_count = 0
+    if mode == 'ts':
+        return probe_ts(stream_url, timeout=5)
+    if mode == 'throughput':
+        return probe_throughput(stream_url)
+    import cv2  # 仅解码模式需要OpenCV
+    with host_limiter.slot(stream_url):
+        cap = None
+        try:
+            cap = cv2.VideoCapture(stream_url)
+            if not cap.isOpened():
+                return False
+            start_time = time.time()
+            frame_count = 0
         
-        while (time.time() - start_time) < 5:
-            ret, _ = cap.read()
-            if ret:
-                frame_count += 1
-                if frame_count >= 10:
-                    return True
-        return False
-    except:
+            while (time.time() - start_time) < 5:
+                ret, _ = cap.read()
+                if ret:
+                    frame_count += 1
+                    if frame_count >= 10:
+                        return True
+                elif frame_count == 0 and (time.time() - start_time) > FIRST_FRAME_TIMEOUT:
+                    return False  # 迟迟读不到第一帧，判为无效
+            return False
+        except:
+            return False
+        finally:
+            if cap is not None:
+                cap.release()
+
+def process_province(province_isp, urls=None):
+    """处理单个省份，urls为查询计划预先取得的搜索结果，为None时单独搜索
+
+    搜索成功且找到有效节点时返回True；搜索失败、没有有效节点或出错时返回False。
+    """
+    try:
+        return _process_province(province_isp, urls)
+    except Exception as e:
+        print(f"处理异常: {str(e)}")
         return False
-    finally:
-        if cap is not None:
-            cap.release()
 
-def process_province(province_isp):
-    """处理单个省份"""
-    try:
-        province, isp = province_isp.split('_', 1)
-        print(f"\n{'='*30}\n处理: {province}{isp}\n{'='*30}")
-        
-        with open(f'rtp/{province_isp}.txt', 'r', encoding='utf-8') as f:
-            content = f.read()
-            mcast_match = re.search(r'rtp://(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+)', content)
-            if not mcast_match:
-                raise ValueError("未找到有效的组播地址")
-            mcast = mcast_match.group(1)
+def _process_province(province_isp, urls=None):
+    """process_province 的处理部分，出错时抛出异常"""
+    province, isp = province_isp.split('_', 1)
+    print(f"\n{'='*30}\n处理: {province}{isp}\n{'='*30}")
+
+    template = list(read_playlist(f'rtp/{province_isp}.txt'))
+    # 模板中第一个 rtp:// 频道的组播地址用于检测节点
+    mcast = next((entry.url.strip()[len('rtp://'):] for entry in template
+                  if entry.kind == CHANNEL and entry.url.startswith('rtp://')), None)
+    if not mcast:
+        raise ValueError("未找到有效的组播地址")
 
+    if urls is None:
         urls = quake_search(province, isp)
-        print(f"初始节点数: {len(urls)}")
-        
-        valid_urls = []
-        progress = tqdm(urls, desc="检测节点", unit="个", leave=False)
-        for url in progress:
-            if check_stream(url, mcast):
-                valid_urls.append(url)
-            progress.set_postfix(有效数=len(valid_urls))
+    if not isinstance(urls, SearchResult):
+        urls = SearchResult(urls)
+    print(f"初始节点数: {len(urls)}")
+
+    valid_urls = []
+    progress = tqdm(urls, desc="检测节点", unit="个", leave=False)
+    for url in progress:
+        cache_key = ProbeCache.key(url, mcast)
+        status = probe_cache.get(cache_key, CHECK_CRITERIA)
+        if status is None:
+            status = 'ok' if check_stream(url, mcast) else 'fail'
+            probe_cache.set(cache_key, status, CHECK_CRITERIA)
             time.sleep(0.2)
-
-        if valid_urls:
-            output_file = f"playlist/{province}{isp}.txt"
-            with open(f'rtp/{province_isp}.txt', 'r', encoding='utf-8') as src:
-                template = src.read()
-                with open(output_file, 'w', encoding='utf-8') as dst:
-                    for url in valid_urls:
-                        dst.write(template.replace("rtp://", f"{url}/rtp/") + "\n")
+        if status == 'ok':
+            valid_urls.append(url)
+        progress.set_postfix(有效数=len(valid_urls))
+    probe_cache.save()
+
+    if valid_urls:
+        output_file = f"playlist/{province}{isp}.txt"
+        # 模板按节点逐条展开写入；节点未变化时不重写，保持文件原样
+        entries = expand_template(template, sorted(valid_urls), MAX_SERVERS_PER_CHANNEL or None)
+        _, written = write_playlist(output_file, entries, if_changed=True)
+        if written:
             print(f"生成有效节点: {len(valid_urls)} → {output_file}")
         else:
-            print("未找到有效节点")
-
-    except Exception as e:
-        print(f"处理异常: {str(e)}")
+            print(f"有效节点未变化: {len(valid_urls)} → {output_file}")
+    else:
+        print("未找到有效节点")
+    if not urls.ok:
+        print(f"搜索后端失败: {', '.join(urls.failed)}，下次运行重新搜索")
+    return urls.ok and bool(valid_urls)
 
 def merge_results():
     """分类合并结果"""
     all_files = [f for f in os.listdir('playlist') if f.endswith('.txt')]
-    cc = OpenCC('t2s')
-    
-    # 构建分类字典
-    categories = {
-        "更新时间,#genre#": [datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
-        "央视频道,#genre#": [],
-        "卫视频道,#genre#": [],
-        "地方频道,#genre#": [],
-        "其他频道,#genre#": []
-    }
-
-    # 分类规则
-    cctv_pat = re.compile(r'CCTV|央视|中央')
-    ws_pat = re.compile(r'卫视|凤凰|星空')
-    local_pat = re.compile(r'台|都市|综合')
-
-    # 处理文件内容
+    classifier = Classifier(CATEGORY_RULES, default="其他频道")
+    channels = ChannelIndex()
+
+    # 处理文件内容，读入频道目录后按频道名一次匹配所有分类
+    catalog = ChannelCatalog(channel_index=channels)
     for file in all_files:
-        with open(f'playlist/{file}', 'r', encoding='utf-8') as f:
-            for line in cc.convert(f.read()).splitlines():
-                if '#genre#' in line or not line.strip():
-                    continue
-                
-                channel = line.split(',', 1)[0].strip()
-                
-                if cctv_pat.search(channel):
-                    categories["央视频道,#genre#"].append(line)
-                elif ws_pat.search(channel):
-                    categories["卫视频道,#genre#"].append(line)
-                elif local_pat.search(channel):
-                    categories["地方频道,#genre#"].append(line)
-                else:
-                    categories["其他频道,#genre#"].append(line)
-
-    # 去重处理
-    seen = set()
-    for cat in list(categories.keys())[1:]:  # 跳过更新时间
-        unique = []
-        for line in categories[cat]:
-            if line not in seen:
-                seen.add(line)
-                unique.append(line)
-        categories[cat] = unique
+        for entry in read_playlist(f'playlist/{file}'):
+            if entry.kind == CHANNEL:
+                # 频道名只转简体，规范频道名记在目录的频道列，用于分类和去重
+                entry.name = t2s(entry.name)
+                catalog.add_entry(entry)
+            elif entry.kind != BLANK:
+                catalog.add_line(t2s_line(entry.text))
+    categories = classifier.classify(range(len(catalog)), field=catalog.channel,
+                                     text=catalog.line)
+
+    # 去重处理，跨分类只记录每行的摘要
+    seen = Deduper()
+    for cat, rows in categories.items():
+        rows = [row for row in rows if seen.add(catalog.dedup_key(row))]
+        for row in rows:
+            catalog.set_category(row, cat)
+        categories[cat] = [catalog.line(row).rstrip('\n') for row in rows]
 
     # 生成最终文件
     with open('iptv_list.txt', 'w', encoding='utf-8') as f:
         # 写入头部信息
-        f.write(f"{list(categories.keys())[0]}\n")
-        f.write(f"{categories['更新时间,#genre#'][0]}\n\n")
-        
+        f.write(genre_header("更新时间"))
+        f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+
         # 写入各分类
-        for cat in list(categories.keys())[1:]:
-            if categories[cat]:
-                f.write(f"{cat}\n")
-                f.write("\n".join(categories[cat]))
+        for cat, cat_lines in categories.items():
+            if cat_lines:
+                f.write(genre_header(cat))
+                f.write("\n".join(cat_lines))
                 f.write("\n\n")
 
     print(f"\n合并完成！总频道数: {len(seen)} → iptv_list.txt")
 
 def main():
+    import_report(START_TIME)
     os.makedirs("rtp", exist_ok=True)
     os.makedirs("playlist", exist_ok=True)
     
@@ -208,8 +195,23 @@ def main():
     for idx, pi in enumerate(provinces_isps, 1):
         print(f"{idx}. {pi.replace('_', '')}")
 
-    for province_isp in provinces_isps:
-        process_province(province_isp)
+    # 模板未变且结果未过期的省份跳过，不重新搜索和检测
+    manifest = Manifest(MANIFEST_FILE)
+    stale = [pi for pi in provinces_isps if not manifest.is_fresh(f'rtp/{pi}.txt')]
+    print(f"需要更新 {len(stale)} 个，跳过未变化的 {len(provinces_isps) - len(stale)} 个")
+    if not stale:
+        return
+
+    # 同一省份的多个运营商合并为一次查询，先报告计划请求数再执行
+    search = build_search(SEARCH_BACKENDS, QUAKE_API_KEY, page_size=QUAKE_PAGE_SIZE, timeout=TIMEOUT)
+    pairs = [tuple(pi.split('_', 1)) for pi in stale]
+    found = QueryPlanner(search).run(pairs)
+
+    for province_isp, pair in zip(stale, pairs):
+        # 搜索失败或没有有效节点的省份不记入清单，下次运行重新搜索
+        if process_province(province_isp, found[pair]):
+            manifest.mark(f'rtp/{province_isp}.txt')
+            manifest.save()
         time.sleep(1)
 
     merge_results()
@@ -0,0 +1,17 @@
+# iptv_imports.py
+# 启动耗时报告：OpenCV、OpenCC、拼音等较重的依赖都在用到的阶段或检测模式里才导入，
+# 这里报告从脚本开始到就绪的用时，以及此时已经加载了哪些重量级依赖
+import sys
+import time
+
+# 导入较慢的第三方库
+HEAVY_MODULES = ['cv2', 'numpy', 'opencc', 'pypinyin', 'selenium', 'translate', 'bs4', 'tqdm', 'requests']
+
+def loaded_heavy_modules():
+    """已经加载的重量级依赖"""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+def import_report(start, log=print):
+    """start 为脚本开头记录的 time.perf_counter()；各模块的详细耗时可用 python -X importtime 查看"""
+    loaded = loaded_heavy_modules()
+    log(f"启动用时 {time.perf_counter() - start:.2f}s，已加载依赖：{', '.join(loaded) or '无'}")
@@ -0,0 +1,290 @@
+# iptv_index.py
+# 播放列表的二进制索引：把频道目录（iptv_catalog.ChannelCatalog）编译成一个文件，
+# 包含字符串表、各列数组、按规范频道名和按服务器排序的键，读取时内存映射，不解析文本
+# 用法：python iptv_index.py iptv_list.txt                 编译为 iptv_list.idx
+#       python iptv_index.py iptv_list.idx --channel CCTV1  查询频道
+#       python iptv_index.py iptv_list.idx --host 1.2.3.4:8080
+#       python iptv_index.py iptv_list.idx --export out.txt 导出为文本
+import os
+import sys
+import mmap
+import struct
+import argparse
+from array import array
+from iptv_cache import ensure_parent
+from iptv_catalog import ChannelCatalog
+from iptv_playlist import read_playlist
+
+# 文件布局（小端）：
+#   文件头   MAGIC、版本、字符串数、行数、频道键数、频道行号数、服务器键数、服务器行号数、字符串区字节数
+#   字符串偏移 (字符串数+1) × uint32
+#   各列     ChannelCatalog.COLUMNS 中除 status 外每列 行数 × uint32，status 列 行数 × int8（补齐到4字节）
+#   频道键   频道键数 × (字符串ID, 起始位置, 行数) uint32，按字符串的UTF-8字节排序
+#   频道行号 频道行号数 × uint32
+#   服务器键、服务器行号  同上
+#   字符串区 UTF-8 字节
+MAGIC = b'IPTVIDX\0'
+VERSION = 1
+HEADER = struct.Struct('<8s8I')
+UINT_COLUMNS = tuple(column for column in ChannelCatalog.COLUMNS if column != 'status')
+INDEX_SUFFIX = '.idx'
+# 各列和键表按本机字节序存取，大端机器上写出前、读取后各转换一次
+NATIVE_LITTLE = sys.byteorder == 'little'
+
+class IndexFormatError(ValueError):
+    """不是索引文件或版本不符"""
+
+def _pad(size):
+    return -size % 4
+
+def _little(values):
+    """uint32 数组的小端字节"""
+    if NATIVE_LITTLE:
+        return values.tobytes()
+    values = array('I', values)
+    values.byteswap()
+    return values.tobytes()
+
+def _sorted_keys(strings, column):
+    """某列的 (键数组, 行号数组)，键按字符串的UTF-8字节排序，每个键的行号保持原顺序"""
+    groups = {}
+    for row, sid in enumerate(column):
+        if sid:
+            groups.setdefault(sid, []).append(row)
+    keys, postings = array('I'), array('I')
+    for sid in sorted(groups, key=lambda sid: strings[sid].encode('utf-8')):
+        keys.extend((sid, len(postings), len(groups[sid])))
+        postings.extend(groups[sid])
+    return keys, postings
+
+def compile_catalog(catalog, path):
+    """把频道目录编译为索引文件（原子替换）"""
+    encoded = [text.encode('utf-8') for text in catalog.strings.strings]
+    offsets = array('I', [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    channel_keys, channel_rows = _sorted_keys(catalog.strings, catalog.channels)
+    host_keys, host_rows = _sorted_keys(catalog.strings, catalog.hosts)
+    n_rows = len(catalog)
+
+    ensure_parent(path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(encoded), n_rows, len(channel_keys) // 3, len(channel_rows),
+                            len(host_keys) // 3, len(host_rows), offsets[-1]))
+        f.write(_little(offsets))
+        for column in UINT_COLUMNS:
+            f.write(_little(getattr(catalog, column)))
+        f.write(catalog.status.tobytes() + b'\0' * _pad(n_rows))
+        for section in (channel_keys, channel_rows, host_keys, host_rows):
+            f.write(_little(section))
+        for data in encoded:
+            f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+def compile_playlist(source, path=None, channel_index=None):
+    """逐条读取播放列表文件并编译为索引，默认写到同名的 .idx 文件"""
+    catalog = ChannelCatalog(channel_index=channel_index)
+    for entry in read_playlist(source, errors='ignore'):
+        catalog.add_entry(entry)
+    return compile_catalog(catalog, path or os.path.splitext(source)[0] + INDEX_SUFFIX)
+
+class PlaylistIndex:
+    """内存映射的只读索引
+
+    各列和键表直接是映射内存上的视图（大端机器上转换为数组副本），打开时不读取整个文件；
+    按频道名、服务器查询时在排序的键表上二分查找。用完调用 close() 或使用 with。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            # 长度为0的文件无法映射
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise IndexFormatError(f"{path} 不是播放列表索引")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._map()
+        except Exception:
+            self.close()
+            raise
+
+    def _map(self):
+        view = self._view = memoryview(self._mmap)
+        if len(view) < HEADER.size:
+            raise IndexFormatError(f"{self.path} 不是播放列表索引")
+        magic, version, n_strings, n_rows, n_channel_keys, n_channel_rows, n_host_keys, n_host_rows, \
+            blob_size = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise IndexFormatError(f"{self.path} 不是播放列表索引或版本不符")
+        self.n_rows = n_rows
+        position = HEADER.size
+
+        def take(size, typecode='I'):
+            nonlocal position
+            section = view[position:position + size * (4 if typecode == 'I' else 1)].cast(typecode)
+            position += len(section) * section.itemsize
+            position += _pad(position)
+            if typecode == 'I' and not NATIVE_LITTLE:
+                values = array('I', section)
+                values.byteswap()
+                section.release()
+                return memoryview(values)
+            return section
+
+        self._offsets = take(n_strings + 1)
+        self.columns = {column: take(n_rows) for column in UINT_COLUMNS}
+        self.columns['status'] = take(n_rows, 'b')
+        self._channel_keys = take(n_channel_keys * 3)
+        self._channel_rows = take(n_channel_rows)
+        self._host_keys = take(n_host_keys * 3)
+        self._host_rows = take(n_host_rows)
+        self._blob = view[position:position + blob_size]
+        if len(self._blob) != blob_size:
+            raise IndexFormatError(f"{self.path} 已损坏")
+
+    def close(self):
+        """释放映射内存上的视图后关闭映射"""
+        for name in ('_offsets', '_channel_keys', '_channel_rows', '_host_keys', '_host_rows', '_blob'):
+            section = self.__dict__.pop(name, None)
+            if section is not None:
+                section.release()
+        for section in self.__dict__.pop('columns', {}).values():
+            section.release()
+        view = self.__dict__.pop('_view', None)
+        if view is not None:
+            view.release()
+        if not self._mmap.closed:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.n_rows
+
+    # ---------------- 读取 ----------------
+    def _bytes(self, sid):
+        return bytes(self._blob[self._offsets[sid]:self._offsets[sid + 1]])
+
+    def string(self, sid):
+        return self._bytes(sid).decode('utf-8')
+
+    def name(self, row):
+        return self.string(self.columns['names'][row])
+
+    def channel(self, row):
+        return self.string(self.columns['channels'][row])
+
+    def url(self, row):
+        prefix = self.columns['prefixes'][row]
+        if not prefix:
+            return ''
+        return self.string(prefix) + self.string(self.columns['suffixes'][row])
+
+    def host(self, row):
+        return self.string(self.columns['hosts'][row])
+
+    def mcast(self, row):
+        return self.string(self.columns['mcasts'][row])
+
+    def category(self, row):
+        return self.string(self.columns['categories'][row])
+
+    def line(self, row):
+        """还原为文本行，与 ChannelCatalog.line 相同"""
+        if self.columns['prefixes'][row]:
+            return f"{self.name(row)},{self.url(row)}\n"
+        return self.string(self.columns['suffixes'][row]) + '\n'
+
+    def lines(self, rows=None):
+        """逐行生成文本"""
+        for row in (range(self.n_rows) if rows is None else rows):
+            yield self.line(row)
+
+    # ---------------- 查询 ----------------
+    def _lookup(self, keys, postings, text):
+        target = text.encode('utf-8')
+        lo, hi = 0, len(keys) // 3
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(keys[mid * 3]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(keys) // 3 and self._bytes(keys[lo * 3]) == target:
+            start, count = keys[lo * 3 + 1], keys[lo * 3 + 2]
+            return postings[start:start + count].tolist()
+        return []
+
+    def rows_by_channel(self, channel):
+        """该规范频道名的所有行"""
+        return self._lookup(self._channel_keys, self._channel_rows, channel)
+
+    def rows_by_host(self, host):
+        """该服务器（host:port）的所有行"""
+        return self._lookup(self._host_keys, self._host_rows, host)
+
+    def channel_names(self):
+        """所有规范频道名，按排序"""
+        return [self.string(self._channel_keys[i]) for i in range(0, len(self._channel_keys), 3)]
+
+    def host_names(self):
+        """所有服务器，按排序"""
+        return [self.string(self._host_keys[i]) for i in range(0, len(self._host_keys), 3)]
+
+    # ---------------- 转换 ----------------
+    def to_catalog(self, channel_index=None):
+        """还原为可修改的频道目录，各列整块复制，不解析文本"""
+        catalog = ChannelCatalog(channel_index=channel_index)
+        strings = [self.string(sid) for sid in range(len(self._offsets) - 1)]
+        catalog.strings.strings = strings
+        catalog.strings.ids = {text: sid for sid, text in enumerate(strings)}
+        for column, section in self.columns.items():
+            getattr(catalog, column).frombytes(section.cast('B'))
+        return catalog
+
+    def export(self, path):
+        """导出为文本播放列表（原子替换）"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(self.lines())
+        os.replace(tmp_path, path)
+
+def open_index(source, path=None, channel_index=None):
+    """打开播放列表对应的索引，索引不存在或比播放列表旧时重新编译"""
+    path = path or os.path.splitext(source)[0] + INDEX_SUFFIX
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+        compile_playlist(source, path, channel_index)
+    return PlaylistIndex(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="编译、查询、导出播放列表索引")
+    parser.add_argument('path', help="播放列表（编译）或 .idx 索引文件（查询、导出）")
+    parser.add_argument('--output', help="编译输出的索引文件，默认同名 .idx")
+    parser.add_argument('--channel', help="查询规范频道名")
+    parser.add_argument('--host', help="查询服务器 host:port")
+    parser.add_argument('--export', help="把索引导出为文本播放列表")
+    args = parser.parse_args()
+
+    if not args.path.endswith(INDEX_SUFFIX):
+        from iptv_channels import ChannelIndex
+        path = compile_playlist(args.path, args.output, ChannelIndex())
+        with PlaylistIndex(path) as index:
+            print(f"{len(index)} 行，{len(index.channel_names())} 个频道，{len(index.host_names())} 个服务器 → {path}")
+        return
+    with PlaylistIndex(args.path) as index:
+        if args.channel:
+            print(''.join(index.lines(index.rows_by_channel(args.channel))), end='')
+        if args.host:
+            print(''.join(index.lines(index.rows_by_host(args.host))), end='')
+        if args.export:
+            index.export(args.export)
+            print(f"已导出 {len(index)} 行 → {args.export}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# iptv_manifest.py
+# 输入文件的内容哈希清单：记录每个文件上次处理时的哈希和时间，
+# 模板未变且结果未过期的省份不再重新搜索和检测，未变化的输出文件不重写
+import os
+import hashlib
+import time
+from iptv_cache import state_path, load_json, save_json_atomic
+
+# ================= 配置区域 =================
+MANIFEST_FILE = os.environ.get('IPTV_MANIFEST', state_path('iptv_manifest.json'))
+MANIFEST_TTL = int(os.environ.get('IPTV_MANIFEST_TTL', 12 * 3600))  # 超过该时间的结果视为过期，0 表示每次都全量处理
+# ============================================
+
+def content_hash(data):
+    """文本或字节内容的 sha1"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+def file_hash(path):
+    """文件内容的 sha1，文件不存在返回None"""
+    try:
+        with open(path, 'rb') as f:
+            return content_hash(f.read())
+    except OSError:
+        return None
+
+def write_if_changed(path, text):
+    """内容不同时才写入文件，返回是否写入；未变化的文件保持原样，修改时间也不变"""
+    data = text.encode('utf-8')
+    if file_hash(path) == content_hash(data):
+        return False
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+class Manifest:
+    """文件路径 -> {'hash': 内容哈希, 'time': 上次处理时间}"""
+
+    def __init__(self, path=MANIFEST_FILE, ttl=MANIFEST_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """读取清单文件，文件不存在或损坏时从空清单开始"""
+        self.entries = load_json(self.path, {})
+
+    def is_fresh(self, name, digest=None):
+        """name 上次处理后内容未变且未过期；digest 为空时按文件 name 的当前内容计算"""
+        entry = self.entries.get(name)
+        if entry is None or self.ttl <= 0:
+            return False
+        if digest is None:
+            digest = file_hash(name)
+        return entry['hash'] == digest and time.time() - entry['time'] <= self.ttl
+
+    def mark(self, name, digest=None):
+        """记录 name 已处理"""
+        if digest is None:
+            digest = file_hash(name)
+        self.entries[name] = {'hash': digest, 'time': time.time()}
+
+    def save(self):
+        save_json_atomic(self.path, self.entries, indent=1, sort_keys=True)
@@ -0,0 +1,164 @@
+# iptv_pipeline.py
+# 分阶段的内存流水线：各阶段之间直接传递数据，不再经过临时文件
+# 需要时可保留每个阶段的输出，之后单独运行或重跑某个阶段；每个阶段单独计时
+import os
+import time
+import hashlib
+
+class PipelineError(Exception):
+    """流水线阶段缺少输入或名称错误"""
+
+def text_lines(text):
+    """与 readlines() 相同的切分方式，只按换行符切分并保留换行符"""
+    parts = text.split('\n')
+    lines = [part + '\n' for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+class Deduper:
+    """保持顺序的流式去重，只记录每个键的8字节摘要，内存不随行的长度增长
+
+    同一个实例可以依次用于多个文件，实现跨文件去重
+    """
+
+    def __init__(self):
+        self.seen = set()
+
+    def __len__(self):
+        return len(self.seen)
+
+    @staticmethod
+    def digest(key):
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+
+    def add(self, key):
+        """第一次出现返回True"""
+        digest = self.digest(key)
+        if digest in self.seen:
+            return False
+        self.seen.add(digest)
+        return True
+
+    def filter(self, lines, key=None):
+        """逐行产出第一次出现的行，key(line) 为去重依据，默认整行"""
+        for line in lines:
+            if self.add(line if key is None else key(line)):
+                yield line
+
+class Pipeline:
+    """按注册顺序执行的阶段列表，上一阶段的返回值作为下一阶段的输入
+
+    阶段的数据为行列表、{文件名: 行列表} 的字典（按文件分组的播放列表），
+    或提供 lines() 的对象（如 iptv_catalog.ChannelCatalog），保留时按行写出。
+    keep_dir 不为空时把每个阶段的输出写到该目录，行列表写为 阶段名.txt，
+    字典写为 阶段名/ 目录下的同名文件，频道目录另写 阶段名.idx 索引；
+    单独运行某个阶段时从这里读取上一阶段的输出，有索引时直接映射索引。
+    """
+
+    def __init__(self, keep_dir=None, log=print):
+        self.keep_dir = keep_dir
+        self.log = log
+        self.stages = []   # [(name, func)]
+        self.timings = {}  # name -> 秒
+
+    def stage(self, name):
+        """装饰器：注册一个阶段，func(records) 返回下一阶段的输入"""
+        def register(func):
+            if name in self.names:
+                raise PipelineError(f"阶段名重复：{name}")
+            self.stages.append((name, func))
+            return func
+        return register
+
+    @property
+    def names(self):
+        return [name for name, _ in self.stages]
+
+    def _keep_path(self, name):
+        return os.path.join(self.keep_dir, name)
+
+    def save(self, name, records):
+        """保留阶段输出"""
+        if self.keep_dir is None or records is None:
+            return
+        os.makedirs(self.keep_dir, exist_ok=True)
+        path = self._keep_path(name)
+        if isinstance(records, dict):
+            os.makedirs(path, exist_ok=True)
+            for filename, lines in records.items():
+                with open(os.path.join(path, filename), 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+        else:
+            if hasattr(records, 'save_index'):
+                # 频道目录另存一份二进制索引，单独运行后续阶段时直接映射读取
+                records.save_index(f"{path}.idx")
+            if not isinstance(records, list):
+                records = records.lines()
+            with open(f"{path}.txt", 'w', encoding='utf-8') as f:
+                f.writelines(records)
+
+    def load(self, name):
+        """读取保留的阶段输出，没有保留时抛出 PipelineError
+
+        索引返回打开的 PlaylistIndex，由调用方关闭（run 在阶段结束后关闭）。
+        """
+        if self.keep_dir is not None:
+            path = self._keep_path(name)
+            if os.path.isdir(path):
+                records = {}
+                for filename in sorted(os.listdir(path)):
+                    with open(os.path.join(path, filename), 'r', encoding='utf-8') as f:
+                        records[filename] = f.readlines()
+                return records
+            if os.path.isfile(f"{path}.idx"):
+                from iptv_index import PlaylistIndex  # iptv_index 依赖本模块，用到时才导入
+                return PlaylistIndex(f"{path}.idx")
+            if os.path.isfile(f"{path}.txt"):
+                with open(f"{path}.txt", 'r', encoding='utf-8') as f:
+                    return f.readlines()
+        raise PipelineError(f"阶段 {name} 的输出没有保留，请先带保留目录运行该阶段")
+
+    def run(self, only=None):
+        """执行全部阶段，或只执行 only 中列出的阶段（按注册顺序）
+
+        跳过的阶段之后的第一个阶段从保留目录读取上一阶段的输出。
+        返回最后一个阶段的输出。
+        """
+        names = self.names
+        selected = set(only) if only else set(names)
+        unknown = selected - set(names)
+        if unknown:
+            raise PipelineError(f"未知的阶段：{', '.join(sorted(unknown))}，可选：{', '.join(names)}")
+
+        records = None
+        previous = None
+        ran_previous = True
+        for name, func in self.stages:
+            if name not in selected:
+                previous, ran_previous = name, False
+                continue
+            loaded = None
+            if not ran_previous:
+                records = loaded = self.load(previous)
+            start = time.perf_counter()
+            try:
+                records = func(records)
+                if records is loaded and hasattr(loaded, 'to_catalog'):
+                    records = loaded.to_catalog()  # 原样返回的索引复制为目录，之后关闭映射
+            finally:
+                # 从保留目录映射的索引在该阶段结束后关闭
+                if hasattr(loaded, 'close'):
+                    loaded.close()
+            self.timings[name] = time.perf_counter() - start
+            self.log(f"阶段 {name} 完成，用时 {self.timings[name]:.2f}s")
+            self.save(name, records)
+            previous, ran_previous = name, True
+        return records
+
+    def report(self):
+        """打印各阶段用时"""
+        total = sum(self.timings.values())
+        for name, seconds in self.timings.items():
+            self.log(f"{name:<12} {seconds:8.2f}s")
+        self.log(f"{'total':<12} {total:8.2f}s")
@@ -0,0 +1,305 @@
+# iptv_playlist.py
+# 播放列表读写：txt（频道名,地址 / 分类名,#genre# / Host= 这类头部设置）和 M3U（#EXTINF 属性）两种格式
+# 读取时逐行生成条目，写出时逐条序列化，文件多大都不整体读入内存；
+# 各工具拆分 频道名,地址 行统一经过这里
+# 组播模板按服务器展开也在这里，逐条生成直接交给写出
+import os
+import re
+import filecmp
+from itertools import chain
+from iptv_url import host_port
+
+# 条目类型
+CHANNEL = 'channel'  # 频道名,地址
+GENRE = 'genre'      # 分类名,#genre#
+HEADER = 'header'    # Host=...、Decoder=3、#EXTM3U x-tvg-url="..."
+BLANK = 'blank'      # 空行
+OTHER = 'other'      # 注释、更新时间等其他行，原样保留
+
+GENRE_MARK = '#genre#'
+# txt 头部设置，如 Host=cache.ott.*.itv.cmvideo.cn=39.135.132.221
+HEADER_RE = re.compile(r'^([A-Za-z][\w-]*)=(.*)$')
+# M3U 属性，如 tvg-name="CCTV1" group-title="央视" catchup-source="?stime=${(b)yyyyMMddHHmmss}"，
+# 个别文件的属性值没有引号，如 tvg-name=浙江卫视
+ATTR_RE = re.compile(r'([\w-]+)=(?:"([^"]*)"|(\S+))')
+M3U_EXTENSIONS = ('.m3u', '.m3u8')
+
+class Entry:
+    """播放列表中的一项
+
+    频道条目的地址不含 $ 之后的备注（txt 格式，如 $4M-bestzb），备注单独放在 tag，
+    没有备注时 tag 为None；group 为所属分类（txt 的 #genre# 或 M3U 的 group-title）；
+    attrs 为 M3U 属性或 txt 头部设置；text 为原行（不含换行符），非频道行按原行写回。
+    """
+
+    __slots__ = ('kind', 'name', 'url', 'tag', 'group', 'attrs', 'duration', 'options', 'text', 'lineno')
+
+    def __init__(self, kind, name='', url='', tag=None, group='', attrs=None, duration='-1',
+                 options=None, text='', lineno=0):
+        self.kind = kind
+        self.name = name
+        self.url = url
+        self.tag = tag
+        self.group = group
+        self.attrs = attrs if attrs is not None else {}
+        self.duration = duration
+        self.options = options if options is not None else []
+        self.text = text
+        self.lineno = lineno
+
+    def __repr__(self):
+        return f"Entry({self.kind!r}, {self.name!r}, {self.full_url!r})"
+
+    @property
+    def full_url(self):
+        """带备注的地址"""
+        return self.url if self.tag is None else f"{self.url}${self.tag}"
+
+    def txt_line(self):
+        """txt 格式的一行（不含换行符），M3U 独有的条目返回None"""
+        if self.kind == CHANNEL:
+            return f"{self.name},{self.full_url}"
+        if self.kind == GENRE:
+            return self.text or f"{self.name},{GENRE_MARK}"
+        if self.kind == HEADER:
+            if self.text.startswith('#'):
+                return None
+            return self.text or '\n'.join(f"{key}={value}" for key, value in self.attrs.items())
+        return self.text
+
+def channel(name, url, group=''):
+    """新建频道条目，地址中 $ 之后的备注拆到 tag"""
+    url, sep, tag = url.partition('$')
+    return Entry(CHANNEL, name, url, tag if sep else None, group)
+
+def parse_line(line, group='', lineno=0):
+    """解析 txt 格式的一行"""
+    text = line.rstrip('\r\n')
+    name, sep, rest = text.partition(',')
+    if sep and rest.strip() == GENRE_MARK:
+        return Entry(GENRE, name.strip(), group=name.strip(), text=text, lineno=lineno)
+    if sep and '://' in rest:
+        entry = channel(name, rest, group)
+        entry.text, entry.lineno = text, lineno
+        return entry
+    if not text.strip():
+        return Entry(BLANK, group=group, text=text, lineno=lineno)
+    match = None if sep else HEADER_RE.match(text)
+    if match:
+        return Entry(HEADER, match.group(1), attrs={match.group(1): match.group(2)}, text=text, lineno=lineno)
+    return Entry(OTHER, group=group, text=text, lineno=lineno)
+
+def split_line(line):
+    """频道行去掉首尾空白的 (频道名, 带备注的地址)，其他行返回None"""
+    entry = parse_line(line)
+    if entry.kind != CHANNEL:
+        return None
+    return entry.name.strip(), entry.full_url.strip()
+
+def iter_txt(lines):
+    """逐行解析 txt 格式，频道条目的 group 为前面最近的分类名"""
+    group = ''
+    for lineno, line in enumerate(lines, 1):
+        entry = parse_line(line, group, lineno)
+        if entry.kind == GENRE:
+            group = entry.name
+        yield entry
+
+def _attrs(text):
+    return {key: quoted or bare for key, quoted, bare in ATTR_RE.findall(text)}
+
+def _split_extinf(body):
+    """#EXTINF: 之后的内容拆为 (时长, 属性文本, 标题)，标题从引号外的第一个逗号之后开始"""
+    quoted = False
+    for i, char in enumerate(body):
+        if char == '"':
+            quoted = not quoted
+        elif char == ',' and not quoted:
+            info, title = body[:i], body[i + 1:]
+            break
+    else:
+        info, title = body, ''
+    duration, _, attrs = info.strip().partition(' ')
+    return duration or '-1', attrs, title.strip()
+
+def iter_m3u(lines):
+    """逐行解析 M3U 格式，#EXTINF 与其后的地址行合为一个频道条目"""
+    pending = None
+    group = ''
+    for lineno, line in enumerate(lines, 1):
+        text = line.rstrip('\r\n')
+        stripped = text.strip()
+        if lineno == 1:
+            stripped = stripped.lstrip('\ufeff')
+        if stripped.startswith('#EXTM3U'):
+            yield Entry(HEADER, 'EXTM3U', attrs=_attrs(stripped[len('#EXTM3U'):]), text=stripped, lineno=lineno)
+        elif stripped.startswith('#EXTINF:'):
+            if pending is not None:
+                yield Entry(OTHER, text=pending.text, lineno=pending.lineno)
+            duration, attrs, title = _split_extinf(stripped[len('#EXTINF:'):])
+            attrs = _attrs(attrs)
+            pending = Entry(CHANNEL, title, group=attrs.get('group-title', group), attrs=attrs,
+                            duration=duration, text=text, lineno=lineno)
+        elif stripped.startswith('#EXTGRP:'):
+            group = stripped[len('#EXTGRP:'):].strip()
+            if pending is not None and 'group-title' not in pending.attrs:
+                pending.group = group
+        elif stripped.startswith('#'):
+            if pending is not None:
+                pending.options.append(stripped)
+            else:
+                yield Entry(OTHER, text=text, lineno=lineno)
+        elif not stripped:
+            if pending is None:
+                yield Entry(BLANK, lineno=lineno)
+        elif pending is not None:
+            pending.url = stripped
+            yield pending
+            pending = None
+        elif '://' in stripped:
+            yield Entry(CHANNEL, url=stripped, group=group, text=text, lineno=lineno)
+        else:
+            yield Entry(OTHER, text=text, lineno=lineno)
+    if pending is not None:
+        yield Entry(OTHER, text=pending.text, lineno=pending.lineno)
+
+def iter_entries(lines, fmt=None):
+    """解析行序列，fmt 为None时按第一个非空行判断格式（#EXT 开头为 M3U）"""
+    lines = iter(lines)
+    if fmt is None:
+        head = []
+        for line in lines:
+            head.append(line)
+            if line.strip():
+                break
+        fmt = 'm3u' if head and head[-1].strip().lstrip('\ufeff').startswith('#EXT') else 'txt'
+        lines = chain(head, lines)
+    return iter_m3u(lines) if fmt == 'm3u' else iter_txt(lines)
+
+def read_playlist(path, fmt=None, errors='strict'):
+    """逐条读取播放列表文件，读完后关闭文件"""
+    with open(path, 'r', encoding='utf-8-sig', errors=errors) as f:
+        yield from iter_entries(f, fmt)
+
+def format_txt(entries):
+    """序列化为 txt 格式的行，频道的分类与前面的分类头不同时补写分类头"""
+    group = ''
+    for entry in entries:
+        if entry.kind == GENRE:
+            group = entry.name
+        elif entry.kind == CHANNEL and entry.group and entry.group != group:
+            group = entry.group
+            yield f"{group},{GENRE_MARK}\n"
+        line = entry.txt_line()
+        if line is not None:
+            yield line + '\n'
+
+def format_m3u(entries, header='#EXTM3U'):
+    """序列化为 M3U 格式的行；分类头并入其后频道的 group-title，txt 头部设置不写出"""
+    started = False
+    for entry in entries:
+        if not started:
+            started = True
+            if entry.kind == HEADER and entry.text.startswith('#EXTM3U'):
+                yield entry.text + '\n'
+                continue
+            yield header + '\n'
+        if entry.kind == CHANNEL:
+            attrs = dict(entry.attrs)
+            if entry.group and 'group-title' not in attrs:
+                attrs['group-title'] = entry.group
+            info = ''.join(f' {key}="{value}"' for key, value in attrs.items())
+            yield f"#EXTINF:{entry.duration}{info},{entry.name.strip()}\n"
+            for option in entry.options:
+                yield option + '\n'
+            yield entry.full_url.strip() + '\n'
+        elif entry.kind == BLANK:
+            yield '\n'
+        elif entry.kind == OTHER and entry.text.startswith('#'):
+            yield entry.text + '\n'
+    if not started:
+        yield header + '\n'
+
+def expand_template(template, servers, max_servers=None, channel=None):
+    """把组播模板按服务器展开为 服务器/rtp/组播地址 的频道条目，逐条生成
+
+    按服务器依次按模板顺序展开；同一服务器（按 host:port）和同一频道（频道名加组播地址）只展开一次，
+    展开结果不会重复，不需要再按整行去重，占用的内存只与服务器数和模板条目数成正比。
+    max_servers 限制同名频道最多展开的服务器数；模板中分类头、非 rtp:// 地址等其他条目
+    只在展开第一个服务器时按原位置生成一次，展开的频道保留所属分类。
+    channel(name) 为频道ID（如 iptv_channels.ChannelIndex.canonical），去重和计数按频道ID，
+    写出的仍是模板中的原频道名；默认按去掉首尾空白的频道名。
+    """
+    channel = channel or str.strip
+    items = []  # (条目, 频道ID)，非 rtp:// 条目的频道ID为None
+    seen = set()
+    for entry in template:
+        if entry.kind == CHANNEL and entry.url.startswith('rtp://'):
+            key = (channel(entry.name.strip()), entry.url.strip())
+            if key in seen:
+                continue
+            seen.add(key)
+            items.append((entry, key[0]))
+        else:
+            items.append((entry, None))
+
+    used = {}  # 频道ID -> (已展开的服务器数, 最近一个服务器的序号)
+    seen_servers = set()
+    for server in servers:
+        server = server.rstrip('/')
+        host = host_port(server)
+        if host in seen_servers:
+            continue
+        index = len(seen_servers)
+        seen_servers.add(host)
+        for entry, name in items:
+            if name is None:
+                if index == 0:
+                    yield entry
+                continue
+            count, last = used.get(name, (0, -1))
+            if last != index:
+                if max_servers is not None and count >= max_servers:
+                    continue
+                used[name] = (count + 1, index)
+            mcast = entry.url.strip()[len('rtp://'):]
+            yield Entry(CHANNEL, entry.name, f"{server}/rtp/{mcast}", entry.tag, entry.group,
+                        entry.attrs, entry.duration, entry.options)
+
+def write_playlist(path, entries, fmt=None, if_changed=False):
+    """逐条写出播放列表（原子替换），fmt 为None时按扩展名判断
+
+    if_changed 为真时内容与原文件相同则不替换，原文件修改时间不变。
+    返回 (写出的频道数, 是否替换了文件)。
+    """
+    if fmt is None:
+        fmt = 'm3u' if path.lower().endswith(M3U_EXTENSIONS) else 'txt'
+    count = 0
+
+    def counted(entries):
+        nonlocal count
+        for entry in entries:
+            if entry.kind == CHANNEL:
+                count += 1
+            yield entry
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines((format_m3u if fmt == 'm3u' else format_txt)(counted(entries)))
+    if if_changed and os.path.isfile(path) and filecmp.cmp(tmp_path, path, shallow=False):
+        os.remove(tmp_path)
+        return count, False
+    os.replace(tmp_path, path)
+    return count, True
+
+def append_playlist(path, entries):
+    """逐条追加到 txt 播放列表末尾，不在内存中拼出全部行；原文件最后一行缺少换行时先补上"""
+    newline = False
+    if os.path.isfile(path) and os.path.getsize(path):
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            newline = f.read(1) != b'\n'
+    with open(path, 'a', encoding='utf-8') as f:
+        if newline:
+            f.write('\n')
+        f.writelines(format_txt(entries))
@@ -0,0 +1,425 @@
+# iptv_probe.py
+# 组播/酒店源有效性检测的公共实现，供 组播综合.py、iptv_finder.py、iptv_tool.py 共用
+import os
+import re
+import time
+import threading
+import requests
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from iptv_playlist import split_line
+
+# ================= 配置区域 =================
+PROBE_WORKERS = int(os.environ.get('IPTV_PROBE_WORKERS', 32))  # 同时进行的检测数
+PER_HOST_LIMIT = int(os.environ.get('IPTV_PER_HOST_LIMIT', 2))     # 同一 ip:port 同时进行的检测数
+PER_SUBNET_LIMIT = int(os.environ.get('IPTV_PER_SUBNET_LIMIT', 4)) # 同一 /24 网段同时进行的检测数
+# decode: OpenCV解码帧  ts: 只检查TS包结构  throughput: 按码率/首字节时间/卡顿判断
+PROBE_MODE = os.environ.get('IPTV_PROBE_MODE', 'decode')
+TS_PROBE_BYTES = 256 * 1024  # TS模式最多读取的字节数
+TS_MIN_VIDEO_PACKETS = 50    # 视频PID连续计数正常的最少包数
+QUALITY_WINDOW = 5           # 吞吐量测量时长（秒）
+MAX_TTFB = 3.0               # 首字节最长等待（秒）
+STALL_GAP = 0.5              # 两次收到数据间隔超过该值记为一次卡顿（秒）
+MAX_STALL = 1.0              # 允许的最长单次卡顿（秒）
+ADAPTIVE_PROBE = os.environ.get('IPTV_ADAPTIVE_PROBE', '1') != '0'  # 结果已定（卡顿超限）时提前结束测量
+# 按前段码率提前判定通过/失败，结果可能与测满窗口不同，默认关闭
+EARLY_BY_BITRATE = os.environ.get('IPTV_EARLY_BY_BITRATE', '0') == '1'
+EARLY_DECISION_AFTER = 1.0   # 首字节后至少观察多久才按码率提前判定（秒）
+EARLY_PASS_MARGIN = 1.5      # 码率达到下限的倍数且已见关键帧时提前判为通过
+EARLY_FAIL_MARGIN = 0.3      # 码率不足下限的该倍数时提前判为失败
+# 各清晰度的最低持续码率（bit/s）
+BITRATE_FLOORS = {
+    'SD': 1_500_000,
+    'HD': 4_000_000,
+    '4K': 15_000_000,
+}
+# ============================================
+
+PROBE_MODES = ('decode', 'ts', 'throughput')
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+# PMT中的视频流类型：MPEG-1/2、MPEG-4、H.264、H.265、AVS、AVS+
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x24, 0x42, 0xD2, 0xEA}
+
+class HostLimiter:
+    """按 ip:port 和 /24 网段限制并发，全局并发可以很高而单台服务器负载有限"""
+
+    def __init__(self, per_host=PER_HOST_LIMIT, per_subnet=PER_SUBNET_LIMIT):
+        self.per_host = per_host
+        self.per_subnet = per_subnet
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def keys(url):
+        """返回 (网段键, 主机键)，非IPv4地址以主机名作为网段"""
+        host = url.split('://', 1)[-1].split('/', 1)[0]
+        ip = host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+        match = re.fullmatch(r'(\d{1,3}\.\d{1,3}\.\d{1,3})\.\d{1,3}', ip)
+        subnet = f"{match.group(1)}.0/24" if match else ip
+        return subnet, host
+
+    def _semaphore(self, key, limit):
+        with self.lock:
+            sem = self.semaphores.get(key)
+            if sem is None:
+                sem = self.semaphores[key] = threading.BoundedSemaphore(limit)
+            return sem
+
+    @contextmanager
+    def slot(self, url):
+        """占用该地址所在网段和主机的各一个名额，先网段后主机以避免死锁"""
+        subnet, host = self.keys(url)
+        subnet_sem = self._semaphore(('subnet', subnet), self.per_subnet)
+        host_sem = self._semaphore(('host', host), self.per_host)
+        with subnet_sem:
+            with host_sem:
+                yield
+
+# 所有检测路径共用的限流器
+host_limiter = HostLimiter()
+
+def probe_frames(url, min_frames=30, timeout=3):
+    """在timeout秒内读取到min_frames帧即视为有效"""
+    import cv2  # 仅解码模式需要OpenCV
+    with host_limiter.slot(url):
+        cap = cv2.VideoCapture(url)
+        try:
+            if not cap.isOpened():
+                return False  # 打不开的流无需等待
+            start_time = time.time()
+            frame_count = 0
+            while (time.time() - start_time) < timeout:
+                ret, _ = cap.read()
+                if not ret:
+                    break
+                frame_count += 1
+                if frame_count >= min_frames:
+                    return True
+            return False
+        finally:
+            cap.release()
+
+class TSAnalyzer:
+    """增量解析MPEG-TS：同步字节、PAT/PMT、视频PID的连续计数器"""
+
+    def __init__(self, min_video_packets=TS_MIN_VIDEO_PACKETS):
+        self.min_video_packets = min_video_packets
+        self.buffer = bytearray()
+        self.synced = False
+        self.packets = 0
+        self.sync_errors = 0
+        self.pmt_pids = set()
+        self.video_pid = None
+        self.has_pat = False
+        self.has_pmt = False
+        self.last_cc = None
+        self.cc_ok = 0
+        self.cc_errors = 0
+        self.keyframes = 0
+
+    @property
+    def ok(self):
+        """PAT/PMT齐全且视频PID连续计数基本递增"""
+        return (self.has_pat and self.has_pmt and self.video_pid is not None
+                and self.cc_ok >= self.min_video_packets
+                and self.cc_errors * 10 <= self.cc_ok)
+
+    def feed(self, data):
+        """送入一段数据，解析其中完整的TS包"""
+        self.buffer.extend(data)
+        pos = 0
+        buf = self.buffer
+        while len(buf) - pos >= TS_PACKET_SIZE:
+            if not self.synced or buf[pos] != TS_SYNC_BYTE:
+                if self.synced:
+                    self.sync_errors += 1
+                    self.synced = False
+                offset = self._find_sync(buf, pos)
+                if offset is None:
+                    # 保留末尾不足三个包的数据等待下一段
+                    pos = max(pos, len(buf) - 3 * TS_PACKET_SIZE)
+                    break
+                pos = offset
+                self.synced = True
+            self._parse_packet(buf, pos)
+            pos += TS_PACKET_SIZE
+        del buf[:pos]
+
+    @staticmethod
+    def _find_sync(buf, start):
+        """连续三个包头都是0x47才认为找到同步位置"""
+        end = len(buf) - 2 * TS_PACKET_SIZE
+        for i in range(start, end):
+            if (buf[i] == TS_SYNC_BYTE and buf[i + TS_PACKET_SIZE] == TS_SYNC_BYTE
+                    and buf[i + 2 * TS_PACKET_SIZE] == TS_SYNC_BYTE):
+                return i
+        return None
+
+    def _parse_packet(self, buf, pos):
+        self.packets += 1
+        if buf[pos + 1] & 0x80:  # transport_error_indicator
+            return
+        pusi = buf[pos + 1] & 0x40
+        pid = ((buf[pos + 1] & 0x1F) << 8) | buf[pos + 2]
+        afc = (buf[pos + 3] >> 4) & 0x03
+        cc = buf[pos + 3] & 0x0F
+        if not afc & 0x01:  # 无负载
+            return
+        payload = pos + 4
+        if afc & 0x02:
+            payload += 1 + buf[pos + 4]
+        end = pos + TS_PACKET_SIZE
+        if payload >= end:
+            return
+
+        if pid == self.video_pid:
+            self._check_cc(cc)
+            # adaptation field 中的 random_access_indicator 标记关键帧
+            if afc & 0x02 and buf[pos + 4] > 0 and buf[pos + 5] & 0x40:
+                self.keyframes += 1
+        elif pusi and (pid == 0 or pid in self.pmt_pids):
+            section = payload + 1 + buf[payload]  # pointer_field
+            if section + 3 <= end:
+                self._parse_section(bytes(buf[section:end]), pid)
+
+    def _check_cc(self, cc):
+        if self.last_cc is not None:
+            if cc == (self.last_cc + 1) & 0x0F:
+                self.cc_ok += 1
+            elif cc != self.last_cc:  # 相同计数为允许的重复包
+                self.cc_errors += 1
+        self.last_cc = cc
+
+    def _parse_section(self, sec, pid):
+        table_id = sec[0]
+        length = ((sec[1] & 0x0F) << 8) | sec[2]
+        body_end = min(3 + length - 4, len(sec))  # 去掉CRC32
+        if pid == 0 and table_id == 0x00:
+            self.has_pat = True
+            for i in range(8, body_end - 3, 4):
+                program = (sec[i] << 8) | sec[i + 1]
+                if program != 0:  # 0为NIT
+                    self.pmt_pids.add(((sec[i + 2] & 0x1F) << 8) | sec[i + 3])
+        elif table_id == 0x02 and len(sec) >= 12:
+            self.has_pmt = True
+            i = 12 + (((sec[10] & 0x0F) << 8) | sec[11])
+            while i + 5 <= body_end:
+                stream_type = sec[i]
+                es_pid = ((sec[i + 1] & 0x1F) << 8) | sec[i + 2]
+                if stream_type in VIDEO_STREAM_TYPES and self.video_pid is None:
+                    self.video_pid = es_pid
+                i += 5 + (((sec[i + 3] & 0x0F) << 8) | sec[i + 4])
+
+def probe_ts(url, max_bytes=TS_PROBE_BYTES, timeout=5, cancel=None):
+    """不解码，只读取前max_bytes字节检查TS结构，cancel（threading.Event）置位时提前放弃"""
+    analyzer = TSAnalyzer()
+    try:
+        with host_limiter.slot(url), requests.get(url, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                return False
+            start_time = time.time()
+            received = 0
+            for chunk in response.iter_content(chunk_size=16 * 1024):
+                analyzer.feed(chunk)
+                received += len(chunk)
+                if analyzer.ok:
+                    return True
+                if received >= max_bytes or (time.time() - start_time) > timeout:
+                    break
+                if cancel is not None and cancel.is_set():
+                    return False
+    except requests.RequestException:
+        return False
+    return analyzer.ok
+
+class StreamStats:
+    """一次吞吐量测量的结果"""
+
+    def __init__(self):
+        self.status_code = None
+        self.ttfb = None      # 首字节时间（秒）
+        self.bytes = 0        # 首字节之后收到的字节数
+        self.duration = 0.0   # 首字节之后的测量时长（秒）
+        self.stalls = []      # 每次卡顿的时长（秒）
+        self.keyframe = False # 是否已在TS中见到关键帧
+        self.verdict = None   # 提前判定的结果，None表示测满了整个窗口
+
+    @property
+    def bitrate(self):
+        """持续码率（bit/s）"""
+        return self.bytes * 8 / self.duration if self.duration > 0 else 0.0
+
+    @property
+    def max_stall(self):
+        return max(self.stalls, default=0.0)
+
+    def __repr__(self):
+        return (f"StreamStats(ttfb={self.ttfb}, bitrate={self.bitrate:.0f}, "
+                f"stalls={len(self.stalls)}, max_stall={self.max_stall:.2f})")
+
+def early_verdict(stats, elapsed, floor, by_bitrate=EARLY_BY_BITRATE):
+    """根据已有证据判断结果是否已经明确，明确返回True/False，否则返回None
+
+    默认只在结论不可能再改变时（已有超限的卡顿）判为失败；
+    by_bitrate 为真时还按前段码率提前判定，属于估计，可能与测满窗口的结果不同。
+    """
+    if stats.max_stall > MAX_STALL:
+        return False  # 卡顿只会变长，结论已定
+    if not by_bitrate or elapsed < EARLY_DECISION_AFTER:
+        return None
+    bitrate = stats.bytes * 8 / elapsed
+    if bitrate < floor * EARLY_FAIL_MARGIN:
+        return False
+    if bitrate >= floor * EARLY_PASS_MARGIN and stats.keyframe and not stats.stalls:
+        return True
+    return None
+
+def measure_stream(url, duration=QUALITY_WINDOW, stall_gap=STALL_GAP, floor=None):
+    """读取duration秒的数据，记录首字节时间、持续码率和卡顿区间
+
+    传入floor（码率下限）时按 early_verdict 在结论已定时提前结束。
+    """
+    stats = StreamStats()
+    analyzer = TSAnalyzer() if floor is not None else None
+    with host_limiter.slot(url):
+        return _measure(url, stats, analyzer, duration, stall_gap, floor)
+
+def _measure(url, stats, analyzer, duration, stall_gap, floor):
+    """measure_stream 的测量部分，调用方已占用限流名额"""
+    start_time = time.time()
+    first = last = None
+    try:
+        # 读超时取 MAX_TTFB：首字节晚于 MAX_TTFB、或中途间隔超过 MAX_TTFB（大于 MAX_STALL）都已注定失败，不必等满窗口
+        with requests.get(url, stream=True, timeout=(MAX_TTFB, MAX_TTFB)) as response:
+            stats.status_code = response.status_code
+            if response.status_code != 200:
+                return stats
+            for chunk in response.iter_content(chunk_size=4096):
+                now = time.time()
+                if first is None:
+                    stats.ttfb = now - start_time
+                    first = now
+                else:
+                    if now - last > stall_gap:
+                        stats.stalls.append(now - last)
+                    stats.bytes += len(chunk)
+                last = now
+                if now - first >= duration:
+                    break
+                if analyzer is not None:
+                    if not stats.keyframe:
+                        analyzer.feed(chunk)
+                        stats.keyframe = analyzer.keyframes > 0
+                    stats.verdict = early_verdict(stats, now - first, floor)
+                    if stats.verdict is not None:
+                        break
+    except requests.RequestException:
+        # 读超时说明流中断，中断时长计为一次卡顿
+        if last is not None:
+            stats.stalls.append(time.time() - last)
+    if first is not None:
+        stats.duration = time.time() - first
+    return stats
+
+def channel_class(channel_name):
+    """按频道名判断清晰度档位：4K/HD/SD"""
+    if re.search(r'4K|8K', channel_name, re.IGNORECASE):
+        return '4K'
+    if re.search(r'高清|超清|HD|1080', channel_name, re.IGNORECASE):
+        return 'HD'
+    return 'SD'
+
+def quality_ok(stats, channel_name=''):
+    """首字节及时、码率达到该档位下限且没有长时间卡顿"""
+    if stats.ttfb is None or stats.ttfb > MAX_TTFB:
+        return False
+    return (stats.bitrate >= BITRATE_FLOORS[channel_class(channel_name)]
+            and stats.max_stall <= MAX_STALL)
+
+def probe_throughput(url, channel_name='', duration=QUALITY_WINDOW, adaptive=ADAPTIVE_PROBE):
+    """按吞吐量判断流是否流畅，代替解码计帧"""
+    floor = BITRATE_FLOORS[channel_class(channel_name)] if adaptive else None
+    stats = measure_stream(url, duration, floor=floor)
+    if stats.verdict is not None:
+        return stats.verdict
+    return quality_ok(stats, channel_name)
+
+def probe_criteria(mode, min_frames=None, timeout=None):
+    """检测标准的标识，如 decode/30/3，随结果写入检测缓存，标准不同的历史结果不复用"""
+    if mode == 'throughput':
+        return f"throughput/{'early' if EARLY_BY_BITRATE else 'full'}"
+    return '/'.join(str(part) for part in (mode, min_frames, timeout) if part is not None)
+
+def make_probe(mode=PROBE_MODE, min_frames=30, timeout=3):
+    """按检测方式生成 probe(url, channel_name) 函数，decode模式沿用计帧标准
+
+    返回的函数带 criteria 属性（probe_criteria），validate_lines 用它区分缓存结果。
+    """
+    if mode == 'ts':
+        probe = lambda url, channel_name='': probe_ts(url, timeout=timeout)
+        probe.criteria = probe_criteria(mode, timeout=timeout)
+    elif mode == 'throughput':
+        probe = lambda url, channel_name='': probe_throughput(url, channel_name)
+        probe.criteria = probe_criteria(mode)
+    else:
+        probe = lambda url, channel_name='': probe_frames(url, min_frames, timeout)
+        probe.criteria = probe_criteria(mode, min_frames, timeout)
+    return probe
+
+def validate_lines(lines, probe, get_key, detected_ips=None, workers=PROBE_WORKERS,
+                   keep=None, desc="Processing", cache=None, split=split_line):
+    """并发检测每行的URL，按原顺序返回通过检测的行
+
+    probe(url, channel_name) 通常由 make_probe 生成；
+    同一个key只检测一次，结果记录在 detected_ips[key] = {'status': 'ok'/'fail'}；
+    传入cache（iptv_cache.ProbeCache）时先查询相同检测标准（probe.criteria）的历史结果，新结果也写入cache。
+    keep(line) 为真的行（如分类头）直接保留，无法拆分或取不到key的行丢弃。
+    split(line) 返回 (频道名, URL)，lines 也可以是频道目录的行号，配合目录的 probe_fields 使用。
+    """
+    from tqdm import tqdm
+    if detected_ips is None:
+        detected_ips = {}
+    criteria = getattr(probe, 'criteria', None)
+
+    # 每个未检测过的key只挑一个URL作为代表
+    pending = {}
+    line_keys = []
+    for line in lines:
+        if keep is not None and keep(line):
+            line_keys.append((line, True))
+            continue
+        parts = split(line)
+        key = get_key(parts[1]) if parts else None
+        line_keys.append((line, key))
+        if key and key not in detected_ips and key not in pending:
+            status = cache.get(key, criteria) if cache is not None else None
+            if status is not None:
+                detected_ips[key] = {'status': status}
+            else:
+                pending[key] = parts
+
+    def _run(channel_name, url):
+        try:
+            return bool(probe(url, channel_name))
+        except Exception:
+            return False
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as executor:
+            futures = {executor.submit(_run, *parts): key for key, parts in pending.items()}
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc, unit='ip'):
+                key = futures[future]
+                ok = future.result()
+                detected_ips[key] = {'status': 'ok' if ok else 'fail'}
+                if cache is not None:
+                    cache.set(key, ok, criteria)
+
+    kept = []
+    for line, key in line_keys:
+        if key is True:
+            kept.append(line)
+        elif key and detected_ips.get(key, {}).get('status') == 'ok':
+            kept.append(line)
+    return kept
@@ -0,0 +1,400 @@
+# iptv_search.py
+# 服务器搜索层：FOFA网页、360 Quake API 等后端统一归一化为 ip:port，跨后端去重并缓存响应
+# Quake 客户端支持并发分页、限速、带抖动的重试退避；QueryPlanner 把省份/运营商合并成最少的查询
+import os
+import re
+import time
+import base64
+import random
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from iptv_cache import ResponseCache, state_path
+
+# ================= 配置区域 =================
+QUAKE_API_URL = "https://quake.360.net/api/v3/search/quake_service"
+QUAKE_PAGE_SIZE = 50
+QUAKE_MAX_PAGES = 10         # 单次查询最多翻几页，控制积分消耗
+QUAKE_RATE = 1.0             # 每秒最多请求次数
+QUAKE_WORKERS = 4            # 同时进行的分页请求数
+QUAKE_RETRIES = 3
+QUAKE_BACKOFF = 1.0          # 重试退避基数（秒），按 2^n 增长并加随机抖动
+QUAKE_TIMEOUT = 20
+QUAKE_CACHE_DIR = os.environ.get('IPTV_QUAKE_CACHE', state_path('quake_cache'))
+QUAKE_CACHE_TTL = 6 * 3600   # 响应缓存有效期（秒）
+FOFA_RESULT_URL = "https://fofa.info/result?qbase64="
+FOFA_RETRIES = 3
+FOFA_TIMEOUT = 5
+FOFA_CACHE_DIR = os.environ.get('IPTV_FOFA_CACHE', state_path('fofa_cache'))
+FOFA_CACHE_TTL = 6 * 3600
+# ============================================
+
+# Quake 结构化字段中的 ip:port
+HOST_PORT_RE = re.compile(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d{1,5})')
+# FOFA 结果页面中的服务地址，如 http://8.8.8.8:8888，只匹配 http:// 开头的，避免误取页面中其他 ip:port
+FOFA_URL_RE = re.compile(r'http://(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d{1,5})')
+
+class SearchError(Exception):
+    """搜索后端请求失败"""
+
+class QuakeError(SearchError):
+    """Quake API 返回了错误码"""
+
+class RateLimiter:
+    """相邻两次请求至少间隔 1/rate 秒，多线程共用"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+class QuakeClient:
+    """Quake 服务搜索，iptv_finder 和 iptv_tool 共用"""
+
+    def __init__(self, api_key, page_size=QUAKE_PAGE_SIZE, max_pages=QUAKE_MAX_PAGES,
+                 rate=QUAKE_RATE, workers=QUAKE_WORKERS, cache_dir=QUAKE_CACHE_DIR,
+                 cache_ttl=QUAKE_CACHE_TTL, timeout=QUAKE_TIMEOUT, log=print):
+        self.api_key = api_key
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.workers = workers
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        self.cache = ResponseCache(cache_dir, cache_ttl) if cache_dir else None
+        self.log = log
+        self.requests = 0    # 实际发出的请求数
+        self.cache_hits = 0
+        self.lock = threading.Lock()
+
+    def _post(self, query):
+        """发出一次请求，网络错误和限流按抖动退避重试，API错误直接抛出"""
+        headers = {"X-QuakeToken": self.api_key, "Content-Type": "application/json"}
+        for attempt in range(QUAKE_RETRIES):
+            self.limiter.wait()
+            try:
+                with self.lock:
+                    self.requests += 1
+                response = requests.post(QUAKE_API_URL, headers=headers, json=query, timeout=self.timeout)
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                response.raise_for_status()
+                data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                if attempt == QUAKE_RETRIES - 1:
+                    raise
+                delay = QUAKE_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+                self.log(f"请求失败（{attempt + 1}/{QUAKE_RETRIES}）: {str(e)}，{delay:.1f}秒后重试")
+                time.sleep(delay)
+                continue
+            if data.get("code") != 0:
+                raise QuakeError(f"API错误：{data.get('message', '未知错误')}")
+            return data
+
+    def _body(self, query, page):
+        return {
+            "query": query,
+            "start": page * self.page_size,
+            "size": self.page_size,
+            "include": ["ip", "port", "location"],
+        }
+
+    def is_cached(self, query):
+        """第一页是否在缓存有效期内"""
+        return self.cache is not None and self.cache.get(self._body(query, 0)) is not None
+
+    def evict(self):
+        """删除过期的缓存响应"""
+        if self.cache is not None:
+            self.cache.evict()
+
+    def fetch_page(self, query, page):
+        """获取一页结果，优先使用缓存"""
+        body = self._body(query, page)
+        if self.cache is not None:
+            data = self.cache.get(body)
+            if data is not None:
+                with self.lock:
+                    self.cache_hits += 1
+                return data
+        data = self._post(body)
+        if self.cache is not None:
+            self.cache.set(body, data)
+        return data
+
+    def search(self, query, max_pages=None):
+        """返回全部分页的结果条目，第一页确定总数后其余页并发获取；max_pages 默认取客户端设置"""
+        first = self.fetch_page(query, 0)
+        items = list(first.get("data", []))
+        meta = first.get("meta", {})
+        total = meta.get("pagination", {}).get("total") or meta.get("total", 0)
+        pages = min(max_pages or self.max_pages, -(-total // self.page_size))
+        if pages > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for data in executor.map(lambda page: self.fetch_page(query, page), range(1, pages)):
+                    items.extend(data.get("data", []))
+        return items
+
+def rozhuk_query(province, isp=None):
+    """按省份（和运营商）搜索 Rozhuk 服务"""
+    if isp is None:
+        return f'Rozhuk AND province:"{province}"'
+    return f'Rozhuk AND province:"{province}" AND isp:"{isp}"'
+
+def normalize_host(value):
+    """把 http://ip:port/...、ip:port 或 {'ip':..,'port':..} 统一成 ip:port，无法识别返回None"""
+    if isinstance(value, dict):
+        ip = value.get("ip")
+        port = str(value.get("port", ""))
+        return f"{ip}:{port}" if ip and port.isdigit() else None
+    match = HOST_PORT_RE.search(str(value))
+    if not match or int(match.group(2)) > 65535:
+        return None
+    return f"{match.group(1)}:{match.group(2)}"
+
+class SearchProvider:
+    """搜索后端接口：search(province, isp) 返回 ip:port 列表
+
+    query_key 返回实际发出的查询的粒度，键相同的省份/运营商共用一次查询；
+    is_cached 表示该查询在缓存有效期内，不需要请求后端；
+    prepare 在批量查询前收到全部省份/运营商，后端可据此决定合并方式；
+    evict 在一批查询结束后删除过期的缓存响应。
+    """
+    name = ""
+
+    def prepare(self, pairs):
+        pass
+
+    def evict(self):
+        pass
+
+    def query_key(self, province, isp):
+        return (province, isp)
+
+    def is_cached(self, province, isp):
+        return False
+
+    def search(self, province, isp):
+        raise NotImplementedError
+
+class FofaProvider(SearchProvider):
+    """抓取FOFA结果网页，只用正则取出 ip:port，按查询缓存提取结果
+
+    FOFA查询只按省份区分，同一省份的多个运营商共用一次请求。
+    """
+    name = "fofa"
+
+    def __init__(self, cache_dir=FOFA_CACHE_DIR, cache_ttl=FOFA_CACHE_TTL,
+                 timeout=FOFA_TIMEOUT, log=print):
+        self.cache = ResponseCache(cache_dir, cache_ttl) if cache_dir else None
+        self.timeout = timeout
+        self.log = log
+        self.requests = 0
+        self.memo = {}  # 本次运行内的结果，空结果也不重复请求
+
+    @staticmethod
+    def query(province, isp):
+        return f'"Rozhuk" && country="CN" && region="{province}"'
+
+    def evict(self):
+        if self.cache is not None:
+            self.cache.evict()
+
+    def _search_url(self, province, isp):
+        query = self.query(province, isp)
+        return FOFA_RESULT_URL + base64.b64encode(query.encode('utf-8')).decode('utf-8')
+
+    def query_key(self, province, isp):
+        return province
+
+    def is_cached(self, province, isp):
+        return province in self.memo or (
+            self.cache is not None and self.cache.get(self._search_url(province, isp)) is not None)
+
+    def search(self, province, isp):
+        if province in self.memo:
+            return self.memo[province]
+        search_url = self._search_url(province, isp)
+        if self.cache is not None:
+            hosts = self.cache.get(search_url)
+            if hosts is not None:
+                self.memo[province] = hosts
+                return hosts
+        for attempt in range(FOFA_RETRIES):
+            try:
+                self.requests += 1
+                self.log(f"查询 {province}{isp}，查询网址：{search_url}")
+                response = requests.get(search_url, timeout=self.timeout)
+                response.raise_for_status()
+                break
+            except requests.RequestException as e:
+                self.log(f"[{province}]搜索请求失败（{attempt + 1}/{FOFA_RETRIES}）：{str(e)}")
+        else:
+            raise SearchError(f"FOFA搜索[{province}{isp}]失败次数过多")
+        hosts = []
+        for match in FOFA_URL_RE.finditer(response.text):
+            host = normalize_host(f"{match.group(1)}:{match.group(2)}")
+            if host and host not in hosts:
+                hosts.append(host)
+        if self.cache is not None and hosts:
+            self.cache.set(search_url, hosts)
+        self.memo[province] = hosts
+        return hosts
+
+class QuakeProvider(SearchProvider):
+    """通过 QuakeClient 搜索 Rozhuk 服务
+
+    默认按 省份 AND 运营商 查询；split_isp为True且同一批查询中同一省份有多个运营商时，
+    该省份只查询一次（翻页上限按运营商数放大），再按结果中的运营商在本地拆分，
+    没有运营商信息的条目丢弃。
+    """
+    name = "quake"
+
+    def __init__(self, client, split_isp=True):
+        self.client = client
+        self.split_isp = split_isp
+        self.split = {}  # 合并查询的省份 -> 运营商数
+        self.memo = {}
+
+    def prepare(self, pairs):
+        """同一省份有多个运营商时合并为一次查询"""
+        if not self.split_isp:
+            return
+        isps = {}
+        for province, isp in pairs:
+            isps.setdefault(province, set()).add(isp)
+        self.split = {province: len(names) for province, names in isps.items() if len(names) > 1}
+
+    def evict(self):
+        self.client.evict()
+
+    def _query(self, province, isp):
+        return rozhuk_query(province) if province in self.split else rozhuk_query(province, isp)
+
+    def query_key(self, province, isp):
+        return province if province in self.split else (province, isp)
+
+    def is_cached(self, province, isp):
+        key = self.query_key(province, isp)
+        return key in self.memo or self.client.is_cached(self._query(province, isp))
+
+    def search(self, province, isp):
+        key = self.query_key(province, isp)
+        if key not in self.memo:
+            max_pages = self.client.max_pages * self.split.get(province, 1)
+            self.memo[key] = self.client.search(self._query(province, isp), max_pages)
+        items = self.memo[key]
+        if province in self.split:
+            # 没有运营商信息的条目无法确定归属，丢弃
+            items = [item for item in items if isp in ((item.get("location") or {}).get("isp") or '')]
+        return [host for host in map(normalize_host, items) if host]
+
+class SearchResult(list):
+    """搜索得到的 http://ip:port 列表，failed 为请求失败的后端名
+
+    有后端失败时结果可能不完整，调用方不应据此认为该省份已经更新过。
+    """
+
+    def __init__(self, urls=(), failed=()):
+        super().__init__(urls)
+        self.failed = list(failed)
+
+    @property
+    def ok(self):
+        return not self.failed
+
+class ServerSearch:
+    """依次调用多个搜索后端，合并去重后返回 http://ip:port 列表"""
+
+    def __init__(self, providers, log=print):
+        self.providers = list(providers)
+        self.log = log
+
+    def search_urls(self, province, isp, strict=False):
+        """strict为True时任一后端失败即抛出异常，否则记录后继续使用其他后端
+
+        返回 SearchResult，失败的后端记录在其 failed 中。
+        """
+        urls = SearchResult()
+        seen = set()
+        for provider in self.providers:
+            try:
+                hosts = provider.search(province, isp)
+            except (SearchError, requests.RequestException) as e:
+                if strict:
+                    raise
+                self.log(f"{provider.name} 搜索失败：{str(e)}")
+                urls.failed.append(provider.name)
+                continue
+            for host in hosts:
+                if host not in seen:
+                    seen.add(host)
+                    urls.append(f"http://{host}")
+        return urls
+
+    def evict(self):
+        """删除各后端过期的缓存响应，缓存目录不会无限增长"""
+        for provider in self.providers:
+            provider.evict()
+
+def build_search(backends, quake_api_key=None, log=print, **quake_options):
+    """按名称列表（fofa/quake）组装搜索层"""
+    providers = []
+    for name in backends:
+        if name == "fofa":
+            providers.append(FofaProvider(log=log))
+        elif name == "quake":
+            providers.append(QuakeProvider(QuakeClient(quake_api_key, log=log, **quake_options)))
+        else:
+            raise ValueError(f"未知的搜索后端：{name}")
+    return ServerSearch(providers, log=log)
+
+class QueryPlanner:
+    """把一批省份/运营商合并成最少的后端查询，执行前报告需要实际发出的请求数"""
+
+    def __init__(self, search, log=print):
+        self.search = search
+        self.log = log
+
+    def plan(self, pairs):
+        """返回计划列表：每项为 {'provider', 'key', 'pairs', 'cached'}"""
+        plan = []
+        for provider in self.search.providers:
+            provider.prepare(pairs)
+            groups = {}
+            for province, isp in pairs:
+                key = provider.query_key(province, isp)
+                groups.setdefault(key, []).append((province, isp))
+            for key, grouped in groups.items():
+                plan.append({
+                    'provider': provider.name,
+                    'key': key,
+                    'pairs': grouped,
+                    'cached': provider.is_cached(*grouped[0]),
+                })
+        return plan
+
+    @staticmethod
+    def planned_calls(plan):
+        """需要请求后端的查询数（Quake多页查询按一次计）"""
+        return sum(1 for entry in plan if not entry['cached'])
+
+    def report(self, plan, pairs):
+        calls = self.planned_calls(plan)
+        self.log(f"{len(pairs)} 个省份/运营商合并为 {len(plan)} 个查询，"
+                 f"其中 {len(plan) - calls} 个使用缓存，计划请求 {calls} 次")
+
+    def run(self, pairs):
+        """按计划执行，返回 {(省份, 运营商): SearchResult}"""
+        pairs = list(dict.fromkeys(pairs))
+        self.report(self.plan(pairs), pairs)
+        results = {pair: self.search.search_urls(*pair) for pair in pairs}
+        self.search.evict()
+        return results
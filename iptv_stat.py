@@ -0,0 +1,82 @@
+# iptv_stat.py
+# 解析 Rozhuk msd_lite / udpxy 的状态页，得到客户端数、正在转发的组播组和吞吐量
+import re
+import html
+
+# 组播地址 224.0.0.0 - 239.255.255.255，可带 /udp/ /rtp/ 前缀
+MCAST_RE = re.compile(r'(?:/(?:udp|rtp)/)?\b(2(?:2[4-9]|3\d)\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d{1,5})\b')
+# 吞吐量，如 4534 kbps、4.5Mb/s、1200000 bps
+RATE_RE = re.compile(r'([\d.]+)\s*([kKmMgG]?)(?:bit/s|bps|b/s)\b')
+# 单个组播组的客户端数，如 "clients: 2"、"Clients count: 2"
+GROUP_CLIENTS_RE = re.compile(r'clients?(?:\s+count)?\s*[:=]\s*(\d+)', re.IGNORECASE)
+# 全局客户端数，如 udpxy 的 "Active clients: 3"、msd_lite 的 "Total clients: 3"
+TOTAL_CLIENTS_RE = re.compile(r'(?:active|total|connected)\s+clients?\s*[:=]?\s*(\d+)', re.IGNORECASE)
+
+RATE_UNITS = {'': 1, 'k': 1_000, 'm': 1_000_000, 'g': 1_000_000_000}
+
+class ServerStat:
+    """状态页解析结果"""
+
+    def __init__(self):
+        self.clients = 0       # 当前连接的客户端数
+        self.throughput = 0.0  # 总吞吐量（bit/s）
+        self.groups = {}       # 组播地址 -> {'clients': n, 'bitrate': bit/s}
+
+    @property
+    def load(self):
+        """用于排序的负载值：先比客户端数，再比吞吐量"""
+        return (self.clients, self.throughput)
+
+    def is_streaming(self, mcast):
+        """该组播组是否正在被这台服务器转发"""
+        group = self.groups.get(mcast)
+        return group is not None and (group['clients'] > 0 or group['bitrate'] > 0)
+
+    def __repr__(self):
+        return f"ServerStat(clients={self.clients}, throughput={self.throughput:.0f}, groups={len(self.groups)})"
+
+def _html_to_text(body):
+    """把 udpxy 的HTML表格转成按行、按制表符分隔的纯文本"""
+    body = re.sub(r'(?i)</t[dh]>', '\t', body)
+    body = re.sub(r'(?i)<br\s*/?>|</tr>|</p>|</div>', '\n', body)
+    body = re.sub(r'<[^>]+>', '', body)
+    return html.unescape(body)
+
+def parse_rate(text):
+    """从文本中取出第一个吞吐量，返回 bit/s，没有返回0"""
+    match = RATE_RE.search(text)
+    if not match:
+        return 0.0
+    try:
+        return float(match.group(1)) * RATE_UNITS[match.group(2).lower()]
+    except ValueError:
+        return 0.0
+
+def parse_stat_page(body):
+    """解析状态页正文，无法识别的格式返回空的 ServerStat"""
+    stat = ServerStat()
+    total_clients = None
+    for line in _html_to_text(body).splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        total = TOTAL_CLIENTS_RE.search(line)
+        if total and not MCAST_RE.search(line):
+            total_clients = int(total.group(1))
+            continue
+        match = MCAST_RE.search(line)
+        if not match:
+            continue
+        mcast = match.group(1)
+        group = stat.groups.setdefault(mcast, {'clients': 0, 'bitrate': 0.0})
+        clients = GROUP_CLIENTS_RE.search(line)
+        # udpxy 每个客户端占一行，msd_lite 每个组一行并给出客户端数
+        group['clients'] += int(clients.group(1)) if clients else 1
+        group['bitrate'] += parse_rate(line[match.end():])
+
+    stat.throughput = sum(group['bitrate'] for group in stat.groups.values())
+    if total_clients is not None:
+        stat.clients = total_clients
+    else:
+        stat.clients = sum(group['clients'] for group in stat.groups.values())
+    return stat
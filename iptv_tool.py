@@ -1,16 +1,25 @@
 # iptv_tool.py
+import time
+START_TIME = time.perf_counter()
+# OpenCV 只在解码检测时导入，窗口不必等待它加载
 import tkinter as tk
 from tkinter import ttk
 import os
-import time
 import requests
-import json
-import cv2
 import random
 import threading
 import sys
 import logging
 from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
+from iptv_probe import probe_ts, probe_criteria, host_limiter
+from iptv_cache import ProbeCache
+from iptv_stat import parse_stat_page
+from iptv_search import build_search
+from iptv_imports import import_report
+from iptv_url import host_port
+from iptv_playlist import CHANNEL, BLANK, GENRE, Entry, channel, read_playlist, expand_template, write_playlist
 
 # ------------------ 日志配置 ------------------
 def setup_logging():
@@ -49,6 +58,17 @@ PROVINCES = [
 
 OPERATORS = ["电信", "移动", "联通", "广电"]
 
+# 检测方式：显示名称 -> 模式
+PROBE_MODES = {"解码检测": "decode", "TS包检测": "ts"}
+
+SERVER_WORKERS = 8      # 同时检测的服务器数
+SAMPLE_MCASTS = 3       # 每台服务器抽检的组播地址数
+CHECK_TIMEOUT = 5       # 单个组播流检测时长（秒）
+RANK_BY_LOAD = True     # 按状态页上的当前负载排序服务器，轻载的排在前面
+MAX_SERVER_CLIENTS = 0  # 状态页客户端数超过该值的服务器跳过，0为不限制
+TRUST_ACTIVE_GROUPS = True  # 状态页显示正在转发的组播组直接视为有效，不再拉流检测
+MAX_SERVERS_PER_CHANNEL = 0  # 每个频道最多写入的服务器数，0为不限制
+
 # ------------------ 主程序 ------------------
 class IPTVApp:
     def __init__(self, root):
@@ -57,6 +77,7 @@ class IPTVApp:
         root.geometry("500x400")
         
         self.base_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+        self.probe_mode = "decode"
         self._init_dirs()
         self._create_widgets()
         self._setup_ui()
@@ -67,6 +88,7 @@ class IPTVApp:
         self.playlist_dir = os.path.join(self.base_dir, 'playlist')
         os.makedirs(self.config_dir, exist_ok=True)
         os.makedirs(self.playlist_dir, exist_ok=True)
+        self.probe_cache = ProbeCache(os.path.join(self.config_dir, 'probe_cache.json'))
 
     def _create_widgets(self):
         """创建界面组件"""
@@ -88,20 +110,25 @@ class IPTVApp:
         self.operator_combo = ttk.Combobox(self.main_frame, values=OPERATORS, state="readonly")
         self.operator_combo.grid(row=2, column=1, padx=5, pady=5)
         
+        # 检测方式选择
+        ttk.Label(self.main_frame, text="检测方式:").grid(row=3, column=0, sticky=tk.W)
+        self.mode_combo = ttk.Combobox(self.main_frame, values=list(PROBE_MODES), state="readonly")
+        self.mode_combo.grid(row=3, column=1, padx=5, pady=5)
+        
         # 进度条
         self.progress = ttk.Progressbar(self.main_frame, mode='determinate')
-        self.progress.grid(row=3, column=0, columnspan=2, pady=10, sticky=tk.EW)
+        self.progress.grid(row=4, column=0, columnspan=2, pady=10, sticky=tk.EW)
         
         # 状态显示区
         self.status_frame = ttk.LabelFrame(self.main_frame, text="运行状态", padding=10)
-        self.status_frame.grid(row=4, column=0, columnspan=2, pady=10, sticky=tk.NSEW)
+        self.status_frame.grid(row=5, column=0, columnspan=2, pady=10, sticky=tk.NSEW)
         
         self.status_text = tk.Text(self.status_frame, height=4, wrap=tk.WORD, state=tk.DISABLED)
         self.status_text.pack(fill=tk.BOTH, expand=True)
         
         # 操作按钮
         self.btn_frame = ttk.Frame(self.main_frame)
-        self.btn_frame.grid(row=5, column=0, columnspan=2, pady=10)
+        self.btn_frame.grid(row=6, column=0, columnspan=2, pady=10)
         
         self.start_btn = ttk.Button(self.btn_frame, text="开始采集", command=self._start_process)
         self.start_btn.pack(side=tk.LEFT, padx=5)
@@ -113,8 +140,9 @@ class IPTVApp:
         """初始化界面状态"""
         self.province_combo.current(0)
         self.operator_combo.current(0)
+        self.mode_combo.current(0)
         self.main_frame.columnconfigure(1, weight=1)
-        self.main_frame.rowconfigure(4, weight=1)
+        self.main_frame.rowconfigure(5, weight=1)
 
     def _clear_status(self):
         """清除状态信息"""
@@ -127,6 +155,7 @@ class IPTVApp:
         api_key = self.api_entry.get().strip()
         province = self.province_combo.get()
         operator = self.operator_combo.get()
+        self.probe_mode = PROBE_MODES.get(self.mode_combo.get(), "decode")
         
         if not self._validate_input(api_key, province, operator):
             return
@@ -178,39 +207,41 @@ class IPTVApp:
                 
             # 获取服务器列表
             servers = self._quake_search(api_key, province, operator)
-            valid_servers = []
             
             # 服务器去重
+            unique_servers = []
             seen_servers = set()
             for server_url in servers:
-                server_identity = server_url.split('//')[1].split('/')[0]  # ip:port
+                server_identity = host_port(server_url)  # ip:port
                 if server_identity in seen_servers:
                     continue
                 seen_servers.add(server_identity)
-                
-                # 状态页检测
-                if not self._check_status_page(server_url):
-                    continue
-                
-                # 随机选择3个地址检测
-                success_count = 0
-                selected_mcasts = random.sample(mcast_addresses, 3)
-                for mcast in selected_mcasts:
-                    if self._check_multicast_stream(server_url, mcast):
-                        success_count += 1
-                    else:
-                        break  # 任一失败即终止
-                
-                # 三个检测都成功则记录
-                if success_count == 3:
-                    valid_servers.append(server_url)
-                    logger.info(f"有效服务器：{server_url} 通过3/3检测")
+                unique_servers.append(server_url)
+            
+            # 多台服务器并发检测，每台的抽检地址也并发进行
+            # 检测池大小为服务器池的SAMPLE_MCASTS倍，服务器任务等待检测任务时不会互相饿死
+            results = {}
+            with ThreadPoolExecutor(max_workers=SERVER_WORKERS) as server_pool, \
+                    ThreadPoolExecutor(max_workers=SERVER_WORKERS * SAMPLE_MCASTS) as check_pool:
+                futures = {
+                    server_pool.submit(self._check_server, server_url, mcast_addresses, check_pool): server_url
+                    for server_url in unique_servers
+                }
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+            
+            # 保持搜索结果的原有顺序，需要时再按负载稳定排序
+            valid_servers = [server_url for server_url in unique_servers if results.get(server_url)]
+            if RANK_BY_LOAD:
+                valid_servers.sort(key=lambda server_url: results[server_url].load)
 
             # 生成播放列表
             if valid_servers:
-                self._save_playlist(province, operator, valid_servers, channels)
-                total_entries = len(valid_servers) * len(channels)
-                self._show_success(f"发现{len(valid_servers)}个有效服务器，生成{total_entries}条播放地址")
+                total_entries = self._save_playlist(province, operator, valid_servers, channels)
+                if total_entries is None:
+                    self._show_error("保存播放列表失败 (详情请查看error.log)")
+                else:
+                    self._show_success(f"发现{len(valid_servers)}个有效服务器，生成{total_entries}条播放地址")
             else:
                 self._show_error("未找到有效服务器")
                 
@@ -218,6 +249,10 @@ class IPTVApp:
             logger.error("采集任务失败", exc_info=True)
             self._show_error(f"错误：{str(e)} (详情请查看error.log)")
         finally:
+            try:
+                self.probe_cache.save()
+            except OSError:
+                logger.warning("检测缓存保存失败", exc_info=True)
             self._enable_ui()
 
     def _load_multicast_channels(self, province, operator):
@@ -225,19 +260,13 @@ class IPTVApp:
         config_file = os.path.join(self.config_dir, f"{province}_{operator}.txt")
         channels = []
         try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if line.startswith("#") or not line:
-                        continue
-                    if ',rtp://' not in line:
-                        logger.warning(f"配置文件第{line_num}行格式错误：{line}")
-                        continue
-                        
-                    parts = line.split(',rtp://', 1)
-                    name = parts[0].strip()
-                    address = 'rtp://' + parts[1].strip()
-                    channels.append((name, address))
+            for entry in read_playlist(config_file):
+                if entry.kind == BLANK or entry.text.lstrip().startswith("#"):
+                    continue
+                if entry.kind != CHANNEL or not entry.url.lstrip().startswith('rtp://'):
+                    logger.warning(f"配置文件第{entry.lineno}行格式错误：{entry.text.strip()}")
+                    continue
+                channels.append((entry.name.strip(), entry.full_url.strip()))
             
             if not channels:
                 logger.error("配置文件中未找到有效频道")
@@ -250,111 +279,153 @@ class IPTVApp:
             return []
 
     def _quake_search(self, api_key, province, operator):
-        """执行Quake API查询"""
+        """执行Quake API查询，分页并发获取并缓存响应"""
         try:
-            headers = {"X-QuakeToken": api_key}
-            query = {
-                "query": f'Rozhuk AND province:"{province}" AND isp:"{operator}"',
-                "size": 50,
-                "include": ["ip", "port"]
-            }
-            
-            logger.debug(f"发送API请求：{json.dumps(query, indent=2)}")
-            response = requests.post(
-                "https://quake.360.net/api/v3/search/quake_service",
-                headers=headers,
-                json=query,
-                timeout=20
+            search = build_search(
+                ["quake"], api_key,
+                log=logger.warning,
+                cache_dir=os.path.join(self.config_dir, 'quake_cache')
             )
-            response.raise_for_status()
-            
-            data = response.json()
-            logger.debug(f"收到API响应：{json.dumps(data, indent=2)}")
-            
-            if data.get("code") != 0:
-                raise ValueError(f"API错误：{data.get('message', '未知错误')}")
-                
-            return [
-                f"http://{item['ip']}:{item['port']}"
-                for item in data.get("data", [])
-                if item.get("ip") and str(item.get("port", "")).isdigit()
-            ]
+            logger.debug(f"发送API请求：{province}{operator}")
+            servers = search.search_urls(province, operator, strict=True)
+            search.evict()
+            logger.debug(f"收到{len(servers)}个服务器")
+            return servers
             
         except Exception as e:
             logger.error("API请求失败", exc_info=True)
             raise
 
     def _check_status_page(self, base_url):
-        """检测状态页可用性"""
+        """检测状态页可用性，可访问时返回解析后的负载信息，否则返回None"""
         status_url = f"{base_url}/stat"
         try:
-            response = requests.get(status_url, timeout=5)
+            with host_limiter.slot(base_url):
+                response = requests.get(status_url, timeout=5)
             if response.status_code == 200:
-                logger.debug(f"状态页可访问：{status_url}")
-                return True
+                stat = parse_stat_page(response.text)
+                logger.debug(f"状态页可访问：{status_url} {stat}")
+                return stat
             logger.debug(f"状态页异常响应：{status_url} ({response.status_code})")
-            return False
+            return None
         except Exception as e:
             logger.debug(f"状态页检测失败：{status_url} - {str(e)}")
-            return False
+            return None
+
+    def _check_server(self, server_url, mcast_addresses, check_pool):
+        """检测单台服务器：状态页通过后并发抽检组播地址，任一失败即取消其余检测
 
-    def _check_multicast_stream(self, base_url, mcast):
-        """检测组播流有效性"""
+        有效时返回状态页解析结果（ServerStat），无效返回None
+        """
+        stat = self._check_status_page(server_url)
+        if stat is None:
+            return None
+        if MAX_SERVER_CLIENTS and stat.clients > MAX_SERVER_CLIENTS:
+            logger.info(f"服务器负载过高，跳过：{server_url} ({stat.clients}个客户端)")
+            return None
+        
+        cancel = threading.Event()
+        selected_mcasts = random.sample(mcast_addresses, SAMPLE_MCASTS)
+        futures = []
+        for mcast in selected_mcasts:
+            if TRUST_ACTIVE_GROUPS and stat.is_streaming(mcast):
+                # 服务器正在转发该组播，无需再拉流
+                logger.debug(f"状态页显示正在转发：{server_url}/rtp/{mcast}")
+                self.probe_cache.set(ProbeCache.key(server_url, mcast), True, self._criteria())
+                continue
+            futures.append(check_pool.submit(self._cached_check, server_url, mcast, cancel))
+        for future in as_completed(futures):
+            if not future.result():
+                cancel.set()
+                for other in futures:
+                    other.cancel()  # 尚未开始的检测直接取消
+                return None
+        
+        logger.info(f"有效服务器：{server_url} 通过{SAMPLE_MCASTS}/{SAMPLE_MCASTS}检测，负载{stat}")
+        return stat
+
+    def _criteria(self):
+        """当前检测方式的标准（ts模式按超时，decode模式超时内读到1帧），随结果写入缓存"""
+        if self.probe_mode == 'ts':
+            return probe_criteria('ts', timeout=CHECK_TIMEOUT)
+        return probe_criteria(self.probe_mode, 1, CHECK_TIMEOUT)
+
+    def _cached_check(self, base_url, mcast, cancel=None):
+        """优先使用有效期内、检测标准相同的历史检测结果"""
+        key = ProbeCache.key(base_url, mcast)
+        status = self.probe_cache.get(key, self._criteria())
+        if status is not None:
+            logger.debug(f"使用缓存结果：{key} -> {status}")
+            return status == 'ok'
+        ok = self._check_multicast_stream(base_url, mcast, cancel)
+        # 被取消的检测没有结论，不写入缓存
+        if cancel is None or not cancel.is_set():
+            self.probe_cache.set(key, ok, self._criteria())
+        return ok
+
+    def _check_multicast_stream(self, base_url, mcast, cancel=None):
+        """检测组播流有效性，cancel被置位时尽快退出"""
         stream_url = f"{base_url}/rtp/{mcast}"
-        result = [False]
+        if self.probe_mode == 'ts':
+            # 只检查TS包结构，不启动解码器
+            ok = probe_ts(stream_url, timeout=CHECK_TIMEOUT, cancel=cancel)
+            logger.debug(f"TS包检测{'通过' if ok else '失败'}：{stream_url}")
+            return ok
         
-        def _capture():
-            try:
-                cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
+        import cv2  # 仅解码检测需要OpenCV
+        logger.debug(f"开始检测组播流：{stream_url}")
+        result = False
+        cap = None
+        try:
+            with host_limiter.slot(stream_url):
+                if cancel is not None and cancel.is_set():
+                    return False
+                # 由FFmpeg自身的打开/读取超时保证卡住的连接一定会被关闭
+                timeout_ms = CHECK_TIMEOUT * 1000
+                cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG, [
+                    cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+                    cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms,
+                ])
                 if cap.isOpened():
                     start_time = time.time()
                     # 5秒内检测到有效帧即成功
-                    while (time.time() - start_time) < 5:
+                    while (time.time() - start_time) < CHECK_TIMEOUT:
+                        if cancel is not None and cancel.is_set():
+                            break
                         ret, _ = cap.read()
                         if ret:
-                            result[0] = True
+                            result = True
                             break
                         time.sleep(0.1)
-                    cap.release()
-            except Exception as e:
-                logger.debug(f"视频流检测异常：{stream_url} - {str(e)}")
-        
-        logger.debug(f"开始检测组播流：{stream_url}")
-        thread = threading.Thread(target=_capture)
-        thread.start()
-        thread.join(8)  # 总超时8秒
+        except Exception as e:
+            logger.debug(f"视频流检测异常：{stream_url} - {str(e)}")
+        finally:
+            if cap is not None:
+                cap.release()
         
-        if result[0]:
+        if result:
             logger.info(f"组播流有效：{stream_url}")
         else:
             logger.debug(f"组播流无效：{stream_url}")
-        return result[0]
+        return result
 
     def _save_playlist(self, province, operator, servers, channels):
-        """保存播放列表文件"""
+        """保存播放列表文件，返回写入的播放地址数，失败时返回None"""
         try:
             output_file = os.path.join(self.playlist_dir, f"{province}{operator}.txt")
-            entry_count = 0
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"{province}{operator},#genre#\n")
-                
-                # 写入所有有效组合
-                seen = set()
-                for server in servers:
-                    for (name, mcast_full) in channels:
-                        mcast = mcast_full.split('rtp://')[1]
-                        entry = f"{name},{server}/rtp/{mcast}"
-                        if entry not in seen:
-                            f.write(f"{entry}\n")
-                            seen.add(entry)
-                            entry_count += 1
-            
+            # 服务器 × 频道 逐条展开直接写入文件，不在内存中保留生成的条目
+            entries = chain(
+                [Entry(GENRE, f"{province}{operator}")],
+                expand_template((channel(name, mcast_full) for name, mcast_full in channels), servers,
+                                MAX_SERVERS_PER_CHANNEL or None)
+            )
+            entry_count, _ = write_playlist(output_file, entries)
+
             logger.info(f"成功写入 {entry_count} 条播放地址到 {output_file}")
-            return True
+            return entry_count
         except Exception as e:
             logger.error("保存播放列表失败", exc_info=True)
-            return False
+            return None
 
     def _show_error(self, message, persistent=False):
         """显示错误信息"""
@@ -397,4 +468,5 @@ if __name__ == "__main__":
     
     root = tk.Tk()
     app = IPTVApp(root)
+    import_report(START_TIME, log=logger.info)
     root.mainloop()
@@ -0,0 +1,92 @@
+# iptv_url.py
+# 播放地址规范化：协议和主机名小写、去掉默认端口、去掉 $ 之后的备注、查询参数排序，
+# 规范化后的地址经摘要放入哈希索引，供各处去重使用
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from iptv_pipeline import Deduper
+
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'rtsp': 554, 'rtmp': 1935}
+# 行中的第一个地址，如 频道名,http://1.2.3.4:80/rtp/239.1.1.1:5000$备注
+URL_RE = re.compile(r'[A-Za-z][A-Za-z0-9+.\-]*://[^\s,]+')
+
+def strip_annotation(url):
+    """去掉地址后面 $ 开头的备注，如 $4M-bestzb"""
+    return url.split('$', 1)[0].strip()
+
+def _split(url):
+    """返回 (urlsplit结果, 端口)，无法解析返回None"""
+    try:
+        parts = urlsplit(url)
+        return parts, parts.port
+    except ValueError:
+        return None
+
+def host_port(url):
+    """地址中的 host:port，省略的端口补上协议的默认端口"""
+    url = strip_annotation(url)
+    if '://' not in url:
+        url = 'http://' + url
+    split = _split(url)
+    if split is None or not split[0].hostname:
+        return url.split('://', 1)[1].split('/', 1)[0]
+    parts, port = split
+    host = parts.hostname
+    if ':' in host:
+        host = f"[{host}]"
+    port = port or DEFAULT_PORTS.get(parts.scheme.lower())
+    return f"{host}:{port}" if port else host
+
+def canonical_url(url):
+    """规范化地址，无法解析时原样返回（去掉备注）"""
+    url = strip_annotation(url)
+    if '://' not in url:
+        return url
+    split = _split(url)
+    if split is None:
+        return url
+    parts, port = split
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '')
+    if ':' in host:
+        host = f"[{host}]"
+    netloc = host if port is None or port == DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else '')
+        netloc = f"{userinfo}@{netloc}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+def find_url(line):
+    """行中的第一个地址，没有返回None"""
+    match = URL_RE.search(line)
+    return match.group() if match else None
+
+def canonical_line(line):
+    """按整行去重的键：频道名加规范化地址，没有地址的行按原文"""
+    url = find_url(line)
+    if url is None:
+        return line.strip()
+    return line[:line.find(url)].strip() + canonical_url(url)
+
+class UrlIndex:
+    """规范化地址的摘要 -> 首次出现时登记的值"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, url):
+        return Deduper.digest(canonical_url(url)) in self.entries
+
+    def add(self, url, value=None):
+        """第一次出现返回True并登记value"""
+        digest = Deduper.digest(canonical_url(url))
+        if digest in self.entries:
+            return False
+        self.entries[digest] = value
+        return True
+
+    def get(self, url, default=None):
+        return self.entries.get(Deduper.digest(canonical_url(url)), default)
@@ -0,0 +1,18 @@
+# tests/conftest.py
+# 测试直接导入仓库根目录下的 iptv_* 模块
+import os
+import sys
+import importlib.util
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def multicast(tmp_path, monkeypatch):
+    """在临时目录中导入 组播py/组播综合.py，缓存和清单都写到临时目录"""
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location('组播综合', os.path.join(ROOT, '组播py', '组播综合.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,86 @@
+# tests/test_cache.py
+# iptv_cache：JSON 状态文件的读写，检测缓存的有效期和检测标准
+import os
+import json
+import pytest
+from iptv_cache import load_json, save_json_atomic, ProbeCache
+from iptv_probe import probe_criteria
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def probe_cache(tmp_path, clock, **options):
+    return ProbeCache(str(tmp_path / 'probe_cache.json'), ok_ttl=600, fail_ttl=60, clock=clock, **options)
+
+def test_save_json_atomic_round_trip(tmp_path):
+    path = str(tmp_path / 'state' / 'data.json')
+    save_json_atomic(path, {'频道': [1, 2]}, sort_keys=True)
+    assert load_json(path) == {'频道': [1, 2]}
+    assert os.listdir(tmp_path / 'state') == ['data.json']
+
+def test_load_json_missing_or_corrupt(tmp_path):
+    assert load_json(str(tmp_path / 'missing.json'), {}) == {}
+    path = tmp_path / 'broken.json'
+    path.write_text('{"a": ', encoding='utf-8')
+    assert load_json(str(path)) is None
+    assert load_json(str(path), []) == []
+
+def test_ok_and_fail_results_expire_separately(tmp_path, clock):
+    cache = probe_cache(tmp_path, clock)
+    cache.set('1.1.1.1:80', True)
+    cache.set('2.2.2.2:80', False)
+    clock.now += 60
+    assert (cache.get('1.1.1.1:80'), cache.get('2.2.2.2:80')) == ('ok', 'fail')
+    clock.now += 1
+    assert cache.get('2.2.2.2:80') is None
+    assert '2.2.2.2:80' not in cache.entries
+    assert cache.get('1.1.1.1:80') == 'ok'
+    clock.now += 540
+    assert cache.get('1.1.1.1:80') is None
+    assert cache.hits == 3
+
+def test_results_of_other_criteria_are_not_reused(tmp_path, clock):
+    cache = probe_cache(tmp_path, clock)
+    decode = probe_criteria('decode', 30, 3)
+    cache.set('1.1.1.1:80/rtp/239.1.1.1:5000', 'ok', decode)
+    assert cache.get('1.1.1.1:80/rtp/239.1.1.1:5000', decode) == 'ok'
+    assert cache.get('1.1.1.1:80/rtp/239.1.1.1:5000', probe_criteria('decode', 10, 5)) is None
+    assert cache.get('1.1.1.1:80/rtp/239.1.1.1:5000', probe_criteria('ts', None, 5)) is None
+    assert cache.get('1.1.1.1:80/rtp/239.1.1.1:5000') is None
+    # 标准不同只是不命中，原结果仍保留
+    assert cache.get('1.1.1.1:80/rtp/239.1.1.1:5000', decode) == 'ok'
+    assert cache.hits == 2
+
+def test_save_and_load_drop_expired_entries(tmp_path, clock):
+    cache = probe_cache(tmp_path, clock)
+    ts = probe_criteria('ts', None, 5)
+    cache.set('1.1.1.1:80', 'ok', ts)
+    cache.set('2.2.2.2:80', 'fail', ts)
+    cache.save()
+    clock.now += 61
+    loaded = probe_cache(tmp_path, clock)
+    assert set(loaded.entries) == {'1.1.1.1:80'}
+    assert loaded.get('1.1.1.1:80', ts) == 'ok'
+
+def test_entries_without_criteria_only_match_no_criteria(tmp_path, clock):
+    # 旧版本缓存的条目为 [状态, 时间]，读入后检测标准为None
+    (tmp_path / 'probe_cache.json').write_text(json.dumps({'1.1.1.1:80': ['ok', clock.now]}), encoding='utf-8')
+    cache = probe_cache(tmp_path, clock)
+    assert cache.get('1.1.1.1:80', probe_criteria('ts', None, 5)) is None
+    assert cache.get('1.1.1.1:80') == 'ok'
+
+def test_save_keeps_the_newest_entries(tmp_path, clock):
+    cache = probe_cache(tmp_path, clock, max_entries=2)
+    for i in range(4):
+        cache.set(f'10.0.0.{i}:80', 'ok')
+        clock.now += 1
+    cache.save()
+    assert set(load_json(cache.path)) == {'10.0.0.2:80', '10.0.0.3:80'}
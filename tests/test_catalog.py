@@ -0,0 +1,88 @@
+# tests/test_catalog.py
+# iptv_catalog.ChannelCatalog：文本行与列式目录之间的往返、查询和二进制索引
+from iptv_catalog import ChannelCatalog, as_catalog, STATUS_OK, STATUS_FAIL, STATUS_UNKNOWN
+from iptv_channels import ChannelIndex
+from iptv_index import PlaylistIndex
+
+LINES = [
+    '央视频道,#genre#\n',
+    'CCTV-1高清,http://1.2.3.4:8080/rtp/239.1.1.1:5000$备注\n',
+    'CCTV1 综合,http://1.2.3.4:8080/rtp/239.1.1.2:5000\n',
+    '湖南卫视,http://5.6.7.8/udp/239.2.2.2:6000\n',
+    '\n',
+    '凤凰中文, https://example.com/live.m3u8?a=1\n',
+]
+
+def catalog():
+    return ChannelCatalog.from_lines(LINES, ChannelIndex(path=None))
+
+def test_lines_round_trip():
+    assert catalog().lines() == LINES
+
+def test_columns():
+    c = catalog()
+    assert len(c) == len(LINES)
+    assert not c.has_url(0) and c.has_url(1)
+    assert c.channel(1) == c.channel(2) == 'CCTV1'
+    assert c.host(1) == '1.2.3.4:8080' and c.host(3) == '5.6.7.8:80'
+    assert c.mcast(1) == '239.1.1.1:5000' and c.mcast(3) == '239.2.2.2:6000'
+    assert c.url(1) == 'http://1.2.3.4:8080/rtp/239.1.1.1:5000$备注'
+    assert c.fields(0) == ('央视频道', '#genre#')
+    assert c.probe_fields(0) is None
+    assert c.probe_fields(5) == ('凤凰中文', 'https://example.com/live.m3u8?a=1')
+    assert list(c.status) == [STATUS_UNKNOWN] * len(LINES)
+
+def test_servers_are_stored_once():
+    c = catalog()
+    assert c.prefixes[1] == c.prefixes[2]
+    assert c.hosts[1] == c.hosts[2]
+
+def test_queries():
+    c = catalog()
+    assert c.rows_by_host('1.2.3.4:8080') == [1, 2]
+    assert c.rows_by_channel('CCTV1') == [1, 2]
+    assert c.rows_by_channel('不存在') == []
+    assert c.host_names() == ['1.2.3.4:8080', '5.6.7.8:80', 'example.com:443']
+
+def test_select_keeps_rows_and_state():
+    c = catalog()
+    c.set_status(1, True)
+    c.set_status(3, False)
+    c.set_category(3, '卫视频道')
+    picked = c.select([3, 1])
+    assert picked.strings is c.strings
+    assert picked.lines() == [LINES[3], LINES[1]]
+    assert list(picked.status) == [STATUS_FAIL, STATUS_OK]
+    assert picked.category(0) == '卫视频道'
+    assert picked.rows_by_host('5.6.7.8:80') == [0]
+
+def test_as_catalog():
+    c = catalog()
+    assert as_catalog(c) is c
+    assert as_catalog(LINES).lines() == LINES
+
+def test_index_round_trip(tmp_path):
+    c = catalog()
+    c.set_status(1, True)
+    c.set_category(1, '央视频道')
+    path = str(tmp_path / 'list.idx')
+    c.save_index(path)
+    with PlaylistIndex(path) as index:
+        assert list(index.lines()) == LINES
+        assert index.rows_by_channel('CCTV1') == [1, 2]
+        assert index.rows_by_host('5.6.7.8:80') == [3]
+        restored = as_catalog(index)
+    assert restored.lines() == LINES
+    assert list(restored.status) == list(c.status)
+    assert restored.category(1) == '央视频道'
+    assert restored.rows_by_channel('CCTV1') == [1, 2]
+    restored.add_line('新频道,http://9.9.9.9/x\n')
+    assert restored.lines()[-1] == '新频道,http://9.9.9.9/x\n'
+
+def test_display_names_stay_raw_and_dedup_uses_channel_id():
+    from iptv_probe import channel_class
+    c = ChannelCatalog.from_lines(['CCTV-1高清,http://1.2.3.4:80/live\n', 'CCTV1,HTTP://1.2.3.4/live$备注\n',
+                                   '北京卫视HD,http://1.2.3.4/bj\n'], ChannelIndex(path=None))
+    assert c.name(0) == 'CCTV-1高清' and c.channel(0) == 'CCTV1'
+    assert c.dedup_key(0) == c.dedup_key(1)
+    assert [channel_class(c.name(row)) for row in range(len(c))] == ['HD', 'SD', 'HD']
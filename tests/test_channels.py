@@ -0,0 +1,58 @@
+# tests/test_channels.py
+# iptv_channels：频道名规范化和别名表
+import json
+import pytest
+from iptv_channels import canonical_name, ChannelIndex
+
+@pytest.mark.parametrize('name, expected', [
+    ('CCTV1', 'CCTV1'),
+    ('CCTV-1高清', 'CCTV1'),
+    ('CCTV1 综合', 'CCTV1'),
+    ('cctv-01', 'CCTV1'),
+    ('CCTV5+ 体育赛事', 'CCTV5+'),
+    ('CCTV164K', 'CCTV16-4K'),
+    ('CCTV16-4K', 'CCTV16-4K'),
+    ('CCTV16 4K', 'CCTV16-4K'),
+    ('CCTV4K', 'CCTV-4K'),
+    ('CCTV-8K超高清', 'CCTV-8K'),
+    ('ＣＣＴＶ１３', 'CCTV13'),
+    ('湖南卫视HD', '湖南卫视'),
+    ('湖南卫视(576i)', '湖南卫视'),
+    ('浙江卫视-HEVC', '浙江卫视'),
+    ('4K高清', '4K高清'),
+    ('CCTV17农业农村', 'CCTV17'),
+])
+def test_canonical_name(name, expected):
+    assert canonical_name(name) == expected
+
+def test_canonical_name_is_idempotent():
+    for name in ('CCTV-1高清', 'CCTV164K', '湖南卫视HD', '4K高清'):
+        assert canonical_name(canonical_name(name)) == canonical_name(name)
+
+def test_index_prefers_the_alias_table(tmp_path):
+    path = tmp_path / 'aliases.json'
+    path.write_text(json.dumps({'翡翠台': 'TVB翡翠台'}, ensure_ascii=False), encoding='utf-8')
+    index = ChannelIndex(str(path))
+    assert index.canonical('翡翠台') == 'TVB翡翠台'
+    assert index.canonical('CCTV-1高清') == 'CCTV1'
+    assert index.aliases['CCTV-1高清'] == 'CCTV1'  # 未收录的名字计算后加入
+
+def test_missing_alias_file_starts_empty(tmp_path):
+    index = ChannelIndex(str(tmp_path / 'missing.json'))
+    assert index.aliases == {}
+
+def test_rename_line():
+    index = ChannelIndex(path=None)
+    assert index.rename_line('CCTV-1高清,http://1.2.3.4/rtp/239.1.1.1:5000$备注\n') == \
+        'CCTV1,http://1.2.3.4/rtp/239.1.1.1:5000$备注\n'
+    assert index.rename_line('央视频道,#genre#\n') == '央视频道,#genre#\n'
+    assert index.rename_line('更新时间\n') == '更新时间\n'
+
+def test_save_and_build_round_trip(tmp_path):
+    source = tmp_path / 'list.txt'
+    source.write_text('央视,#genre#\nCCTV-1高清,http://a/1\nCCTV1 综合,http://b/1\n', encoding='utf-8')
+    index = ChannelIndex(path=None).build([str(source), str(tmp_path / 'missing')])
+    assert index.aliases == {'CCTV-1高清': 'CCTV1', 'CCTV1 综合': 'CCTV1'}
+    index.path = str(tmp_path / 'aliases.json')
+    index.save()
+    assert ChannelIndex(index.path).aliases == index.aliases
@@ -0,0 +1,75 @@
+# tests/test_classify.py
+# iptv_classify：Aho-Corasick 多关键词匹配，以及与原脚本逐类正则提取、按网址去重一致的分类结果
+import re
+from iptv_classify import KeywordMatcher, Classifier, genre_header
+
+# 组播综合.py 的分类规则，分类名本身也是关键词
+CATEGORIES = [
+    "央视频道&爬虫, CCTV, 8K, 4K, 4k",
+    "卫视频道&爬虫, 卫视, CHC, 凤凰, 星空",
+    "央视数字&爬虫, 第一剧场, 怀旧剧场, 风云音乐, 风云剧场, 欢笑剧场, 都市剧场, 高清电影, 家庭影院, 动作电影, 影迷, 峨眉, 重温, 女性, 地理",
+    "数字频道&爬虫, 爱动漫, SiTV, 爱怀旧, 爱经典, 爱科幻, 爱青春, 爱悬疑, 爱幼教, 爱院线",
+    "省级频道&爬虫, 湖南, 北京",
+]
+RULES = [(rule.split(', ')[0], rule.split(', ')) for rule in CATEGORIES]
+
+def baseline(lines, rules, min_size):
+    """原脚本的做法：每个分类单独用正则提取命中的行，分类头加内容不足 min_size 字节的分类文件被删除，
+    合并后按网址去重，同一网址只保留最先出现（分类靠前）的一行"""
+    files = []
+    for name, keywords in rules:
+        pattern = '|'.join(re.escape(keyword) for keyword in keywords)
+        extracted = [line for line in lines if 'genre' not in line and re.search(pattern, line)]
+        if extracted and len((genre_header(name) + ''.join(extracted)).encode('utf-8')) >= min_size:
+            files.append((name, extracted))
+    seen = set()
+    result = {}
+    for name, extracted in files:
+        for line in extracted:
+            url = line.split(',')[1]
+            if url not in seen:
+                seen.add(url)
+                result.setdefault(name, []).append(line)
+    return result
+
+def lines_of(*names):
+    return [f"{name},http://10.0.0.{i}:8080/rtp/239.1.1.{i}:5000\n" for i, name in enumerate(names, 1)]
+
+def test_matcher_finds_overlapping_keywords():
+    matcher = KeywordMatcher()
+    for value, keyword in enumerate(['怀旧剧场', '旧剧', '剧场', 'CCTV', 'TV5']):
+        matcher.add(keyword, value)
+    assert matcher.matches('CCTV5怀旧剧场') == {0, 1, 2, 3, 4}
+    # 长关键词的前缀匹配失败后，经失败指针仍能命中其中较短的关键词
+    assert matcher.matches('怀旧剧院') == {1}
+    assert matcher.matches('CCTCCTV') == {3}
+    assert matcher.matches('') == set()
+
+def test_first_matching_rule_wins():
+    classifier = Classifier([('央视', ['CCTV']), ('卫视', ['卫视']), ('湖南', ['湖南'])])
+    # 命中多个分类时按规则顺序取第一个，与关键词在行中出现的位置无关
+    result = classifier.classify(['湖南卫视CCTV,url1\n', '湖南卫视,url2\n', '湖南都市,url3\n'])
+    assert result == {'央视': ['湖南卫视CCTV,url1\n'], '卫视': ['湖南卫视,url2\n'], '湖南': ['湖南都市,url3\n']}
+
+def test_genre_lines_and_unmatched_lines():
+    classifier = Classifier([('央视', ['CCTV'])])
+    assert classifier.classify(['CCTV,#genre#\n', 'CCTV1,url\n', '其他,url\n']) == {'央视': ['CCTV1,url\n']}
+    classifier = Classifier([('央视', ['CCTV'])], default='其他频道')
+    assert classifier.classify(['CCTV1,url\n', '其他,url\n']) == {'央视': ['CCTV1,url\n'],
+                                                                    '其他频道': ['其他,url\n']}
+
+def test_small_category_falls_through_to_next_match():
+    lines = ['CCTV卫视,url1\n', '湖南卫视,url2\n', 'CCTV1,url3\n']
+    rules = [('央视', ['CCTV']), ('卫视', ['卫视'])]
+    # 央视分类头加两行共42字节，不足43字节时整个分类丢弃，命中卫视的行改归卫视，只命中央视的行被丢弃
+    assert Classifier(rules, min_bytes=42).classify(lines) == {'央视': ['CCTV卫视,url1\n', 'CCTV1,url3\n'],
+                                                              '卫视': ['湖南卫视,url2\n']}
+    assert Classifier(rules, min_bytes=43).classify(lines) == {'卫视': ['CCTV卫视,url1\n', '湖南卫视,url2\n']}
+
+def test_classify_matches_baseline():
+    lines = lines_of('CCTV1', 'CCTV-4K', '湖南卫视', 'CHC动作电影', '凤凰卫视', '星空卫视', '北京卫视',
+                     '怀旧剧场', '第一剧场', '爱动漫', '湖南都市', '北京新闻', '金鹰卡通', 'CCTV风云剧场')
+    lines.insert(3, '央视频道&爬虫,#genre#\n')
+    for min_size in (0, 100, 200, 300, 1000):
+        expected = baseline(lines, RULES, min_size)
+        assert Classifier(RULES, min_bytes=min_size).classify(lines) == expected
@@ -0,0 +1,15 @@
+# tests/test_multicast.py
+# 组播py/组播综合.py 中不依赖网络的辅助函数
+
+def test_replace_names(multicast):
+    text = 'CCTV164K,http://a/1\nCCTV4K,http://a/2\nCCTV16-4K,http://a/3\nCCTV-4K,http://a/4\n'
+    assert multicast.replace_names(text) == \
+        'CCTV16-4K,http://a/1\nCCTV-4K,http://a/2\nCCTV16-4K,http://a/3\nCCTV-4K,http://a/4\n'
+
+def test_subnet_key_is_the_slash_24(multicast):
+    key = multicast.get_subnet_key
+    assert key('http://127.0.1.1:8000/rtp/239.1.1.1:5000') == '127.0.1.0/24'
+    assert key('http://127.0.2.1:8000/rtp/239.1.1.1:5000') == '127.0.2.0/24'
+    assert key('http://127.0.1.9:9000/hls/1.m3u8') == key('http://127.0.1.1/x')
+    assert key('http://example.com:8000/live') is None
+    assert key('http://[2409:8087::1]:80/live') is None
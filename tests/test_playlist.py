@@ -0,0 +1,150 @@
+# tests/test_playlist.py
+# iptv_playlist：txt/M3U 行解析、逐条读写和两种格式之间的往返
+import os
+import pytest
+from iptv_playlist import (CHANNEL, GENRE, HEADER, BLANK, OTHER, parse_line, split_line, iter_txt,
+                           iter_m3u, iter_entries, read_playlist, format_txt, format_m3u, write_playlist,
+                           expand_template, append_playlist)
+
+TXT = (
+    'Host=cache.ott.example=1.2.3.4\n'
+    '央视频道,#genre#\n'
+    'CCTV1,http://1.2.3.4:8080/rtp/239.1.1.1:5000$4M-bestzb\n'
+    'CCTV2,http://1.2.3.4:8080/rtp/239.1.1.2:5000\n'
+    '\n'
+    '卫视频道,#genre#\n'
+    '湖南卫视,http://5.6.7.8/live\n'
+    '更新时间：2026-10-18\n'
+)
+
+M3U = (
+    '\ufeff#EXTM3U x-tvg-url="http://epg.example/e.xml"\n'
+    '#EXTINF:-1 tvg-name="CCTV1" group-title="央视,频道",CCTV-1 综合\n'
+    '#EXTVLCOPT:http-user-agent=Mozilla\n'
+    'http://1.2.3.4/live/1.m3u8\n'
+    '#EXTGRP:卫视\n'
+    '#EXTINF:-1 tvg-name=浙江卫视,浙江卫视\n'
+    'http://1.2.3.4/live/2.m3u8\n'
+)
+
+@pytest.mark.parametrize('line, kind', [
+    ('CCTV1,http://1.2.3.4/x\n', CHANNEL),
+    ('央视频道,#genre#\n', GENRE),
+    ('央视频道, #genre# \r\n', GENRE),
+    ('Host=a.b.c=1.2.3.4\n', HEADER),
+    ('  \n', BLANK),
+    ('更新时间,2026-10-18\n', OTHER),
+    ('# 注释\n', OTHER),
+])
+def test_parse_line_kind(line, kind):
+    assert parse_line(line).kind == kind
+
+def test_parse_line_channel():
+    entry = parse_line(' CCTV1 ,http://1.2.3.4/x$备注,带逗号\r\n', group='央视', lineno=3)
+    assert entry.name == ' CCTV1 '
+    assert entry.url == 'http://1.2.3.4/x'
+    assert entry.tag == '备注,带逗号'
+    assert entry.full_url == 'http://1.2.3.4/x$备注,带逗号'
+    assert (entry.group, entry.lineno) == ('央视', 3)
+    assert entry.txt_line() == entry.text == ' CCTV1 ,http://1.2.3.4/x$备注,带逗号'
+
+def test_split_line():
+    assert split_line(' CCTV1 , http://1.2.3.4/x$tag \n') == ('CCTV1', 'http://1.2.3.4/x$tag')
+    assert split_line('央视频道,#genre#\n') is None
+    assert split_line('没有地址\n') is None
+
+def test_iter_txt_assigns_groups():
+    entries = list(iter_txt(TXT.splitlines(True)))
+    assert [entry.kind for entry in entries] == [HEADER, GENRE, CHANNEL, CHANNEL, BLANK, GENRE, CHANNEL, OTHER]
+    assert [entry.group for entry in entries if entry.kind == CHANNEL] == ['央视频道', '央视频道', '卫视频道']
+
+def test_iter_m3u():
+    entries = list(iter_m3u(M3U.splitlines(True)))
+    header, first, second = entries
+    assert header.kind == HEADER and header.attrs == {'x-tvg-url': 'http://epg.example/e.xml'}
+    assert first.name == 'CCTV-1 综合'
+    assert first.group == '央视,频道'
+    assert first.options == ['#EXTVLCOPT:http-user-agent=Mozilla']
+    assert first.url == 'http://1.2.3.4/live/1.m3u8'
+    assert second.attrs == {'tvg-name': '浙江卫视'}
+    assert second.group == '卫视'
+
+def test_iter_entries_detects_format():
+    assert [entry.kind for entry in iter_entries(['\n', '#EXTM3U\n'])] == [BLANK, HEADER]
+    assert [entry.kind for entry in iter_entries(['\n', 'CCTV1,http://a/b\n'])] == [BLANK, CHANNEL]
+
+def test_txt_round_trip(tmp_path):
+    path = str(tmp_path / 'list.txt')
+    count, written = write_playlist(path, iter_txt(TXT.splitlines(True)))
+    assert (count, written) == (3, True)
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == TXT
+    assert ''.join(format_txt(read_playlist(path))) == TXT
+
+def test_m3u_round_trip(tmp_path):
+    path = str(tmp_path / 'list.m3u')
+    count, _ = write_playlist(path, iter_entries(M3U.splitlines(True)))
+    assert count == 2
+    again = list(read_playlist(path))
+    assert [(e.name, e.url, e.group, e.options) for e in again if e.kind == CHANNEL] == [
+        ('CCTV-1 综合', 'http://1.2.3.4/live/1.m3u8', '央视,频道', ['#EXTVLCOPT:http-user-agent=Mozilla']),
+        ('浙江卫视', 'http://1.2.3.4/live/2.m3u8', '卫视', []),
+    ]
+    assert ''.join(format_m3u(again)) == ''.join(format_m3u(iter_entries(M3U.splitlines(True))))
+
+def test_txt_to_m3u_and_back_keeps_channels():
+    channels = [entry for entry in iter_txt(TXT.splitlines(True)) if entry.kind == CHANNEL]
+    m3u = list(format_m3u(channels))
+    assert m3u[0] == '#EXTM3U\n'
+    back = [(e.name, e.full_url, e.group) for e in iter_entries(m3u) if e.kind == CHANNEL]
+    assert back == [(e.name, e.full_url, e.group) for e in channels]
+    assert ''.join(format_txt(iter_entries(m3u))).startswith('央视频道,#genre#\nCCTV1,')
+
+def test_write_if_changed_keeps_the_file(tmp_path):
+    path = str(tmp_path / 'list.txt')
+    write_playlist(path, iter_txt(TXT.splitlines(True)))
+    os.utime(path, (0, 0))
+    _, written = write_playlist(path, iter_txt(TXT.splitlines(True)), if_changed=True)
+    assert not written
+    assert os.path.getmtime(path) == 0
+    assert not os.path.exists(path + '.tmp')
+
+def test_expand_template_dedups_by_channel_id_and_keeps_names():
+    from iptv_channels import ChannelIndex
+    template = iter_txt(['CCTV-1高清,rtp://239.1.1.1:5000\n', 'CCTV1,rtp://239.1.1.1:5000\n'])
+    expanded = list(expand_template(template, ['http://1.1.1.1:80'], channel=ChannelIndex(path=None).canonical))
+    assert [(e.name, e.url) for e in expanded] == [('CCTV-1高清', 'http://1.1.1.1:80/rtp/239.1.1.1:5000')]
+
+TEMPLATE = (
+    '央视频道,#genre#\n'
+    'CCTV1,rtp://239.1.1.1:5000\n'
+    'CCTV2,rtp://239.1.1.2:5000\n'
+    '卫视频道,#genre#\n'
+    '湖南卫视,rtp://239.1.1.3:5000\n'
+)
+
+def expand(servers, max_servers=None):
+    return ''.join(format_txt(expand_template(iter_txt(TEMPLATE.splitlines(True)), servers, max_servers)))
+
+def test_expand_template_follows_template_order_per_server():
+    # 与原脚本按服务器整体替换模板的结果相同：每个服务器按模板顺序展开，分类头随频道补写
+    assert expand(['http://1.1.1.1:8080', 'http://2.2.2.2:8080']) == (
+        TEMPLATE.replace('rtp://', 'http://1.1.1.1:8080/rtp/')
+        + TEMPLATE.replace('rtp://', 'http://2.2.2.2:8080/rtp/'))
+
+def test_expand_template_dedups_servers_by_host_port():
+    # 省略的默认端口和末尾的 / 不影响判断，同一服务器只展开一次
+    assert expand(['http://1.1.1.1', 'http://1.1.1.1:80/']) == TEMPLATE.replace('rtp://', 'http://1.1.1.1/rtp/')
+
+def test_expand_template_caps_servers_per_channel():
+    servers = ['http://1.1.1.1', 'http://2.2.2.2', 'http://3.3.3.3']
+    assert expand(servers, max_servers=1) == TEMPLATE.replace('rtp://', 'http://1.1.1.1/rtp/')
+    urls = [line.split(',')[1] for line in expand(servers, max_servers=2).splitlines() if 'rtp' in line]
+    assert [url.split('/rtp/')[0] for url in urls] == ['http://1.1.1.1'] * 3 + ['http://2.2.2.2'] * 3
+
+def test_append_playlist_adds_missing_newline(tmp_path):
+    path = tmp_path / 'list.txt'
+    path.write_text('CCTV1,http://1.1.1.1/rtp/239.1.1.1:5000', encoding='utf-8')
+    append_playlist(str(path), expand_template(iter_txt(['CCTV2,rtp://239.1.1.2:5000\n']), ['http://2.2.2.2']))
+    assert path.read_text(encoding='utf-8') == ('CCTV1,http://1.1.1.1/rtp/239.1.1.1:5000\n'
+                                                'CCTV2,http://2.2.2.2/rtp/239.1.1.2:5000\n')
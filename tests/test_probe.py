@@ -0,0 +1,52 @@
+# tests/test_probe.py
+# iptv_probe.TSAnalyzer：用 iptv_bench 的模拟TS流检查包结构解析
+from itertools import islice
+from iptv_bench import ts_packets, PAT_PACKET, VIDEO_PACKETS, VIDEO_PID
+from iptv_probe import TSAnalyzer, TS_MIN_VIDEO_PACKETS
+
+def stream(count):
+    return b''.join(islice(ts_packets(), count))
+
+def feed_chunks(analyzer, data, size):
+    for start in range(0, len(data), size):
+        analyzer.feed(data[start:start + size])
+
+def test_valid_stream_in_uneven_chunks():
+    analyzer = TSAnalyzer()
+    feed_chunks(analyzer, stream(TS_MIN_VIDEO_PACKETS + 10), 1000)
+    assert analyzer.has_pat and analyzer.has_pmt
+    assert analyzer.video_pid == VIDEO_PID
+    assert analyzer.keyframes == 1
+    assert analyzer.cc_errors == 0
+    assert analyzer.ok
+
+def test_resyncs_after_leading_garbage():
+    analyzer = TSAnalyzer()
+    feed_chunks(analyzer, b'\x00\x47' * 150 + stream(TS_MIN_VIDEO_PACKETS + 10), 4096)
+    assert analyzer.ok
+
+def test_too_few_video_packets():
+    analyzer = TSAnalyzer()
+    analyzer.feed(stream(TS_MIN_VIDEO_PACKETS // 2))
+    assert analyzer.has_pmt
+    assert not analyzer.ok
+
+def test_continuity_errors_fail():
+    # 视频包的连续计数器每次跳一格
+    data = stream(3) + b''.join(VIDEO_PACKETS[cc % 16] for cc in range(0, 4 * TS_MIN_VIDEO_PACKETS, 2))
+    analyzer = TSAnalyzer()
+    analyzer.feed(data)
+    assert analyzer.cc_errors > 0
+    assert not analyzer.ok
+
+def test_video_without_pmt_fails():
+    analyzer = TSAnalyzer()
+    analyzer.feed(PAT_PACKET + b''.join(VIDEO_PACKETS[cc % 16] for cc in range(2 * TS_MIN_VIDEO_PACKETS)))
+    assert analyzer.has_pat
+    assert analyzer.video_pid is None
+    assert not analyzer.ok
+
+def test_host_limiter_keys():
+    from iptv_probe import HostLimiter
+    assert HostLimiter.keys('http://1.2.3.4:8080/rtp/x') == ('1.2.3.0/24', '1.2.3.4:8080')
+    assert HostLimiter.keys('http://example.com/live') == ('example.com', 'example.com')
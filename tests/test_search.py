@@ -0,0 +1,104 @@
+# tests/test_search.py
+# iptv_search：查询计划的合并与拆分、搜索结果和缓存清理
+import os
+import time
+from iptv_cache import ResponseCache
+from iptv_search import (ServerSearch, QueryPlanner, FofaProvider, QuakeProvider, QuakeClient, SearchProvider,
+                         SearchError, rozhuk_query)
+
+def fake_client(total, max_pages=2):
+    """不联网的 QuakeClient：每页50条，条目的运营商依次为 电信、联通、空，记录发出的请求"""
+    client = QuakeClient('key', page_size=50, max_pages=max_pages, cache_dir=None, log=lambda *a: None)
+    client.bodies = []
+    isps = ['电信', '联通', None]
+
+    def post(body):
+        client.bodies.append(body)
+        start = body['start']
+        data = [{'ip': f'10.0.{start // 50}.{i}', 'port': 8080, 'location': {'isp': isps[i % 3]}}
+                for i in range(min(50, total - start))]
+        return {'code': 0, 'data': data, 'meta': {'pagination': {'total': total}}}
+
+    client._post = post
+    return client
+
+def requested(client, query):
+    return sorted(body['start'] for body in client.bodies if body['query'] == query)
+
+class FakeProvider(SearchProvider):
+    def __init__(self, name, hosts=None):
+        self.name = name
+        self.hosts = hosts
+
+    def search(self, province, isp):
+        if self.hosts is None:
+            raise SearchError('down')
+        return self.hosts
+
+def test_evict_removes_expired_responses(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.set('old', [1])
+    cache.set('new', [2])
+    old = cache._path('old')
+    os.utime(old, (time.time() - 3600, time.time() - 3600))
+    cache.evict()
+    assert not os.path.exists(old)
+    assert cache.get('new') == [2]
+
+def test_planner_evicts_provider_caches_after_a_run(tmp_path):
+    provider = FofaProvider(cache_dir=str(tmp_path), cache_ttl=60)
+    provider.search = lambda province, isp: ['1.2.3.4:80']
+    provider.cache.set('stale', 'x')
+    stale = provider.cache._path('stale')
+    os.utime(stale, (0, 0))
+    results = QueryPlanner(ServerSearch([provider]), log=lambda *a: None).run([('广东', '电信')])
+    assert results[('广东', '电信')] == ['http://1.2.3.4:80']
+    assert not os.path.exists(stale)
+
+def test_single_isp_is_queried_directly():
+    client = fake_client(total=250)
+    logs = []
+    results = QueryPlanner(ServerSearch([QuakeProvider(client)]), log=logs.append).run([('广东', '电信')])
+    # 只有一个运营商时不合并，按 省份 AND 运营商 查询，不按运营商过滤
+    assert requested(client, rozhuk_query('广东', '电信')) == [0, 50]
+    assert len(results[('广东', '电信')]) == 100
+    assert logs == ['1 个省份/运营商合并为 1 个查询，其中 0 个使用缓存，计划请求 1 次']
+
+def test_isps_of_one_province_share_a_query():
+    client = fake_client(total=250)
+    logs = []
+    planner = QueryPlanner(ServerSearch([QuakeProvider(client)]), log=logs.append)
+    pairs = [('广东', '电信'), ('广东', '联通'), ('广西', '电信'), ('广东', '电信')]
+    results = planner.run(pairs)
+    assert logs == ['3 个省份/运营商合并为 2 个查询，其中 0 个使用缓存，计划请求 2 次']
+    # 广东只查询一次，翻页上限按运营商数放大；广西单独按运营商查询
+    assert requested(client, rozhuk_query('广东')) == [0, 50, 100, 150]
+    assert requested(client, rozhuk_query('广西', '电信')) == [0, 50]
+    assert len(client.bodies) == 6
+    # 合并查询的结果按运营商在本地拆分，没有运营商信息的条目丢弃
+    telecom, unicom = results[('广东', '电信')], results[('广东', '联通')]
+    assert len(telecom) == len(unicom) == 4 * 17
+    assert all(int(url.split('.')[-1].split(':')[0]) % 3 == 0 for url in telecom)
+    assert all(int(url.split('.')[-1].split(':')[0]) % 3 == 1 for url in unicom)
+    assert len(results[('广西', '电信')]) == 100
+
+    # 同一批查询再次执行时使用本次运行内的结果，不再请求
+    logs.clear()
+    planner.run(pairs)
+    assert logs == ['3 个省份/运营商合并为 2 个查询，其中 2 个使用缓存，计划请求 0 次']
+    assert len(client.bodies) == 6
+
+def test_paging_stops_at_max_pages_or_total():
+    client = fake_client(total=10000, max_pages=3)
+    assert len(client.search('q')) == 150
+    assert requested(client, 'q') == [0, 50, 100]
+    client = fake_client(total=120, max_pages=10)
+    assert len(client.search('q')) == 120
+    assert requested(client, 'q') == [0, 50, 100]
+
+def test_backends_are_merged_and_failures_recorded():
+    search = ServerSearch([FakeProvider('a', ['1.1.1.1:80', '2.2.2.2:80']), FakeProvider('b'),
+                           FakeProvider('c', ['2.2.2.2:80', '3.3.3.3:80'])], log=lambda *a: None)
+    result = search.search_urls('广东', '电信')
+    assert result == ['http://1.1.1.1:80', 'http://2.2.2.2:80', 'http://3.3.3.3:80']
+    assert result.failed == ['b'] and not result.ok
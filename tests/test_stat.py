@@ -0,0 +1,63 @@
+# tests/test_stat.py
+# iptv_stat：udpxy 状态页解析，格式异常的页面不抛异常
+import pytest
+from iptv_stat import parse_stat_page, parse_rate
+
+# udpxy 的 /status 页面：第一张表为服务器信息，第二张表每个客户端一行
+UDPXY_STATUS = '''<html><head><meta http-equiv="content-type" content="text/html; charset=UTF-8">
+<title>udpxy status</title></head>
+<body>
+<table cellspacing="0" cellpadding="2" border="1">
+<tr><th>Server Process ID</th><th>Accepting clients on</th><th>Multicast address</th><th>Active clients</th></tr>
+<tr><td>1234</td><td>0.0.0.0:4022</td><td>0.0.0.0</td><td>3</td></tr>
+</table>
+<br>
+<table cellspacing="0" cellpadding="2" border="1">
+<tr><th>Process ID</th><th>Source</th><th>Destination</th><th>Throughput</th></tr>
+<tr><td>1301</td><td>239.3.1.241:8000</td><td>10.0.0.5:51234</td><td>7.93 Mb/s</td></tr>
+<tr><td>1302</td><td>239.3.1.241:8000</td><td>10.0.0.6:40112</td><td>7.90 Mb/s</td></tr>
+<tr><td>1307</td><td>239.3.1.129:8008</td><td>10.0.0.9:39011</td><td>2250 Kb/s</td></tr>
+</table>
+</body></html>
+'''
+
+@pytest.mark.parametrize('text, rate', [
+    ('7.93 Mb/s', 7.93e6),
+    ('4534 kbps', 4.534e6),
+    ('1200000 bps', 1.2e6),
+    ('1.5Gbit/s', 1.5e9),
+    ('no rate', 0.0),
+    ('1.2.3 Mb/s', 0.0),
+])
+def test_parse_rate(text, rate):
+    assert parse_rate(text) == pytest.approx(rate)
+
+def test_parse_udpxy_status_table():
+    stat = parse_stat_page(UDPXY_STATUS)
+    assert set(stat.groups) == {'239.3.1.241:8000', '239.3.1.129:8008'}
+    # 每个客户端一行，同一组播组的行累加
+    assert stat.groups['239.3.1.241:8000']['clients'] == 2
+    assert stat.groups['239.3.1.241:8000']['bitrate'] == pytest.approx(15.83e6)
+    assert stat.groups['239.3.1.129:8008'] == {'clients': 1, 'bitrate': pytest.approx(2.25e6)}
+    assert stat.clients == 3
+    assert stat.throughput == pytest.approx(18.08e6)
+    assert stat.is_streaming('239.3.1.129:8008')
+    assert not stat.is_streaming('239.3.1.1:8000')
+
+@pytest.mark.parametrize('body', [
+    '',
+    '<html><body><p>403 Forbidden',
+    '<table><tr><td>Total clients: x</td>',
+    '\x00\xff<<>>',
+])
+def test_unrecognized_page_is_empty(body):
+    stat = parse_stat_page(body)
+    assert (stat.clients, stat.throughput, stat.groups) == (0, 0.0, {})
+
+def test_truncated_page_keeps_complete_fields():
+    # 页面在一行中间被截断：能识别的组播地址照常计数，残缺的吞吐量按0计
+    stat = parse_stat_page(UDPXY_STATUS[:UDPXY_STATUS.index('7.90')] + '7.')
+    assert stat.groups['239.3.1.241:8000']['clients'] == 2
+    assert stat.groups['239.3.1.241:8000']['bitrate'] == pytest.approx(7.93e6)
+    assert '239.3.1.129:8008' not in stat.groups
+    assert stat.clients == 2
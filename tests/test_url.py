@@ -0,0 +1,42 @@
+# tests/test_url.py
+# iptv_url：地址规范化、host:port 和基于规范化地址的去重
+import pytest
+from iptv_url import canonical_url, canonical_line, host_port, UrlIndex
+
+@pytest.mark.parametrize('url, expected', [
+    ('HTTP://Example.COM:80/live', 'http://example.com/live'),
+    ('http://1.2.3.4:8080/rtp/239.1.1.1:5000$4M-bestzb', 'http://1.2.3.4:8080/rtp/239.1.1.1:5000'),
+    ('https://host:443', 'https://host/'),
+    ('rtsp://host:554/ch?b=2&a=1', 'rtsp://host/ch?a=1&b=2'),
+    ('http://user:pw@Host:8080/x', 'http://user:pw@host:8080/x'),
+    ('http://[2409:8087::1]:80/x', 'http://[2409:8087::1]/x'),
+    ('not a url $tag', 'not a url'),
+])
+def test_canonical_url(url, expected):
+    assert canonical_url(url) == expected
+
+def test_canonical_url_is_idempotent():
+    url = canonical_url('HTTP://Host:8080/a?z=1&y=2$备注')
+    assert canonical_url(url) == url
+
+@pytest.mark.parametrize('url, expected', [
+    ('http://1.2.3.4/rtp/239.1.1.1:5000', '1.2.3.4:80'),
+    ('http://1.2.3.4:8888/x$tag', '1.2.3.4:8888'),
+    ('1.2.3.4:4022', '1.2.3.4:4022'),
+    ('https://Host/x', 'host:443'),
+])
+def test_host_port(url, expected):
+    assert host_port(url) == expected
+
+def test_canonical_line_ignores_spelling_of_the_url():
+    assert (canonical_line('CCTV1,HTTP://1.2.3.4:80/live$高清\n')
+            == canonical_line('CCTV1,http://1.2.3.4/live\n'))
+    assert canonical_line('央视频道,#genre#\n') == '央视频道,#genre#'
+
+def test_url_index_dedups_equivalent_urls():
+    index = UrlIndex()
+    assert index.add('http://1.2.3.4:80/live', 'first')
+    assert not index.add('HTTP://1.2.3.4/live$tag', 'second')
+    assert 'http://1.2.3.4/live' in index
+    assert index.get('http://1.2.3.4/live') == 'first'
+    assert len(index) == 1
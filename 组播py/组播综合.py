@@ -6,586 +6,334 @@
 #提取检测后的频道进行分类输出优选组播源
 #提取优选组播源中分类追加到自用直播源
 #后续整理
+#以上各步为流水线阶段 collect → dedup → validate → merge → sort → hotel-check → classify → dedup-final → publish
+#可用 --stages 单独运行某些阶段, --keep 保留各阶段输出
 #没了！！！！！！！！！！！！
 import time
-from datetime import datetime, timedelta  # 确保 timedelta 被导入
-import concurrent.futures
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from concurrent.futures import ThreadPoolExecutor
+START_TIME = time.perf_counter()
+# OpenCV、OpenCC、拼音只在用到的阶段导入,启动时不加载
+from datetime import datetime
 import requests
 import re
 import os
-import threading
-from queue import Queue
-import queue
-from datetime import datetime
-import replace
-import fileinput
-from tqdm import tqdm
-from pypinyin import lazy_pinyin
-from opencc import OpenCC
-import base64
-import cv2
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
-from translate import Translator  # 导入Translator类,用于文本翻译
-
-######################################################################################################################
-# 获取rtp目录下的文件名,组播IP采集
-files = os.listdir('rtp')
-files_name = []
-# 去除后缀名并保存至provinces_isps
-for file in files:
-    name, extension = os.path.splitext(file)
-    files_name.append(name)
-#忽略不符合要求的文件名
-provinces_isps = [name for name in files_name if name.count('_') == 1]
-print(f"本次查询：{provinces_isps}的组播节目") 
-keywords = []
-for province_isp in provinces_isps:
-    # 读取文件并删除空白行
-    try:
-        with open(f'rtp/{province_isp}.txt', 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-            lines = [line.strip() for line in lines if line.strip()]
-        # 获取第二行中以包含 "rtp://" 的值作为 mcast
-        if lines:
-            first_line = lines[1]
-            if "rtp://" in first_line:
-                mcast = first_line.split("rtp://")[1].split(" ")[0]
-                keywords.append(province_isp + "_" + mcast)
-    except FileNotFoundError:
-    # 如果文件不存在,则捕获 FileNotFoundError 异常并打印提示信息
-        print(f"文件 '{province_isp}.txt' 不存在. 跳过此文件.")
-requested_urls = set()  # 用于记录已经请求过的地址
-parse_count = {}  # 用于记录每个 URL 的解析次数
-######################################################################################################################
-# 获取rtp目录下的文件名,组播IP采集
-files = os.listdir('rtp')
-files_name = []
-# 去除后缀名并保存至provinces_isps
-for file in files:
-    name, extension = os.path.splitext(file)
-    files_name.append(name)
-#忽略不符合要求的文件名
-provinces_isps = [name for name in files_name if name.count('_') == 1]
-print(f"本次查询：{provinces_isps}的组播节目") 
-keywords = []
-for province_isp in provinces_isps:
-    # 读取文件并删除空白行
-    try:
-        with open(f'rtp/{province_isp}.txt', 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-            lines = [line.strip() for line in lines if line.strip()]
-        # 获取第二行中以包含 "rtp://" 的值作为 mcast
-        if lines:
-            first_line = lines[1]
-            if "rtp://" in first_line:
-                mcast = first_line.split("rtp://")[1].split(" ")[0]
-                keywords.append(province_isp + "_" + mcast)
-    except FileNotFoundError:
-    # 如果文件不存在,则捕获 FileNotFoundError 异常并打印提示信息
-        print(f"文件 '{province_isp}.txt' 不存在. 跳过此文件.")
-requested_urls = set()  # 用于记录已经请求过的地址
-parse_count = {}  # 用于记录每个 URL 的解析次数
-for keyword in keywords:
-    province, isp, mcast = keyword.split("_")
-    # 将省份转成英文小写
-    # 根据不同的isp设置不同的org值
-    if province == "北京" and isp == "联通":
-        isp_en = "cucc"
-        org = "China Unicom Beijing Province NeTwork"
-    elif isp == "联通":
-        isp_en = "cucc"
-        org = "CHINA UNICOM China169 Backbone"
-    elif isp == "电信":
-        org = "Chinanet"
-        isp_en = "ctcc"
-    elif isp == "移动":
-        org = "China Mobile communications corporation"
-        isp_en = "cmcc"
-
+import sys
+import argparse
+# 公共检测模块位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from iptv_probe import (make_probe, probe_ts, probe_criteria, validate_lines, host_limiter, HostLimiter,
+                        PROBE_WORKERS, PROBE_MODE)
+from iptv_cache import ProbeCache
+from iptv_search import build_search, QueryPlanner
+from iptv_pipeline import Pipeline, PipelineError, Deduper, text_lines
+from iptv_url import UrlIndex, canonical_line, host_port
+from iptv_manifest import Manifest, content_hash, write_if_changed
+from iptv_imports import import_report
+from iptv_classify import Classifier, genre_header
+from iptv_collate import PinyinCollator
+from iptv_convert import t2s_lines
+from iptv_channels import ChannelIndex
+from iptv_catalog import ChannelCatalog, as_catalog
+from iptv_playlist import CHANNEL, BLANK, read_playlist, expand_template, append_playlist
+
+# 跨运行共享的检测结果缓存,同一ip:port在有效期内不重复检测
+probe_cache = ProbeCache()
+# 搜索层:默认抓取FOFA网页,设置QUAKE_API_KEY环境变量时同时使用Quake,结果合并去重
+SEARCH_BACKENDS = ["fofa", "quake"] if os.environ.get("QUAKE_API_KEY") else ["fofa"]
+server_search = build_search(SEARCH_BACKENDS, os.environ.get("QUAKE_API_KEY"))
+
+# 流水线各阶段之间在内存中传递数据,设置保留目录时才写出每个阶段的结果
+pipeline = Pipeline(keep_dir=os.environ.get('IPTV_KEEP_DIR'))
+# 两次检测共享的IP检测结果
+detected_ips = {}
+# 模板和播放列表的内容哈希清单,未变化且未过期的省份不重新搜索,播放列表不重新检测
+manifest = Manifest()
+# 频道名别名表,CCTV-1高清、CCTV1 综合等统一为CCTV1,同一频道在检测前合并
+channels = ChannelIndex()
+
+# ================= 分类规则 =================
+# 每组第一个为分类名,其余为关键词;提取结果小于最小字节数的分类丢弃
+CATEGORIES = [
+    "央视频道&爬虫, CCTV, 8K, 4K, 4k",
+    "卫视频道&爬虫, 卫视, CHC, 凤凰, 星空",
+    "央视数字&爬虫, 第一剧场, 怀旧剧场, 风云音乐, 风云剧场, 欢笑剧场, 都市剧场, 高清电影, 家庭影院, 动作电影, 影迷, 峨眉, 重温, 女性, 地理",
+    "数字频道&爬虫, 爱动漫, SiTV, 爱怀旧, 爱经典, 爱科幻, 爱青春, 爱悬疑, 爱幼教, 爱院线",
+    "省级频道&爬虫, 湖南, 北京",
+]
+CATEGORY_MIN_BYTES = 200
+# 发布时排除的关键词,以及即使命中排除关键词也保留的例外关键词
+excluded_keywords = ['关键词3']
+exception_keywords = ['4K', '8K', '例外关键词']
+# 发布前对整个 iptv_list.txt 做的频道名替换(含远程直播源)
+NAME_REPLACEMENTS = [("CCTV164K", "CCTV16-4K"), ("CCTV4K", "CCTV-4K")]
+# 自用直播源
+IPTV_LIST_URL = "https://raw.bgithub.xyz/frxz751113/AAAAA/main/IPTV/汇汇.txt"
+# 每个频道最多展开的服务器数,0为不限制
+MAX_SERVERS_PER_CHANNEL = int(os.environ.get('IPTV_MAX_SERVERS_PER_CHANNEL', 0))
+# ============================================
+
+def read_keywords():
+    """获取rtp目录下 省份_运营商.txt 的文件名及其中的组播地址"""
+    provinces_isps = [os.path.splitext(file)[0] for file in os.listdir('rtp')]
+    #忽略不符合要求的文件名
+    provinces_isps = [name for name in provinces_isps if name.count('_') == 1]
+    print(f"本次查询：{provinces_isps}的组播节目")
+    keywords = []
+    for province_isp in provinces_isps:
+        # 读取文件并跳过空白行
+        try:
+            entries = [entry for entry in read_playlist(f'rtp/{province_isp}.txt') if entry.kind != BLANK]
+            # 获取第二行中以包含 "rtp://" 的值作为 mcast
+            if len(entries) > 1:
+                second = entries[1]
+                if second.kind == CHANNEL and "rtp://" in second.url:
+                    mcast = second.url.split("rtp://")[1].split(" ")[0]
+                    keywords.append(province_isp + "_" + mcast)
+        except FileNotFoundError:
+            # 如果文件不存在,则捕获 FileNotFoundError 异常并打印提示信息
+            print(f"文件 '{province_isp}.txt' 不存在. 跳过此文件.")
+    return keywords
+
+def check_server(url, mcast):
+    """检测服务器能否播放该组播地址,结果写入检测缓存"""
     current_time = datetime.now()
-    timeout_cnt = 0
-    result_urls = set()
-    should_continue_while = True
-    while should_continue_while and len(result_urls) == 0 and timeout_cnt <= 2:
+    video_url = url + "/rtp/" + mcast
+    cache_key = ProbeCache.key(url, mcast)
+    # ts模式按默认超时检查包结构,其他模式只看能否读到分辨率
+    criteria = probe_criteria('ts', timeout=5) if PROBE_MODE == 'ts' else 'resolution'
+    cached = probe_cache.get(cache_key, criteria)
+    if cached is not None:
+        print(f"{current_time} {video_url} 使用缓存结果: {cached}")
+        return cached == 'ok'
+    # TS模式只检查包结构,不启动解码器
+    if PROBE_MODE == 'ts':
+        ok = probe_ts(video_url)
+        if not ok:
+            print(f"{current_time} {video_url} 无效")
+        probe_cache.set(cache_key, ok, criteria)
+        return ok
+    # 用OpenCV读取视频,经限流器避免同一服务器被同时大量拉流
+    import cv2  # 仅解码模式需要OpenCV
+    with host_limiter.slot(video_url):
+        cap = cv2.VideoCapture(video_url)
         try:
-            search_url = 'https://fofa.info/result?qbase64='
-            search_txt = f'"Rozhuk" && country="CN" && region="{province}"'  # && org="{org}"
-            # 将字符串编码为字节流
-            bytes_string = search_txt.encode('utf-8')
-            # 使用base64进行编码
-            search_txt = base64.b64encode(bytes_string).decode('utf-8')
-            search_url += search_txt
-            if search_url not in requested_urls:  # 仅当地址未被请求过时才进行请求
-                print(f"{current_time} 查询运营商 : {province}{isp},查询网址 : {search_url}")
-                response = requests.get(search_url, timeout=5)
-                # 处理响应
-                response.raise_for_status()
-                # 检查请求是否成功
-                html_content = response.text
-                requested_urls.add(search_url)  # 将请求过的地址添加到记录集合中
-
-            if search_url not in parse_count:
-                parse_count[search_url] = 0
-            if parse_count[search_url] < 2:
-                # 使用BeautifulSoup解析网页内容
-                html_soup = BeautifulSoup(html_content, "html.parser")
-                # print(f"{current_time} html_content:{html_content}")
-                # 查找所有符合指定格式的网址
-                # 设置匹配的格式,如http://8.8.8.8:8888
-                pattern = r"http://\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+"
-                urls_all = re.findall(pattern, html_content)
-                # 去重得到唯一的URL列表
-                result_urls = set(urls_all)
-                print(f"{current_time} result_urls:{result_urls}")
-                parse_count[search_url] += 1
+            # 检查视频是否成功打开
+            if not cap.isOpened():
+                print(f"{current_time} {video_url} 无效")
+                ok = False
             else:
-                print(f"{current_time} 已达到对 {search_url} 的最大解析次数（2次）")
-                should_continue_while = False  # 当达到最大解析次数，修改循环条件
-        except (requests.Timeout, requests.RequestException) as e:
-            timeout_cnt += 1
-            print(f"{current_time} [{province}]搜索请求发生超时,异常次数：{timeout_cnt}")
-            if timeout_cnt > 2:
-                print(f"{current_time} 搜索IPTV频道源[{province}{isp}],超时次数过多：{timeout_cnt} 次,停止处理")
-                break
-
-    valid_ips = []
-    # 遍历所有视频链接
-    for url in result_urls:
-        video_url = url + "/rtp/" + mcast
-        # 用OpenCV读取视频
-        cap = cv2.VideoCapture(video_url)
-        # 检查视频是否成功打开
-        if not cap.isOpened():
-            print(f"{current_time} {video_url} 无效")
-        else:
-            # 读取视频的宽度和高度
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            print(f"{current_time} {video_url} 的分辨率为 {width}x{height}")
-            # 检查分辨率是否大于0
-            if width > 0 and height > 0:
-                valid_ips.append(url)
-            # 关闭视频流
+                # 读取视频的宽度和高度,分辨率大于0即有效
+                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                print(f"{current_time} {video_url} 的分辨率为 {width}x{height}")
+                ok = width > 0 and height > 0
+        finally:
             cap.release()
-
-    if valid_ips:
-        # 生成节目列表 省份运营商.txt
-        rtp_filename = f'rtp/{province}_{isp}.txt'
-        txt_filename = f'playlist/{province}{isp}.txt'
-        with open(rtp_filename, 'r', encoding='utf-8') as file:
-            data = file.read()
-        with open(txt_filename, 'a') as new_file:  # 以追加形式写入
-            for url in valid_ips:
-                new_data = data.replace("rtp://", f"{url}/rtp/")
-                new_file.write(new_data)
-        print(f'已生成播放列表,保存至{txt_filename}')
-
-print('对playlist文件夹里面的所有txt文件进行去重处理')
-def remove_duplicates_keep_order(folder_path):
-    for filename in os.listdir(folder_path):
+    probe_cache.set(cache_key, ok, criteria)
+    return ok
+
+@pipeline.stage('collect')
+def collect(_):
+    """搜索有效服务器,生成的节目追加到 playlist 中对应的 省份运营商.txt"""
+    os.makedirs('playlist', exist_ok=True)
+    keywords = read_keywords()
+    fresh = [keyword for keyword in keywords if manifest.is_fresh('rtp/{}_{}.txt'.format(*keyword.split("_")[:2]))]
+    print(f"模板未变化且结果未过期,跳过 {len(fresh)} 个: {fresh}")
+    keywords = [keyword for keyword in keywords if keyword not in fresh]
+    # 按省份合并查询,执行前报告计划请求数,缓存有效期内的查询不再请求
+    search_results = QueryPlanner(server_search).run([tuple(keyword.split("_")[:2]) for keyword in keywords])
+    for keyword in keywords:
+        province, isp, mcast = keyword.split("_")
+        result = search_results[(province, isp)]
+        result_urls = set(result)
+        print(f"{datetime.now()} result_urls:{result_urls}")
+        valid_ips = [url for url in result_urls if check_server(url, mcast)]
+        if valid_ips:
+            # 生成节目列表 省份运营商.txt,模板中同一频道(按规范频道名)的不同写法只展开一次,频道名保持原样;
+            # 展开结果边生成边追加到文件,不在内存中拼出全部节目
+            template = read_playlist(f'rtp/{province}_{isp}.txt')
+            append_playlist(f'playlist/{province}{isp}.txt',
+                            expand_template(template, valid_ips, MAX_SERVERS_PER_CHANNEL or None,
+                                            channels.canonical))
+            print(f'已生成播放列表 {province}{isp}.txt')
+        # 搜索失败或没有有效服务器时不记入清单,下次运行重新搜索;清单在检测阶段写回播放列表后保存
+        if not result.ok:
+            print(f"{province}{isp} 搜索后端失败: {', '.join(result.failed)},下次运行重新搜索")
+        elif valid_ips:
+            manifest.mark(f'rtp/{province}_{isp}.txt')
+
+    playlists = {}
+    for filename in os.listdir('playlist'):
         if filename.endswith('.txt'):
-            file_path = os.path.join(folder_path, filename)
-            lines = set()
-            unique_lines = []
-            with open(file_path, 'r', encoding='utf-8') as file:
-                for line in file:
-                    if line not in lines:
-                        unique_lines.append(line)
-                        lines.add(line)
-            # 将保持顺序的去重后的内容写回原文件
-            with open(file_path, 'w', encoding='utf-8') as file:
-                file.writelines(unique_lines)
-# 使用示例
-folder_path = 'playlist'  # 替换为你的文件夹路径
-remove_duplicates_keep_order(folder_path)
-print('文件去重完成！移除存储的旧文件！')
-
-######################################################
-#####################################################
-######################################################################################################################
-
-#################################################################################
-###############检测playlist文件夹内所有txt文件内的组播
-###############检测playlist文件夹内所有txt文件内的组播
-###############检测playlist文件夹内所有txt文件内的组播
-
-import os
-import cv2
-import time
-from tqdm import tqdm
-import sys
-
-# 初始化字典以存储IP检测结果
-detected_ips = {}
-
-def get_ip_key(url):
-    """从URL中提取IP地址，并构造一个唯一的键"""
-    start = url.find('://') + 3
-    end = url.find('/', start)
-    if end == -1:
-        end = len(url)
-    return url[start:end].strip()
-
-# 设置固定的文件夹路径
-folder_path = 'playlist'
+            with open(os.path.join('playlist', filename), 'r', encoding='utf-8') as file:
+                playlists[filename] = file.readlines()
+    return playlists
 
-# 确保文件夹路径存在
-if not os.path.isdir(folder_path):
-    print("指定的文件夹不存在。")
-    sys.exit()
+@pipeline.stage('dedup')
+def dedup_playlists(playlists):
+    """对每个播放列表按行去重,保持原顺序;地址按规范形式比较,默认端口和$备注不影响去重"""
+    print('对playlist文件夹里面的所有txt文件进行去重处理')
+    return {filename: list(Deduper().filter(lines, key=canonical_line)) for filename, lines in playlists.items()}
 
-# 遍历文件夹中的所有.txt文件
-for filename in os.listdir(folder_path):
-    if filename.endswith('.txt'):
-        file_path = os.path.join(folder_path, filename)
-        # 读取文件内容
-        with open(file_path, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-
-        # 准备写回文件
-        with open(file_path, 'w', encoding='utf-8') as output_file:
-            # 使用 tqdm 显示进度条
-            for line in tqdm(lines, total=len(lines), desc=f"Processing {filename}"):
-                parts = line.split(',', 1)
-                if len(parts) >= 2:
-                    channel_name, url = parts
-                    channel_name = channel_name.strip()
-                    url = url.strip()
-                    ip_key = get_ip_key(url)
-                    
-                    # 检查IP是否已经被检测过
-                    if ip_key in detected_ips:
-                        # 如果之前检测成功，则写入该行
-                        if detected_ips[ip_key]['status'] == 'ok':
-                            output_file.write(line)
-                        continue  # 无论之前检测结果如何，都不重新检测
-                    
-                    # 初始化帧计数器和成功标志
-                    frame_count = 0
-                    success = False
-                    # 尝试打开视频流
-                    cap = cv2.VideoCapture(url)
-                    start_time = time.time()
-                    while (time.time() - start_time) < 3:
-                        ret, frame = cap.read()
-                        if not ret:
-                            break
-                        frame_count += 1
-                        # 如果在3秒内读取到30帧以上，设置成功标志
-                        if frame_count >= 30:
-                            success = True
-                            break
-                    cap.release()
-                    
-                    # 根据检测结果更新字典
-                    if success:
-                        detected_ips[ip_key] = {'status': 'ok'}
-                        output_file.write(line)
-                    else:
-                        detected_ips[ip_key] = {'status': 'fail'}
-
-# 打印检测结果
-for ip_key, result in detected_ips.items():
-    print(f"IP Key: {ip_key}, Status: {result['status']}")
-
-
-######################################################################################################################
-######################################################################################################################
-
-#  获取远程直播源文件,打开文件并输出临时文件
-url = "https://raw.bgithub.xyz/frxz751113/AAAAA/main/IPTV/汇汇.txt"          #源采集地址
-r = requests.get(url)
-open('iptv_list.txt','wb').write(r.content)         #打开源文件并临时写入
-
-
-#简体转繁体#
-#简体转繁体
-# 创建一个OpenCC对象,指定转换的规则为繁体字转简体字
-converter = OpenCC('t2s.json')#繁转简
-#converter = OpenCC('s2t.json')#简转繁
-# 打开txt文件
-with open('iptv_list.txt', 'r', encoding='utf-8') as file:
-    traditional_text = file.read()
-# 进行繁体字转简体字的转换
-simplified_text = converter.convert(traditional_text)
-# 将转换后的简体字写入txt文件
-with open('iptv_list.txt', 'w', encoding='utf-8') as file:
-    file.write(simplified_text)
-
-
-
-
-#任务结束,删除不必要的过程文件#
-files_to_remove = ['组播源.txt', "TW.txt", "a.txt", "主.txt", "b.txt", "b1.txt", "港澳.txt"]
-for file in files_to_remove:
-    if os.path.exists(file):
-        os.remove(file)
-    else:              # 如果文件不存在,则提示异常并打印提示信息
-        print(f"文件 {file} 不存在,跳过删除。")
-print("任务运行完毕,分类频道列表可查看文件夹内iptv_list.txt文件！")
-
-
-
-######################################################################################################################
-######################################################################################################################
-######################################################################################################################
-######################################################################################################################
-######################################################################################################################
-# 合并自定义频道文件,优选源整理
-# 假设filter_files是一个自定义函数，它返回playlist目录下所有.txt文件的路径列表
-def filter_files(directory, extension):
-    return [f for f in os.listdir(directory) if f.endswith(extension)]
-# 获取playlist目录下的所有.txt文件
-files = filter_files('playlist', '.txt')
-# 打开输出文件
-with open("4.txt", "w", encoding="utf-8") as output:
-    for file_path in files:
-        with open(os.path.join('playlist', file_path), 'r', encoding="utf-8") as file:
-            content = file.read()
-            output.write(content + '\n\n')
-print("电视频道成功写入")
-    
-#################文本排序
-# 打开原始文件读取内容,并写入新文件
-with open('4.txt', 'r', encoding='utf-8') as file:
-    lines = file.readlines()
-# 定义一个函数,用于提取每行的第一个数字
-def extract_first_number(line):
-    match = re.search(r'\d+', line)
-    return int(match.group()) if match else float('inf')
-# 对列表中的行进行排序
-# 按照第一个数字的大小排列,如果不存在数字则按中文拼音排序
-sorted_lines = sorted(lines, key=lambda x: (not 'CCTV' in x, extract_first_number(x) if 'CCTV' in x else lazy_pinyin(x.strip())))
-# 将排序后的行写入新的utf-8编码的文本文件,文件名基于原文件名
-output_file_path = "sorted_" + os.path.basename(file_path)
-# 写入新文件
-with open('5.txt', "w", encoding="utf-8") as file:
-    for line in sorted_lines:
-        file.write(line)
-print(f"文件已排序并保存为: {output_file_path}")
-import cv2
-import time
-from tqdm import tqdm
-# 初始化酒店源字典
-detected_ips = {}
-# 存储文件路径
-file_path = "5.txt"
-output_file_path = "2.txt"
 def get_ip_key(url):
-    """从URL中提取IP地址,并构造一个唯一的键"""
-    # 找到'//'到第三个'.'之间的字符串
-    start = url.find('://') + 3  # '://'.length 是 3
-    end = start
-    dot_count = 0
-    while dot_count < 3:
-        end = url.find('.', end)
-        if end == -1:  # 如果没有找到第三个'.',就结束
-            break
-        dot_count += 1
-    return url[start:end] if dot_count == 3 else None
-# 打开输入文件和输出文件
-with open(file_path, 'r', encoding='utf-8') as file:
-    lines = file.readlines()
-# 获取总行数用于进度条
-total_lines = len(lines)
-# 写入通过检测的行到新文件
-with open(output_file_path, 'w', encoding='utf-8') as output_file:
-    # 使用tqdm显示进度条
-    for i, line in tqdm(enumerate(lines), total=total_lines, desc="Processing", unit='line'):
-        # 检查是否包含 'genre'
-        if 'genre' in line:
-            output_file.write(line)
+    """从URL中提取 ip:port 作为检测的唯一键,省略的默认端口补全"""
+    return host_port(url)
+
+@pipeline.stage('validate')
+def validate_playlists(playlists):
+    """检测播放列表中的每个服务器,同一文件内并发检测,按原顺序写回 playlist
+
+    上次检测后内容未变且未过期的播放列表原样保留,不检测也不重写
+    """
+    validated = {}
+    for filename, lines in playlists.items():
+        name = f'playlist/{filename}'
+        if manifest.is_fresh(name, content_hash(''.join(lines))):
+            validated[filename] = lines
             continue
-        # 分割频道名称和URL,并去除空白字符
-        parts = line.split(',', 1)
-        if len(parts) == 2:
-            channel_name, url = parts
-            channel_name = channel_name.strip()
-            url = url.strip()
-            # 构造IP键
-            ip_key = get_ip_key(url)
-            if ip_key and ip_key in detected_ips:
-                # 如果IP键已存在,根据之前的结果决定是否写入新文件
-                if detected_ips[ip_key]['status'] == 'ok':
-                    output_file.write(line)
-            elif ip_key:  # 新IP键,进行检测
-                # 进行检测
-                cap = cv2.VideoCapture(url)
-                start_time = time.time()
-                frame_count = 0
-                # 尝试捕获10秒内的帧
-                while frame_count < 240 and (time.time() - start_time) < 10:
-                    ret, frame = cap.read()
-                    if not ret:
-                        break
-                    frame_count += 1
-                # 释放资源
-                cap.release()
-                # 根据捕获的帧数判断状态并记录结果
-                if frame_count >= 240:  #10秒内超过230帧则写入
-                    detected_ips[ip_key] = {'status': 'ok'}
-                    output_file.write(line)  # 写入检测通过的行
-                else:
-                    detected_ips[ip_key] = {'status': 'fail'}
-# 打印酒店源
-for ip_key, result in detected_ips.items():
-    print(f"IP Key: {ip_key}, Status: {result['status']}")
-########################################################################################################################################################################################
-################################################################定义关键词分割规则
-def check_and_write_file(input_file, output_file, keywords):
-    # 使用 split(', ') 来分割关键词
-    keywords_list = keywords.split(', ')
-    pattern = '|'.join(re.escape(keyword) for keyword in keywords_list)
-    # 读取输入文件并提取包含关键词的行
-    extracted_lines = []
-    with open(input_file, 'r', encoding='utf-8') as file:
-        for line in file:
-          if "genre" not in line:
-            if re.search(pattern, line):
-                extracted_lines.append(line)
-    # 如果至少提取到一行,写入头部信息和提取的行到输出文件
-    if extracted_lines:
-        with open(output_file, 'w', encoding='utf-8') as out_file:
-            out_file.write(f"{keywords_list[0]},#genre#\n")  # 写入头部信息
-            out_file.writelines(extracted_lines)  # 写入提取的行
-        # 获取头部信息的大小
-        header_size = len(f"{keywords_list[0]},#genre#\n")
-        
-        # 检查文件的总大小
-        file_size = os.path.getsize(output_file)
-        
-        # 如果文件大小小于30字节（假设的最小文件大小）,删除文件
-        if file_size < 200:
-            os.remove(output_file)
-            print(f"文件只包含头部信息,{output_file} 已被删除。")
-        else:
-            print(f"文件已提取关键词并保存为: {output_file}")
-    else:
-        print(f"未提取到关键词,不创建输出文件 {output_file}。")
-
-# 按类别提取关键词并写入文件
-check_and_write_file('2.txt',  'a.txt',  keywords="央视频道&爬虫, CCTV, 8K, 4K, 4k")
-check_and_write_file('2.txt',  'b.txt',  keywords="卫视频道&爬虫, 卫视, CHC, 凤凰, 星空")
-check_and_write_file('2.txt',  'c0.txt',  keywords="央视数字&爬虫, 第一剧场, 怀旧剧场, 风云音乐, 风云剧场, 欢笑剧场, 都市剧场, 高清电影, 家庭影院, 动作电影, 影迷, 峨眉, 重温, 女性, 地理")
-check_and_write_file('2.txt',  'c.txt',  keywords="数字频道&爬虫, 爱动漫, SiTV, 爱怀旧, 爱经典, 爱科幻, 爱青春, 爱悬疑, 爱幼教, 爱院线")
-check_and_write_file('2.txt',  'd.txt',  keywords="省级频道&爬虫, 湖南, 北京")
-###############################################################################################################################################################################################################################
-##############################################################对生成的文件进行合并
-file_contents = []
-file_paths = ["a.txt", "b.txt", "c0.txt", "c.txt", "d.txt"]  # 替换为实际的文件路径列表
-for file_path in file_paths:
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding="utf-8") as file:
-            content = file.read()
-            file_contents.append(content)
-    else:                # 如果文件不存在,则提示异常并打印提示信息
-        print(f"文件 {file_path} 不存在,跳过")
-# 写入合并后的文件
-with open("去重.txt", "w", encoding="utf-8") as output:
-    output.write('\n'.join(file_contents))
-###############################################################################################################################################################################################################################
-##############################################################对生成的文件进行网址及文本去重复,避免同一个频道出现在不同的类中
-def remove_duplicates(input_file, output_file):
-    # 用于存储已经遇到的URL和包含genre的行
-    seen_urls = set()
-    seen_lines_with_genre = set()
-    # 用于存储最终输出的行
-    output_lines = []
-    # 打开输入文件并读取所有行
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-        print("去重前的行数：", len(lines))
-        # 遍历每一行
-        for line in lines:
-            # 使用正则表达式查找URL和包含genre的行,默认最后一行
-            urls = re.findall(r'[https]?[http]?[P2p]?[mitv]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', line)
-            genre_line = re.search(r'\bgenre\b', line, re.IGNORECASE) is not None
-            # 如果找到URL并且该URL尚未被记录
-            if urls and urls[0] not in seen_urls:
-                seen_urls.add(urls[0])
-                output_lines.append(line)
-            # 如果找到包含genre的行,无论是否已被记录,都写入新文件
-            if genre_line:
-                output_lines.append(line)
-    # 将结果写入输出文件
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.writelines(output_lines)
-    print("去重后的行数：", len(output_lines))
-# 使用方法
-remove_duplicates('去重.txt', '分类.txt')
-
-#从整理好的文本中进行特定关键词替换以规范频道名#
-for line in fileinput.input("分类.txt", inplace=True):   #打开临时文件原地替换关键字
-    line = line.replace("CCTV1,", "CCTV1,")  
-
-    print(line, end="")   
-
-
-# 打开文档并读取所有行 
-with open('分类.txt', 'r', encoding="utf-8") as file:
- lines = file.readlines()
-# 使用列表来存储唯一的行的顺序 
-unique_lines = []
-seen_lines = set()
-# 遍历每一行，如果是新的就加入unique_lines
-for line in lines:
-    if line not in seen_lines:
-        unique_lines.append(line)
-        seen_lines.add(line)
-
-# 将唯一的行写入第一个文件
-with open('组播优选.txt', 'w', encoding="utf-8") as file:
-    for line in unique_lines:
-        file.write(line)  # 确保每行后面有换行符 + '\n'
-# 将唯一的行追加到第二个文件
-#with open('iptv_list.txt', 'a', encoding="utf-8") as file:
-    #for line in unique_lines:
-        #file.write(line)  # 确保每行后面有换行符 + '\n'
-
-# 定义要排除的关键词列表
-excluded_keywords = [ '关键词3']
-# 定义例外关键词列表，即使它们在排除列表中，也应该被保留
-exception_keywords = ['4K', '8K', '例外关键词']
-# 打开原始文本文件并读取内容
-with open('组播优选.txt', 'r', encoding='utf-8') as file:
-    lines = file.readlines()
-# 过滤掉包含关键词的行，但是允许含有例外关键词的行
-filtered_lines = []
-for line in lines:
-    # 检查行是否包含排除关键词
-    contains_excluded = any(keyword in line for keyword in excluded_keywords)
-    # 检查行是否包含例外关键词
-    contains_exception = any(keyword in line for keyword in exception_keywords)
-    # 如果行包含排除关键词，但是不包含例外关键词，则过滤掉该行
-    if contains_excluded and not contains_exception:
-        continue
-    else:
-        # 如果行不包含排除关键词，或者同时包含排除关键词和例外关键词，则保留该行
-        filtered_lines.append(line)
-# 将过滤后的内容追加写入新的文本文件
-with open('iptv_list.txt', 'a', encoding='utf-8') as file:
-    file.writelines(filtered_lines)
-
-#从整理好的文本中进行特定关键词替换以规范频道名#
-for line in fileinput.input("iptv_list.txt", inplace=True):   #打开临时文件原地替换关键字
-    line = line.replace("CCTV164K", "CCTV16-4K")  
-    line = line.replace("CCTV4K", "CCTV-4K")  
-    print(line, end="")   
-
-
-
-################################################################################################任务结束,删除不必要的过程文件
-files_to_remove = ['去重.txt', '分类.txt', "2.txt", "4.txt", "5.txt", "a.txt", "b.txt", "c0.txt", "c.txt", "d.txt"]
-for file in files_to_remove:
-    if os.path.exists(file):
-        os.remove(file)
-    else:              # 如果文件不存在,则提示异常并打印提示信息
-        print(f"文件 {file} 不存在,跳过删除。")
-print("任务运行完毕,分类频道列表可查看文件夹内iptv_list.txt文件！")
-# 打印酒店源
-for ip_key, result in detected_ips.items():
-    print(f"IP Key: {ip_key}, Status: {result['status']}")
+        # decode模式下3秒内读取到30帧即有效
+        validated[filename] = validate_lines(lines, make_probe(PROBE_MODE, min_frames=30, timeout=3),
+                                             get_ip_key, detected_ips,
+                                             workers=PROBE_WORKERS, desc=f"Processing {filename}",
+                                             cache=probe_cache)
+        text = ''.join(validated[filename])
+        write_if_changed(name, text)
+        manifest.mark(name, content_hash(text))
+    manifest.save()
+    print(f"检测 {len(detected_ips)} 个服务器,跳过未变化的播放列表 "
+          f"{sum(validated[f] is playlists[f] for f in playlists)} 个")
+    probe_cache.save()
+    print(f"检测缓存命中 {probe_cache.hits} 次,已保存至 {probe_cache.path}")
+    # 打印检测结果
+    for ip_key, result in detected_ips.items():
+        print(f"IP Key: {ip_key}, Status: {result['status']}")
+    return validated
+
+# merge 之后的阶段之间传递列式频道目录(iptv_catalog.ChannelCatalog),不再反复拆分文本行
+
+@pipeline.stage('merge')
+def merge_playlists(playlists):
+    """合并所有播放列表,文件之间空行分隔;频道名保持原样(保留高清等标记),规范频道名记在目录的频道列"""
+    catalog = ChannelCatalog(channel_index=channels)
+    for content in playlists.values():
+        for line in text_lines(''.join(content) + '\n\n'):
+            catalog.add_line(line)
+    print(f"电视频道成功写入,共 {len(catalog)} 行,{len(catalog.host_names())} 个服务器")
+    return catalog
+
+@pipeline.stage('sort')
+def sort_lines(records):
+    """CCTV频道按第一个数字排列在前,其余按规范频道名的拼音排序,拼音按频道名缓存"""
+    catalog = as_catalog(records, channels)
+    collator = PinyinCollator()
+    rows = sorted(range(len(catalog)),
+                  key=lambda row: collator.fields_key(catalog.channel(row), catalog.fields(row)[1]))
+    collator.save()
+    print(f"拼音缓存命中 {collator.hits} 次,新计算 {collator.misses} 个频道名")
+    return catalog.select(rows)
+
+def get_subnet_key(url):
+    """IPv4地址的 /24 网段(与限流器相同)作为检测的唯一键,同一网段只检测一次;不是IPv4地址返回None"""
+    subnet, _ = HostLimiter.keys(url)
+    return subnet if subnet.endswith('/24') else None
+
+@pipeline.stage('hotel-check')
+def hotel_check(records):
+    """并发检测每个IP段,包含genre的行直接保留,检测结果记入目录的状态列"""
+    catalog = as_catalog(records, channels)
+    # decode模式:10秒内读取到240帧则保留;throughput模式:按清晰度档位的码率下限、首字节时间和卡顿判断
+    kept = validate_lines(range(len(catalog)), make_probe(PROBE_MODE, min_frames=240, timeout=10),
+                          get_subnet_key, detected_ips, workers=PROBE_WORKERS,
+                          keep=lambda row: not catalog.has_url(row) and 'genre' in catalog.line(row),
+                          desc="Processing", split=catalog.probe_fields)
+    kept_rows = set(kept)
+    for row in range(len(catalog)):
+        if catalog.has_url(row):
+            catalog.set_status(row, row in kept_rows)
+    return catalog.select(kept)
+
+# 所有分类的关键词构建一次,每行只匹配一遍;分类名本身也作为关键词
+classifier = Classifier([(rule.split(', ')[0], rule.split(', ')) for rule in CATEGORIES],
+                        min_bytes=CATEGORY_MIN_BYTES)
+
+@pipeline.stage('classify')
+def classify(records):
+    """每行归入第一个命中的分类,过小的分类丢弃,各分类之间空行分隔"""
+    catalog = as_catalog(records, channels)
+    categories = classifier.classify(range(len(catalog)), text=catalog.line)
+    for name in classifier.names:
+        print(f"已提取分类 {name}" if name in categories else f"未提取到关键词或分类过小,跳过分类 {name}。")
+    classified = catalog.empty_like()
+    for index, (name, rows) in enumerate(categories.items()):
+        if index:
+            classified.add_line('')
+        classified.add_line(genre_header(name))
+        for row in rows:
+            classified.set_category(classified.copy_row(catalog, row), name)
+    return classified
+
+@pipeline.stage('dedup-final')
+def dedup_classified(records):
+    """按网址去重,避免同一个频道出现在不同的类中,再按 规范频道名+规范地址 去重"""
+    catalog = as_catalog(records, channels)
+    seen_urls = UrlIndex()
+    rows = []
+    print("去重前的行数：", len(catalog))
+    for row in range(len(catalog)):
+        if catalog.has_url(row):
+            # 如果该URL尚未被记录
+            if seen_urls.add(catalog.url(row)):
+                rows.append(row)
+        # 包含genre的行(分类头),无论是否已被记录,都保留
+        elif re.search(r'\bgenre\b', catalog.line(row), re.IGNORECASE):
+            rows.append(row)
+    print("去重后的行数：", len(rows))
+    seen_lines = Deduper()
+    return catalog.select(row for row in rows if seen_lines.add(catalog.dedup_key(row)))
+
+@pipeline.stage('publish')
+def publish(records):
+    """写出组播优选.txt,并追加到转为简体的自用直播源 iptv_list.txt"""
+    lines = as_catalog(records, channels).lines()
+    write_if_changed('组播优选.txt', ''.join(lines))
+
+    # 过滤掉包含排除关键词的行,但是允许含有例外关键词的行
+    filtered_lines = [
+        line for line in lines
+        if not (any(keyword in line for keyword in excluded_keywords)
+                and not any(keyword in line for keyword in exception_keywords))
+    ]
+
+    # 获取远程直播源文件,繁体字转简体字
+    r = requests.get(IPTV_LIST_URL)
+    text = r.content.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+    # 远程列表转简体后与本地结果合并,整体规范CCTV16-4K、CCTV-4K的写法
+    text = replace_names(''.join(t2s_lines(text_lines(text))) + ''.join(filtered_lines))
+    write_if_changed('iptv_list.txt', text)
+    print("任务运行完毕,分类频道列表可查看文件夹内iptv_list.txt文件！")
+
+def replace_names(text):
+    """按 NAME_REPLACEMENTS 规范频道名,如CCTV164K、CCTV4K改为CCTV16-4K、CCTV-4K"""
+    for old, new in NAME_REPLACEMENTS:
+        text = text.replace(old, new)
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description="组播源采集、检测与分类")
+    parser.add_argument('--stages', help=f"只运行指定阶段,逗号分隔,可选:{','.join(pipeline.names)}")
+    parser.add_argument('--keep', help="保留每个阶段输出的目录,也是单独运行阶段时读取输入的目录")
+    parser.add_argument('--full', action='store_true', help="忽略哈希清单,重新搜索和检测全部省份")
+    args = parser.parse_args()
+    if args.keep:
+        pipeline.keep_dir = args.keep
+    if args.full:
+        manifest.ttl = 0
+    import_report(START_TIME)
+    try:
+        pipeline.run(args.stages.split(',') if args.stages else None)
+    except PipelineError as e:
+        print(str(e))
+        sys.exit(1)
+    pipeline.report()
+
+if __name__ == "__main__":
+    main()